@@ -16,6 +16,10 @@ import aiohttp
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The subscribe ack carries the full state, and last_cmd alone can be a 64 KiB
+# request line, so the default 64 KiB StreamReader limit is too small.
+EVENT_LINE_LIMIT = 1024 * 1024
+
 class AndroidEyesBridge:
     """Bridge between Kilo personality and Android eyes display"""
     
@@ -107,29 +111,36 @@ class AndroidEyesBridge:
             logger.error(f"Error setting eye state: {e}")
     
     async def _monitor_personality_events(self):
-        """Monitor personality daemon for eye state changes"""
+        """Follow eye state changes pushed by the personality daemon"""
         personality_socket = "/opt/kilo/personality/kilo.sock"
         
         while self.running:
             try:
-                # Connect to personality socket
-                import socket
-                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                sock.settimeout(2.0)
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_unix_connection(personality_socket, limit=EVENT_LINE_LIMIT), timeout=2.0)
                 
                 try:
-                    sock.connect(personality_socket)
+                    # Turn this connection into an "eyes" event stream
+                    writer.write(b'{"cmd": "subscribe", "topics": ["eyes"]}\n')
+                    await writer.drain()
+                    
+                    ack = json.loads(await reader.readline() or b"{}")
+                    if not ack.get("ok"):
+                        raise RuntimeError(ack.get("error", "subscribe refused"))
+                    
+                    eyes = (ack.get("state") or {}).get("eyes_state")
+                    if eyes and eyes != self.current_state:
+                        await self.set_eye_state(eyes)
                     
                     while self.running:
-                        # Read commands from personality
-                        data = sock.recv(1024).decode().strip()
-                        if not data:
+                        line = await reader.readline()
+                        if not line:
                             break
                         
-                        await self._handle_personality_command(data)
+                        await self._handle_state_event(line.decode())
                         
                 finally:
-                    sock.close()
+                    writer.close()
                     
                 # Brief pause before reconnecting
                 await asyncio.sleep(1)
@@ -138,53 +149,15 @@ class AndroidEyesBridge:
                 logger.error(f"Error monitoring personality: {e}")
                 await asyncio.sleep(2)
     
-    async def _handle_personality_command(self, command: str):
-        """Handle personality command and update eyes accordingly"""
+    async def _handle_state_event(self, line: str):
+        """Apply an eyes_state delta pushed by the personality daemon"""
         try:
-            # Parse command (could be JSON or simple string)
-            try:
-                cmd_data = json.loads(command)
-                cmd_type = cmd_data.get("command", command)
-            except:
-                cmd_type = command
-            
-            # Map personality commands to eye states
-            eye_mapping = {
-                "boot": "idle",
-                "demo": "happy",
-                "sleep": "sleep",
-                "wake": "idle",
-                "joke": "speak",
-                "scan": "focus",
-                "greeting": "happy",
-                "greet_newcomer": "speak",
-                "greet_regular": "happy",
-                "low_battery": "worried",
-                "critical_battery": "worried",
-                "near_roll": "worried",
-                "rollover": "worried",
-                "estop_engaged": "worried",
-                "estop_released": "focus",
-                "dock_start": "focus",
-                "dock_success": "happy",
-                "charging": "charging",
-                "dream": "dreaming"
-            }
-            
-            # Get eye state for command
-            eye_state = eye_mapping.get(cmd_type, self.current_state)
-            
-            # Special handling for speak state
-            if cmd_type in ["joke", "greet_newcomer"] or "speak" in cmd_type:
-                await self.set_eye_state("speak", duration_ms=3000)
-                # Return to previous state after speaking
-                await asyncio.sleep(3.5)
-                await self.set_eye_state("idle")
-            else:
-                await self.set_eye_state(eye_state)
-                
+            delta = json.loads(line).get("delta") or {}
+            eyes = delta.get("eyes_state")
+            if eyes:
+                await self.set_eye_state(eyes)
         except Exception as e:
-            logger.error(f"Error handling personality command: {e}")
+            logger.error(f"Error handling personality event: {e}")
     
     async def play_emotion_sequence(self, emotions: list):
         """Play a sequence of emotions"""
@@ -231,4 +204,3 @@ async def main():
 
 if __name__ == "__main__":
     asyncio.run(main())
-</create_file>
\ No newline at end of file
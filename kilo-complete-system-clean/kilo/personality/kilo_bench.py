@@ -0,0 +1,693 @@
+#!/usr/bin/env python3
+"""
+kilo_bench.py — load and soak harness for Kilo services (install as kilo-bench).
+- `kilo-bench personality` starts a private personalityd (temp socket, state
+  file, shm segment and a fake kilosay that just sleeps), then drives it with
+  N concurrent clients for a fixed time or request count.
+- The command mix is weighted: --cmd status=6 --cmd joke=2 --cmd '{"cmd":"demo"}=1'.
+  Plain text and JSON forms are sent verbatim, one line each.
+- Clients keep one connection and may pipeline (--pipeline K); --oneshot
+  reconnects per request like the old CLI clients did.
+- Reports throughput, client-side p50/p95/p99 per command, errors, state.json
+  write rate (from the daemon's persist counters), speech queue stats and the
+  daemon's RSS / fd count before and after, so soak runs show leaks.
+- --target SOCK skips the private daemon and benchmarks a running one.
+- `kilo-bench brain` times kilo_brain the old way (a python3 subprocess per
+  /ask) against in-process reply() calls, as kilo_chat_http now does.
+- `kilo-bench replay journal.jsonl [--speed 1|0]` re-drives a personalityd
+  command journal (kilo_journal) against a private daemon: one connection per
+  recorded client (per daemon run, as client ids restart with it), at the
+  recorded pace (--speed 2 = twice as fast) or as fast as possible
+  (--speed 0). At --speed 0 requests still go out in journal order
+  across clients, each after the previous reply, so a demo recorded before a
+  safety event isn't refused by it. subscribe lines are skipped. Reports the same
+  numbers plus schedule lag and requests whose ok/error differs from the
+  recording. `kilo-bench selftest` replays a built-in journal that spans a
+  daemon restart at --speed 0 and checks it completes.
+- `kilo-bench fuzzy [--corpus asr_misheard.tsv]` runs utterances Vosk got
+  wrong (heard<TAB>expected intent, "-" for none) through the intent matcher:
+  hits/misses/false positives exact-only vs. with the fuzzy index, per-call
+  latency, then the fuzzy lookup against a brute-force scan of every phrase
+  as synthetic phrases are added (--scale 500,2000,8000,32000).
+- `kilo-bench eval corpus.txt` runs a file of utterances (one per line; the
+  first tab column if there are more) through kilo_brain.reply_many() and
+  reports throughput, latency per intent and how the corpus spreads over the
+  intents and fallback buckets (small_talk / one_liners / sarcasm), so rule
+  changes can be checked for speed and for what falls through them.
+"""
+import os, sys, json, time, socket, shutil, signal, argparse, tempfile, threading, subprocess, random, collections
+import kilo_metrics, kilo_journal
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = ["status=6", "joke=2", '{"cmd":"status"}=1', "scan=1", "demo=0.2"]
+
+FAKE_KILOSAY = """#!/bin/sh
+sleep {sleep}
+"""
+
+def parse_mix(items):
+    """['status=6', '{"cmd":"joke"}=2'] -> [(line, weight)]. A missing weight means 1."""
+    mix = []
+    for it in items:
+        line, sep, w = it.rpartition("=")
+        try:
+            weight = float(w) if sep else 1.0
+        except ValueError:
+            line, weight = it, 1.0
+        line = (line if sep else it).strip()
+        if line.startswith("{"):
+            json.loads(line)   # fail early on a typo
+        if weight > 0:
+            mix.append((line, weight))
+    if not mix:
+        raise ValueError("empty command mix")
+    return mix
+
+def _label(line):
+    if line.startswith("{"):
+        try:
+            obj = json.loads(line)
+            return "json:" + str(obj.get("cmd") or obj.get("command"))
+        except Exception: return "json:?"
+    return line.split()[0] if line.split() else "?"
+
+def _proc_stats(pid):
+    if not pid:
+        return None
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for ln in f:
+                if ln.startswith("VmRSS:"):
+                    out["rss_kb"] = int(ln.split()[1])
+        out["fds"] = len(os.listdir(f"/proc/{pid}/fd"))
+    except Exception:
+        pass
+    return out or None
+
+class Client:
+    def __init__(self, sock_path, timeout):
+        self.sock_path, self.timeout = sock_path, timeout
+        self.s = self.f = None
+
+    def connect(self):
+        self.close()
+        self.s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.s.settimeout(self.timeout)
+        self.s.connect(self.sock_path)
+        self.f = self.s.makefile("rb")
+
+    def close(self):
+        for x in (self.f, self.s):
+            try: x and x.close()
+            except Exception: pass
+        self.s = self.f = None
+
+    def batch(self, lines):
+        """Send lines back to back, read one reply per line (in order)."""
+        if self.s is None:
+            self.connect()
+        self.s.sendall("".join(l + "\n" for l in lines).encode())
+        out = []
+        for _ in lines:
+            raw = self.f.readline()
+            if not raw:
+                raise ConnectionError("daemon closed the connection")
+            out.append(json.loads(raw))
+        return out
+
+def _worker(idx, args, mix, metrics, stop, deadline, budget, counts, lock):
+    rng = random.Random(args.seed + idx)
+    lines, weights = [m[0] for m in mix], [m[1] for m in mix]
+    cl = Client(args.sock, args.timeout)
+    while not stop.is_set() and time.monotonic() < deadline:
+        with lock:
+            if budget is not None and counts["sent"] >= budget:
+                break
+            counts["sent"] += args.pipeline
+        batch = rng.choices(lines, weights, k=args.pipeline)
+        t0 = time.perf_counter()
+        try:
+            if args.oneshot:
+                cl.connect()
+            replies = cl.batch(batch)
+            dt = time.perf_counter() - t0
+            for line, rep in zip(batch, replies):
+                ok = isinstance(rep, dict) and rep.get("ok", False)
+                metrics.command(_label(line), dt, bool(ok))
+                metrics.observe("request", dt)
+                if not ok:
+                    metrics.incr("error:" + str((rep or {}).get("error", "bad reply"))[:60])
+        except Exception as e:
+            dt = time.perf_counter() - t0
+            for line in batch:
+                metrics.command(_label(line), dt, False)
+            metrics.incr("error:" + type(e).__name__)
+            cl.close()
+            time.sleep(0.05)   # don't spin on a dead daemon
+        finally:
+            if args.oneshot:
+                cl.close()
+        if args.rate:
+            time.sleep(rng.expovariate(args.rate / args.clients) if args.rate > 0 else 0)
+    cl.close()
+
+def _ask(sock_path, obj, timeout=5.0):
+    cl = Client(sock_path, timeout)
+    try:
+        return cl.batch([json.dumps(obj)])[0]
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    finally:
+        cl.close()
+
+def start_daemon(tmp, args):
+    kilosay = os.path.join(tmp, "kilosay")
+    with open(kilosay, "w") as f:
+        f.write(FAKE_KILOSAY.format(sleep=args.say_sec))
+    os.chmod(kilosay, 0o755)
+    env = dict(os.environ,
+               KILO_SOCK=os.path.join(tmp, "kilo.sock"),
+               KILO_STATE_PATH=os.path.join(tmp, "state.json"),
+               KILO_STATE_SHM=os.path.join(tmp, "kilo_state"),
+               KILO_KILOSAY=kilosay,
+               KILO_PERSONALITY_DIR=args.content,
+               KILO_AUTOSPEAK="1" if args.speak else "0")
+    cmd = [sys.executable, os.path.join(HERE, "personalityd.py"), "--state-window", str(args.state_window)]
+    log = open(os.path.join(tmp, "personalityd.log"), "wb")
+    proc = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT, cwd=HERE)
+    log.close()
+    t_end = time.monotonic() + 10.0
+    while time.monotonic() < t_end:
+        if proc.poll() is not None:
+            raise RuntimeError(f"personalityd exited with {proc.returncode}; see {tmp}/personalityd.log")
+        if _ask(env["KILO_SOCK"], {"cmd": "status"}, 1.0).get("ok"):
+            return proc, env["KILO_SOCK"]
+        time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("personalityd did not come up within 10s")
+
+def stop_daemon(proc):
+    if proc is None or proc.poll() is not None:
+        return
+    proc.send_signal(signal.SIGTERM)
+    try: proc.wait(5.0)
+    except subprocess.TimeoutExpired: proc.kill()
+
+def run_session(args, drive):
+    """Start (or attach to) a daemon, run drive(args, metrics) -> extra report fields, report."""
+    tmp = tempfile.mkdtemp(prefix="kilo-bench-")
+    proc = None
+    try:
+        if args.target:
+            args.sock = args.target
+        else:
+            proc, args.sock = start_daemon(tmp, args)
+        pid = proc.pid if proc else None
+        before = _ask(args.sock, {"cmd": "status"})
+        _ask(args.sock, {"cmd": "metrics", "args": ["reset"]})
+        rss0 = _proc_stats(pid)
+        metrics = kilo_metrics.Metrics()
+        t0 = time.monotonic()
+        extra = drive(args, metrics)
+        elapsed = time.monotonic() - t0
+        after = _ask(args.sock, {"cmd": "status"})
+        server = _ask(args.sock, {"cmd": "metrics"})
+        rss1 = _proc_stats(pid)
+        return report(args, metrics.snapshot(), elapsed, before, after, server, rss0, rss1, extra)
+    finally:
+        stop_daemon(proc)
+        if args.keep:
+            print(f"[kilo-bench] kept {tmp}", file=sys.stderr)
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+def _join_all(threads, metrics, stop, progress):
+    t0 = time.monotonic()
+    next_progress = t0 + (progress or 0)
+    for t in threads: t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(0.1)
+            if progress and time.monotonic() >= next_progress:
+                next_progress += progress
+                n = metrics.snapshot()["latency"].get("request", {}).get("count", 0)
+                print(f"[kilo-bench] t={time.monotonic() - t0:.0f}s requests={n}", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        stop.set()
+    for t in threads: t.join()
+
+def drive_mix(args, metrics):
+    mix = parse_mix(args.cmd or DEFAULT_MIX)
+    stop, lock, counts = threading.Event(), threading.Lock(), {"sent": 0}
+    deadline = time.monotonic() + (args.duration if args.duration else 1e9)
+    threads = [threading.Thread(target=_worker, daemon=True,
+                                args=(i, args, mix, metrics, stop, deadline, args.requests, counts, lock))
+               for i in range(args.clients)]
+    _join_all(threads, metrics, stop, args.progress)
+    return {"mix": {l: w for l, w in mix}}
+
+# ---- Journal replay ----
+SKIP_REPLAY = ("subscribe", "unsubscribe")   # would turn the replay connection into an event stream
+
+class _Turns:
+    """Hands out turns in journal order across the replay clients (--speed 0)."""
+
+    def __init__(self):
+        self.cv = threading.Condition()
+        self.next = 0
+
+    def wait(self, seq, stop):
+        with self.cv:
+            while self.next != seq and not stop.is_set():
+                self.cv.wait(0.1)
+
+    def done(self):
+        with self.cv:
+            self.next += 1
+            self.cv.notify_all()
+
+def _replay_client(args, recs, metrics, stop, t0, lags, turns=None):
+    cl = Client(args.sock, args.timeout)
+    try:
+        for rec in recs:
+            if turns is not None:
+                turns.wait(rec["seq"], stop)
+            if stop.is_set():
+                break
+            try:
+                _replay_one(args, cl, rec, metrics, stop, t0, lags)
+            finally:
+                if turns is not None:
+                    turns.done()
+    finally:
+        cl.close()
+
+def _replay_one(args, cl, rec, metrics, stop, t0, lags):
+    if args.speed > 0:
+        delay = t0 + rec["rel"] / args.speed - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+        lags.append(max(0.0, time.monotonic() - (t0 + rec["rel"] / args.speed)))
+    t = time.perf_counter()
+    try:
+        rep = cl.batch([rec["req"]])[0]
+    except Exception as e:
+        metrics.command(_label(rec["req"]), time.perf_counter() - t, False)
+        metrics.incr("error:" + type(e).__name__)
+        cl.close()
+        return
+    dt = time.perf_counter() - t
+    ok = bool(isinstance(rep, dict) and rep.get("ok"))
+    metrics.command(_label(rec["req"]), dt, ok)
+    metrics.observe("request", dt)
+    if not ok:
+        metrics.incr("error:" + str((rep or {}).get("error", "bad reply"))[:60])
+    if ok != bool(rec.get("ok")):
+        metrics.incr("replay.mismatch")
+
+def drive_replay(args, metrics):
+    by_client, skipped = {}, 0
+    for rec in kilo_journal.read(args.journal):
+        if args.limit and sum(len(v) for v in by_client.values()) >= args.limit:
+            break
+        if _label(rec["req"]).split(":")[-1].lower() in SKIP_REPLAY:
+            skipped += 1
+            continue
+        by_client.setdefault((rec["boot"], rec.get("p"), rec.get("c")), []).append(rec)
+    recs = sum(len(v) for v in by_client.values())
+    span = max((v[-1]["rel"] for v in by_client.values()), default=0.0)
+    if not recs:
+        print(f"[kilo-bench] nothing to replay in {args.journal}", file=sys.stderr)
+        return {"replay": {"records": 0, "skipped": skipped}}
+    print(f"[kilo-bench] replaying {recs} requests from {len(by_client)} clients, "
+          f"journal span {span:.1f}s at {'max speed' if args.speed <= 0 else f'{args.speed:g}x'}",
+          file=sys.stderr, flush=True)
+    args.clients = len(by_client)
+    turns = None
+    if args.speed <= 0:
+        # One total order, (rel, journal position), shared by the turn counter and every
+        # client's own list, so a client never waits on a turn it has already passed.
+        order = lambda r: (r["rel"], r["i"])
+        for v in by_client.values():
+            v.sort(key=order)
+        turns = _Turns()
+        for i, r in enumerate(sorted((r for v in by_client.values() for r in v), key=order)):
+            r["seq"] = i
+    stop, lags = threading.Event(), []
+    t0 = time.monotonic() + 0.05
+    threads = [threading.Thread(target=_replay_client, daemon=True, args=(args, v, metrics, stop, t0, lags, turns))
+               for v in by_client.values()]
+    _join_all(threads, metrics, stop, args.progress)
+    lags.sort()
+    return {"replay": {"journal": args.journal, "records": recs, "skipped": skipped, "clients": len(by_client),
+                       "speed": args.speed, "journal_span_sec": round(span, 3),
+                       "mismatches": metrics.snapshot()["counters"].get("replay.mismatch", 0),
+                       "lag_ms": {"p50": round(lags[len(lags) // 2] * 1000.0, 3),
+                                  "max": round(lags[-1] * 1000.0, 3)} if lags else None}}
+
+# A Pi reboot: personalityd comes back with the same pid and a monotonic clock that
+# restarted, and kilo_ears (peer pid 512) is client 1 again in both daemon runs.
+SELFTEST_JOURNAL = [
+    {"session": 1, "pid": 301, "wall": 1000.0, "t": 50.0},
+    {"t": 50.1, "c": 1, "p": 512, "req": "status", "ok": True, "ms": 1.0},
+    {"t": 50.3, "c": 2, "p": 640, "req": "joke", "ok": True, "ms": 1.0},
+    {"t": 50.5, "c": 1, "p": 512, "req": "scan", "ok": True, "ms": 1.0},
+    {"session": 1, "pid": 301, "wall": 2000.0, "t": 8.0},
+    {"t": 8.1, "c": 1, "p": 512, "req": "status", "ok": True, "ms": 1.0},
+    {"t": 8.2, "c": 1, "p": 512, "req": "subscribe eyes", "ok": True, "ms": 1.0},
+    {"t": 8.4, "c": 1, "p": 512, "req": '{"cmd":"status"}', "ok": True, "ms": 1.0},
+]
+
+def selftest(args):
+    """Replay a journal spanning a daemon restart at --speed 0: it must finish, with the
+    clients of the two runs kept apart. Returns the number of failures."""
+    tmp = tempfile.mkdtemp(prefix="kilo-bench-selftest-")
+    try:
+        path = os.path.join(tmp, "journal.jsonl")
+        with open(path, "w") as f:
+            f.writelines(json.dumps(r) + "\n" for r in SELFTEST_JOURNAL)
+        args.journal, args.speed, args.limit = path, 0.0, 0
+        args.pipeline, args.oneshot, args.clients, args.json = 1, False, 0, False
+        out = {}
+        th = threading.Thread(target=lambda: out.update(run_session(args, drive_replay)), daemon=True)
+        th.start()
+        th.join(args.wait)
+        rp = out.get("replay") or {}
+        checks = [("finished", not th.is_alive()),
+                  ("5 requests, 1 subscribe skipped", rp.get("records") == 5 and rp.get("skipped") == 1),
+                  ("3 clients (one per daemon run)", rp.get("clients") == 3),
+                  ("no ok/error mismatches", rp.get("mismatches") == 0)]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    for name, ok in checks:
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    return sum(not ok for _, ok in checks)
+
+def report(args, snap, elapsed, before, after, server, rss0, rss1, extra=None):
+    cmds = snap["commands"]
+    total = sum(c["count"] for c in cmds.values())
+    errors = sum(c["errors"] for c in cmds.values())
+    overall = snap["latency"].get("request") or {}
+    pb, pa = (before or {}).get("persist") or {}, (after or {}).get("persist") or {}
+    writes = (pa.get("writes") or 0) - (pb.get("writes") or 0)
+    wbytes = (pa.get("bytes") or 0) - (pb.get("bytes") or 0)
+    out = {
+        "clients": args.clients, "pipeline": args.pipeline, "oneshot": args.oneshot,
+        "elapsed_sec": round(elapsed, 2),
+        "requests": total, "errors": errors,
+        "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+        "latency_ms": {k[:-3]: overall.get(k) for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")},
+        "commands": cmds,
+        "error_kinds": {k[6:]: v for k, v in snap["counters"].items() if k.startswith("error:")},
+        "state_writes": {"count": writes, "per_sec": round(writes / elapsed, 2) if elapsed else None,
+                         "bytes": wbytes, "fsyncs": (pa.get("fsyncs") or 0) - (pb.get("fsyncs") or 0),
+                         "coalesced": (pa.get("coalesced") or 0) - (pb.get("coalesced") or 0)},
+        "speech": (after or {}).get("speech"),
+        "daemon": {"before": rss0, "after": rss1},
+        "server": (server or {}).get("metrics"),
+        **(extra or {}),
+    }
+    if args.json:
+        print(json.dumps(out, indent=2))
+        return out
+    print(f"clients={args.clients} pipeline={args.pipeline} oneshot={args.oneshot} elapsed={out['elapsed_sec']}s")
+    lat = out["latency_ms"]
+    print(f"requests={total} errors={errors} throughput={out['throughput_rps']} req/s "
+          f"p50={lat['p50']}ms p99={lat['p99']}ms max={lat['max']}ms")
+    print(f"{'command':<20}{'count':>8}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, c in cmds.items():
+        print(f"{name:<20}{c['count']:>8}{c['errors']:>6}{c['p50_ms']:>10}{c['p95_ms']:>10}{c['p99_ms']:>10}{c['max_ms']:>10}")
+    for kind, n in out["error_kinds"].items():
+        print(f"  error {kind}: {n}")
+    sw = out["state_writes"]
+    print(f"state.json: {sw['count']} writes ({sw['per_sec']}/s, {sw['bytes']} bytes, "
+          f"{sw['fsyncs']} fsyncs, {sw['coalesced']} coalesced)")
+    sp = out["speech"] or {}
+    if sp:
+        print(f"speech: submitted={sp.get('submitted')} spoken={sp.get('spoken')} deduped={sp.get('deduped')} "
+              f"dropped={sp.get('dropped')} preempted={sp.get('preempted')} depth={sp.get('depth')} ttfa={sp.get('ttfa_ms')}")
+    if rss0 or rss1:
+        print(f"daemon: before={rss0} after={rss1}")
+    rp = out.get("replay")
+    if rp:
+        print(f"replay: {rp.get('records')} requests ({rp.get('skipped')} skipped) from {rp.get('clients')} clients, "
+              f"span {rp.get('journal_span_sec')}s, {rp.get('mismatches')} ok/error mismatches vs. the journal, "
+              f"lag {rp.get('lag_ms')}")
+    return out
+
+# ---- Brain: old subprocess-per-/ask path vs. the in-process module ----
+BRAIN_UTTERANCES = ["hello there", "what's your name", "tell me a joke", "is that a vespa",
+                    "my buddy drives a dodge", "what can you do", "how's the weather"]
+
+def bench_brain(args):
+    os.environ["KILO_PERSONALITY_DIR"] = args.content   # before kilo_brain computes its paths
+    texts = args.text or BRAIN_UTTERANCES
+    script = os.path.join(HERE, "kilo_brain.py")
+    sub, inproc = kilo_metrics.Histogram(), kilo_metrics.Histogram()
+    for i in range(args.subprocess):
+        t = time.perf_counter()
+        subprocess.check_output([sys.executable, script, texts[i % len(texts)]], stderr=subprocess.DEVNULL)
+        sub.observe(time.perf_counter() - t)
+    t = time.perf_counter()
+    import kilo_brain
+    kilo_brain.warm()
+    kilo_brain.reply(texts[0])
+    cold = time.perf_counter() - t
+    for i in range(args.requests):
+        t = time.perf_counter()
+        kilo_brain.reply(texts[i % len(texts)])
+        inproc.observe(time.perf_counter() - t)
+    out = {"subprocess": sub.summary(), "in_process": inproc.summary(),
+           "in_process_first_call_ms": round(cold * 1000.0, 3), "cache": kilo_brain.cache_stats()}
+    if sub.count and inproc.count:
+        out["speedup_p50"] = round(sub.percentile(50) / max(inproc.percentile(50), 1e-9), 1)
+    if args.json:
+        print(json.dumps(out, indent=2))
+        return out
+    row = lambda name, s: print(f"{name:<22}{s['count']:>7}{s['p50_ms']!s:>10}{s['p95_ms']!s:>10}{s['max_ms']!s:>10}")
+    print(f"{'brain path':<22}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    row("subprocess per /ask", out["subprocess"])
+    row("in-process reply()", out["in_process"])
+    print(f"in-process import + load + first reply: {out['in_process_first_call_ms']} ms (paid once at startup)")
+    if "speedup_p50" in out:
+        print(f"p50 speedup: {out['speedup_p50']}x")
+    c = out["cache"]
+    print(f"reply cache: hit_rate={c['hit_rate']} hits={c['hits']} misses={c['misses']} "
+          f"bypass={c['bypass']} evictions={c['evictions']} expired={c['expired']} entries={c['entries']}")
+    return out
+
+def load_corpus(path):
+    """[(utterance, expected intent name or None)] from a tab-separated file; # comments."""
+    out = []
+    with open(path, encoding="utf-8") as f:
+        for ln in f:
+            if not ln.strip() or ln.startswith("#"):
+                continue
+            heard, _, want = ln.rstrip("\n").partition("\t")
+            want = want.strip()
+            out.append((heard.strip(), None if want in ("", "-") else want))
+    return out
+
+def _fake_phrases(n, rng):
+    syl = [a + b for a in "bdfgklmnprstvz" for b in ("a", "e", "i", "o", "u", "ar", "en", "ol")]
+    word = lambda: "".join(rng.choice(syl) for _ in range(rng.randint(2, 4)))
+    return [(" ".join(word() for _ in range(rng.randint(1, 3))), {"name": f"fake{i}"}, 2) for i in range(n)]
+
+def _brute_fuzzy(keys, text):
+    """The same question as match_fuzzy, answered by scanning every key: the baseline."""
+    import kilo_intents as ki
+    words = ki.normalize(text).split()
+    best = None
+    for n in range(1, min(len(words), 6) + 1):
+        for i in range(len(words) - n + 1):
+            key = ki.sound_key(" ".join(words[i:i + n]))
+            if len(key) < 4:
+                continue
+            for cand in keys:
+                k = ki.max_edits(cand)
+                d = ki.edit_distance(key, cand, k)
+                if d <= k and (best is None or d < best):
+                    best = d
+    return best
+
+def bench_fuzzy(args):
+    os.environ["KILO_PERSONALITY_DIR"] = args.content
+    import kilo_brain, kilo_intents
+    kilo_brain.warm()
+    corpus = load_corpus(args.corpus)
+    m = kilo_brain._MATCHER
+    res = {"exact": collections.Counter(), "fuzzy": collections.Counter()}
+    lat = {"exact": kilo_metrics.Histogram(), "fuzzy": kilo_metrics.Histogram()}
+    wrong = []
+    for rep in range(max(1, args.repeat)):
+        for heard, want in corpus:
+            for mode in ("exact", "fuzzy"):
+                t = time.perf_counter()
+                hit = m.best(heard, fuzzy=(mode == "fuzzy"))
+                lat[mode].observe(time.perf_counter() - t)
+                if rep:
+                    continue
+                got = hit["name"] if hit else None
+                if want is None:
+                    verdict = "ok" if got is None else "false_positive"
+                else:
+                    verdict = "hit" if got == want else "miss" if got is None else "wrong"
+                res[mode][verdict] += 1
+                if mode == "fuzzy" and verdict not in ("hit", "ok"):
+                    wrong.append((heard, want, got))
+    out = {"corpus": len(corpus), "phrases": m.stats()["phrases"],
+           "exact": dict(res["exact"]), "fuzzy": dict(res["fuzzy"]),
+           "latency": {k: v.summary() for k, v in lat.items()}, "wrong": wrong, "scale": []}
+    rng = random.Random(args.seed)
+    base = kilo_intents.entries_from(kilo_brain._watch().get("persona_full"), [], kilo_brain.RULES)
+    texts = [h for h, _ in corpus]
+    for n in args.scale:
+        big = kilo_intents.IntentMatcher(base + _fake_phrases(n, rng))
+        t = time.perf_counter()
+        for h in texts:
+            big.match_fuzzy(h)
+        idx = (time.perf_counter() - t) / len(texts)
+        t = time.perf_counter()
+        for h in texts[:args.brute]:
+            _brute_fuzzy(big._keys, h)
+        brute = (time.perf_counter() - t) / max(1, min(args.brute, len(texts)))
+        out["scale"].append({"phrases": len(big), "build_ms": big.build_ms,
+                             "index_ms": round(idx * 1000.0, 3), "brute_ms": round(brute * 1000.0, 3)})
+    if args.json:
+        print(json.dumps(out, indent=2))
+        return out
+    print(f"corpus: {out['corpus']} utterances, {out['phrases']} phrases")
+    print(f"{'matcher':<10}{'hit':>6}{'miss':>6}{'wrong':>7}{'ok':>6}{'false+':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for mode in ("exact", "fuzzy"):
+        r, l = res[mode], out["latency"][mode]
+        print(f"{mode:<10}{r['hit']:>6}{r['miss']:>6}{r['wrong']:>7}{r['ok']:>6}{r['false_positive']:>8}"
+              f"{l['p50_ms']!s:>9}{l['p99_ms']!s:>9}")
+    for heard, want, got in wrong:
+        print(f"  {heard!r}: want {want or '-'}, got {got or '-'}")
+    print(f"{'phrases':>9}{'build ms':>10}{'index ms':>10}{'brute ms':>10}")
+    for row in out["scale"]:
+        print(f"{row['phrases']:>9}{row['build_ms']:>10}{row['index_ms']:>10}{row['brute_ms']:>10}")
+    return out
+
+def bench_eval(args):
+    os.environ["KILO_PERSONALITY_DIR"] = args.content
+    import kilo_brain
+    kilo_brain.warm()
+    if args.no_cache:
+        kilo_brain._CACHE.size = 0
+    texts = [h for h, _ in load_corpus(args.corpus)]
+    if not texts:
+        print("kilo-bench: empty corpus", file=sys.stderr)
+        return None
+    per = collections.defaultdict(kilo_metrics.Histogram)
+    counts, cached = collections.Counter(), 0
+    t0 = time.perf_counter()
+    for rep in range(max(1, args.repeat)):
+        for r in kilo_brain.reply_many(texts, detail=True):
+            per[r["intent"]].observe(r["ms"] / 1000.0)
+            cached += r["cached"]
+            if rep == 0:
+                counts[r["intent"]] += 1
+    elapsed = time.perf_counter() - t0
+    n = len(texts) * max(1, args.repeat)
+    fallback = sum(c for k, c in counts.items() if k.startswith("fallback:"))
+    out = {"utterances": len(texts), "replies": n, "elapsed_s": round(elapsed, 3),
+           "replies_per_s": round(n / elapsed, 1) if elapsed else None,
+           "cached_share": round(cached / n, 3),
+           "fallback_share": round(fallback / len(texts), 3),
+           "intents": {k: dict(per[k].summary(), utterances=c) for k, c in counts.most_common()},
+           "cache": kilo_brain.cache_stats()}
+    if args.json:
+        print(json.dumps(out, indent=2))
+        return out
+    print(f"{out['utterances']} utterances x {max(1, args.repeat)}: {out['replies_per_s']} replies/s, "
+          f"{out['cached_share']:.0%} from cache, {out['fallback_share']:.0%} fell through to a fallback")
+    print(f"{'intent':<24}{'utts':>6}{'share':>7}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}  histogram")
+    top = max(counts.values())
+    for k, c in counts.most_common():
+        s = out["intents"][k]
+        bar = "#" * max(1, round(30 * c / top))
+        print(f"{k:<24}{c:>6}{c / len(texts):>7.0%}{s['p50_ms']!s:>9}{s['p95_ms']!s:>9}{s['max_ms']!s:>9}  {bar}")
+    return out
+
+def _daemon_args(p):
+    p.add_argument("--timeout", type=float, default=5.0, help="per-request socket timeout")
+    p.add_argument("--state-window", type=float, default=2.0, help="passed to personalityd")
+    p.add_argument("--say-sec", type=float, default=0.2, help="how long the fake kilosay 'speaks'")
+    p.add_argument("--no-speak", dest="speak", action="store_false", help="run the daemon with KILO_AUTOSPEAK=0")
+    p.add_argument("--content", default=HERE, help="dir with persona/quips files (default: next to this script)")
+    p.add_argument("--target", help="benchmark an already running daemon at this socket")
+    p.add_argument("--progress", type=int, default=0, help="print progress every N seconds")
+    p.add_argument("--keep", action="store_true", help="keep the temp dir (daemon log, state.json, journal)")
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="kilo-bench", description="Load/soak benchmarks for Kilo services")
+    sub = ap.add_subparsers(dest="what", required=True)
+    r = sub.add_parser("replay", help="re-drive a personalityd command journal")
+    r.add_argument("journal", help="journal.jsonl (rotated .1, .2, ... files are read too)")
+    r.add_argument("--speed", type=float, default=1.0, help="time scale; 1 = as recorded, 0 = as fast as possible")
+    r.add_argument("--limit", type=int, default=0, help="replay at most this many requests")
+    _daemon_args(r)
+    t = sub.add_parser("selftest", help="replay a two-session journal at --speed 0 and check it completes")
+    t.add_argument("--wait", type=float, default=30.0, help="seconds before the replay counts as hung")
+    _daemon_args(t)
+    p = sub.add_parser("personality", help="drive personalityd over its unix socket")
+    p.add_argument("-c", "--clients", type=int, default=8, help="concurrent clients (default 8)")
+    p.add_argument("-d", "--duration", type=float, default=10.0, help="seconds to run (0 = until --requests)")
+    p.add_argument("-n", "--requests", type=int, default=None, help="stop after this many requests in total")
+    p.add_argument("--cmd", action="append", metavar="LINE=WEIGHT",
+                   help="weighted command line, repeatable (default: %s)" % " ".join(DEFAULT_MIX))
+    p.add_argument("--pipeline", type=int, default=1, help="requests in flight per connection")
+    p.add_argument("--oneshot", action="store_true", help="new connection per request")
+    p.add_argument("--rate", type=float, default=0.0, help="target total req/s (Poisson); 0 = flat out")
+    p.add_argument("--seed", type=int, default=1)
+    _daemon_args(p)
+    b = sub.add_parser("brain", help="compare kilo_brain as a subprocess per call vs. in-process")
+    b.add_argument("-n", "--requests", type=int, default=2000, help="in-process calls")
+    b.add_argument("--subprocess", type=int, default=20, help="subprocess calls (the old /ask path)")
+    b.add_argument("--text", action="append", help="utterance, repeatable")
+    b.add_argument("--content", default=HERE, help="dir with persona.json / quips.yaml")
+    b.add_argument("--json", action="store_true", help="print the report as JSON")
+    f = sub.add_parser("fuzzy", help="ASR-slip corpus through the intent matcher, exact vs. fuzzy")
+    f.add_argument("--corpus", default=os.path.join(HERE, "asr_misheard.tsv"), help="heard<TAB>intent lines")
+    f.add_argument("--repeat", type=int, default=20, help="passes over the corpus for latency")
+    f.add_argument("--scale", type=lambda v: [int(x) for x in v.split(",") if x], default=[500, 2000, 8000, 32000],
+                   help="synthetic phrase counts for the scaling table")
+    f.add_argument("--brute", type=int, default=10, help="utterances timed with the brute-force scan")
+    f.add_argument("--seed", type=int, default=1)
+    f.add_argument("--content", default=HERE, help="dir with persona/quips files")
+    f.add_argument("--json", action="store_true", help="print the report as JSON")
+    e = sub.add_parser("eval", help="run a corpus of utterances through kilo_brain.reply_many()")
+    e.add_argument("corpus", help="one utterance per line (# comments; first tab column used)")
+    e.add_argument("--repeat", type=int, default=10, help="passes over the corpus")
+    e.add_argument("--no-cache", action="store_true", help="disable the reply cache (time the rules alone)")
+    e.add_argument("--content", default=HERE, help="dir with persona/quips files")
+    e.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args(argv)
+    if args.what == "eval":
+        return 0 if bench_eval(args) else 1
+    if args.what == "fuzzy":
+        bench_fuzzy(args)
+        return 0
+    if args.what == "brain":
+        bench_brain(args)
+        return 0
+    if args.what == "selftest":
+        return 1 if selftest(args) else 0
+    if args.what == "replay":
+        args.pipeline, args.oneshot = 1, False
+        args.clients = 0
+        out = run_session(args, drive_replay)
+        return 1 if out["requests"] == 0 else 0
+    if args.requests is None and not args.duration:
+        ap.error("need --duration or --requests")
+    if not args.duration:
+        args.duration = None
+    args.clients, args.pipeline = max(1, args.clients), max(1, args.pipeline)
+    out = run_session(args, drive_mix)
+    return 1 if out["requests"] == 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
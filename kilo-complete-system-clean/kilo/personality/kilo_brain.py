@@ -1,88 +1,312 @@
 #!/usr/bin/env python3
 """
 kilo_brain.py — tiny persona adapter:
-- Reads persona.json / quips.yaml when available
+- Reads persona.json / quips.yaml when available; both are held in memory and
+  reloaded only when they change on disk (see kilo_watch)
 - Returns a short, Kilo-toned reply to a user utterance
 - No external calls; uses simple rules & quips
+- Long-lived services import it and call reply() (warm() up front loads the
+  files before the first request); `kilo_brain.py <text>` stays for debugging
+- Intents: the UI's personality_triggers.json, persona_full.yaml command_set
+  and trigger_words, and the RULES below are compiled into one
+  kilo_intents.IntentMatcher, rebuilt only when one of those files changes
+- Replies to deterministic intents are memoized (LRU + TTL) on normalized
+  text plus the content generation, which every watched file change bumps.
+  Intents that should vary ("vary": True, or anything picked from quips)
+  always bypass the cache. cache_stats() reports hits/evictions.
+- reply_many(texts, detail=True) also says which intent (or fallback bucket)
+  answered each line and how long it took; `kilo-bench eval` builds on it
+- When nothing matches verbatim, the matcher's fuzzy index gets a try, so
+  Vosk slips like "vesper" still land on the vespa rule (env KILO_BRAIN_FUZZY=0
+  turns that off)
+  Size/TTL: env KILO_BRAIN_CACHE (256 entries, 0 = off), KILO_BRAIN_CACHE_TTL (300 s)
+- answer(text, on_sentence) is the streaming path: matched intents still get
+  the rule reply; anything else goes to the reasoning backend picked by env
+  KILO_REASONER (see kilo_reason), whose sentences reach on_sentence as they
+  complete, seasoned once per answer. A new answer() or cancel() stops the
+  one in flight. With no backend it behaves like reply().
 """
-import os, json, re, random
+import os, re, time, threading, collections
 from typing import Dict, Any
+import kilo_quips, kilo_watch, kilo_intents, kilo_reason
 
-BASE = "/opt/kilo/personality"
+BASE = os.environ.get("KILO_PERSONALITY_DIR", "/opt/kilo/personality")
 PERSONA_JSON = os.path.join(BASE, "persona.json")
+PERSONA_FULL = os.path.join(BASE, "persona_full.yaml")
 QUIPS_YAML   = os.path.join(BASE, "quips.yaml")
+TRIGGERS_JSON = os.environ.get("KILO_TRIGGERS", kilo_watch.TRIGGERS_JSON)
+
+# Built-in rules, in priority order (after UI triggers and persona commands).
+# "quip" names a quips.yaml category; "reply" is used when it has nothing.
+RULES = [
+    (["hello", "hi", "hey"], {"name": "greeting", "quip": "greetings", "vary": True,
+                              "reply": "What’s up. Try not to bore me."}),
+    (["name"], {"name": "name", "reply": "Kilo Truck. Chrome personality, steel backbone."}),
+    (["vespa", "vespas", "scooter", "scooters"], {"name": "vespa", "reply": "Vespas? Now that’s taste. Classy."}),
+    (["dodge", "dodges"], {"name": "dodge", "reply": "A Dodge? Figures."}),
+    (["barney"], {"name": "barney", "reply": "Purple menace. Spare me."}),
+    (["joke", "jokes", "laugh"], {"name": "joke", "quip": "jokes", "vary": True,
+                                  "reply": "Why don’t Dodges tell jokes? They can’t handle the punchline."}),
+    (["help", "what can you do", "commands"], {"name": "help",
+                                               "reply": "Ask me for a demo, a scan, or directions. I do charm, too."}),
+]
+# persona command_set entries whose reply can come from a quips category instead
+COMMAND_QUIPS = {"joke": "jokes", "greeting": "greeting", "scan": "scan", "sleep": "sleep", "wake": "boot"}
+
+FUZZY = os.environ.get("KILO_BRAIN_FUZZY", "1") != "0"
+CACHE_SIZE = int(os.environ.get("KILO_BRAIN_CACHE", "256"))
+CACHE_TTL = float(os.environ.get("KILO_BRAIN_CACHE_TTL", "300"))
+
+class ReplyCache:
+    """LRU with a per-entry TTL. Entries carry the content generation in their key,
+    so a reload makes old replies unreachable; they age out or get evicted."""
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size, self.ttl = size, ttl
+        self._d = collections.OrderedDict()   # key -> (expires, value)
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "bypass": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key):
+        with self._lock:
+            ent = self._d.get(key)
+            if ent is not None:
+                if ent[0] > time.monotonic():
+                    self._d.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return ent[1]
+                del self._d[key]
+                self.counters["expired"] += 1
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._d[key] = (time.monotonic() + self.ttl, value)
+            self._d.move_to_end(key)
+            self.counters["stores"] += 1
+            while len(self._d) > self.size:
+                self._d.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def bypass(self):
+        with self._lock:
+            self.counters["bypass"] += 1
+
+    def stats(self):
+        with self._lock:
+            c = self.counters
+            looked = c["hits"] + c["misses"]
+            return dict(c, entries=len(self._d), size=self.size, ttl_sec=self.ttl,
+                        hit_rate=round(c["hits"] / looked, 3) if looked else None)
+
+_WATCH = None
+_MATCHER = kilo_intents.IntentMatcher()
+_MATCHER_LOCK = threading.Lock()
+_CACHE = ReplyCache()
+_GENERATION = 0   # bumped on every content change; part of every cache key
+
+def _changed(name=None, value=None):
+    """kilo_watch hook: new content means new replies; recompile intents if their sources moved."""
+    global _GENERATION
+    if name in (None, "persona_full", "triggers"):
+        _rebuild()
+    _GENERATION += 1
+
+def _rebuild():
+    """Recompile intents from whatever sources are loaded right now."""
+    global _MATCHER
+    if _WATCH is None:
+        return
+    def get(n):
+        try: return _WATCH.get(n)
+        except KeyError: return None   # not registered yet during startup
+    with _MATCHER_LOCK:
+        _MATCHER = kilo_intents.build(get("persona_full"), get("triggers"), RULES)
+
+def _watch() -> kilo_watch.ConfigWatcher:
+    global _WATCH
+    if _WATCH is None:
+        _WATCH = kilo_watch.ConfigWatcher()
+        _WATCH.add("persona", PERSONA_JSON, kilo_watch.load_persona, {}, _changed)
+        _WATCH.add("quips", QUIPS_YAML, kilo_watch.load_quips, kilo_quips.QuipEngine(), _changed)
+        _WATCH.add("persona_full", PERSONA_FULL, kilo_watch.load_persona_full, None, _changed)
+        _WATCH.add("triggers", TRIGGERS_JSON, kilo_watch.load_triggers, [], _changed)
+        _changed()
+        _WATCH.start()
+    return _WATCH
+
+def intent(user_text: str):
+    """Best matching intent dict for the utterance, or None."""
+    _watch()
+    return _MATCHER.best(user_text, FUZZY)
+
+def matcher_stats():
+    _watch()
+    return _MATCHER.stats()
+
+def cache_stats():
+    return dict(_CACHE.stats(), generation=_GENERATION)
 
 def _load_persona() -> Dict[str, Any]:
-    try:
-        with open(PERSONA_JSON, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    return _watch().get("persona")
 
-def _load_quips() -> Dict[str, Any]:
-    try:
-        import yaml  # PyYAML assumed present earlier
-        with open(QUIPS_YAML, "r", encoding="utf-8") as f:
-            q = yaml.safe_load(f) or {}
-            return q if isinstance(q, dict) else {}
-    except Exception:
-        return {}
-
-def _pick(lst, default=""):
-    if isinstance(lst, (list, tuple)) and lst:
-        return random.choice(lst)
-    return default
+def _quips() -> kilo_quips.QuipEngine:
+    return _watch().get("quips")
 
-def _snarkify(line: str) -> str:
-    """Apply Kilo seasoning (Red Forman / Tim Allen / Fred Sanford, Dodge/Barney/Vespa rules)."""
+def warm():
+    """Load persona/quips now so the first reply doesn't pay for it."""
+    _watch()
+
+# keyword -> add-on Kilo can't help tacking on
+TAGS = [("vespa", "Classy."), ("dodge", "Figures."), ("barney", "Spare me.")]
+
+def _season(line: str, done=None) -> str:
+    """Append keyword add-ons the line doesn't carry yet. `done` (a set) remembers
+    tags already used, so a streamed answer gets each one at most once."""
     low = line.lower()
     out = line.strip()
+    for word, tag in TAGS:
+        t = tag.lower().rstrip(".")
+        if word in low and t not in low and (done is None or tag not in done):
+            out += " " + tag
+            low += " " + t
+        if done is not None and (word in low or t in low):
+            done.add(tag)
+    return out
 
-    # Add light add-ons based on keywords
-    if "vespa" in low:
-        out += " Classy."
-    if "dodge" in low:
-        out += " Figures."
-    if "barney" in low:
-        out += " Spare me."
+def _snarkify(line: str) -> str:
+    """Apply Kilo seasoning (Red Forman / Tim Allen / Fred Sanford, Dodge/Barney/Vespa rules)."""
+    # Add light add-ons based on keywords (once: some replies already carry them)
+    out = _season(line)
     # Shorten overly long responses
     if len(out) > 220:
         out = (out[:220] + "…").rsplit(" ",1)[0]
     return out
 
 def reply(user_text: str) -> str:
-    persona = _load_persona()
-    quips = _load_quips()
+    _watch()
+    return _lookup(user_text)[0]
+
+def reply_many(texts, detail: bool = False):
+    """Replies for a batch of utterances, in order. Files are checked once for the
+    whole batch. With detail=True each entry is {"text", "reply", "intent", "cached",
+    "ms"}; "intent" is the matched intent name, "fallback:<quips bucket>" or
+    "fallback:plain" when nothing matched, or "empty"."""
+    _watch()
+    out = []
+    for text in texts:
+        if not detail:
+            out.append(_lookup(text)[0])
+            continue
+        t = time.perf_counter()
+        line, label, cached = _lookup(text)
+        out.append({"text": text, "reply": line, "intent": label, "cached": cached,
+                    "ms": (time.perf_counter() - t) * 1000.0})
+    return out
+
+def _lookup(user_text: str):
+    """(line, intent label, cached)."""
+    # Edge punctuation never changes the reply (phrases match on word boundaries).
+    key = (kilo_intents.normalize(user_text).strip(" .,!?;:"), _GENERATION)
+    hit = _CACHE.get(key)
+    if hit is not None:
+        return hit[0], hit[1], True
+    line, vary, label = _reply(user_text)
+    if vary:
+        _CACHE.bypass()
+    else:
+        _CACHE.put(key, (line, label))
+    return line, label, False
+
+def _reply(user_text: str):
+    """(line, vary, label): vary means the same text may get a different line next
+    time; label names the intent or fallback bucket that produced the line."""
+    quips = _quips()
 
     text = (user_text or "").strip()
-    low = text.lower()
 
-    # Fast rule intents
     if not text:
-        return "Say that again, but with confidence."
-    if any(w in low for w in ["hello", "hi", "hey"]):
-        return _snarkify(_pick(quips.get("greetings"), "What’s up. Try not to bore me."))
-    if "name" in low:
-        return _snarkify("Kilo Truck. Chrome personality, steel backbone.")
-    if any(w in low for w in ["vespa", "scooter"]):
-        return _snarkify("Vespas? Now that’s taste. Classy.")
-    if "dodge" in low:
-        return _snarkify("A Dodge? Figures.")
-    if "barney" in low:
-        return _snarkify("Purple menace. Spare me.")
-    if any(w in low for w in ["joke", "laugh"]):
-        return _snarkify(_pick(quips.get("jokes"), "Why don’t Dodges tell jokes? They can’t handle the punchline."))
-    if any(w in low for w in ["help", "what can you do", "commands"]):
-        return _snarkify("Ask me for a demo, a scan, or directions. I do charm, too.")
+        return "Say that again, but with confidence.", False, "empty"
+
+    # UI triggers, persona commands, rules, trigger words: one pass
+    hit = _MATCHER.best(text, FUZZY)
+    if hit:
+        cat = hit.get("quip") or (COMMAND_QUIPS.get(hit["name"]) if hit["source"] == "command" else None)
+        line = quips.pick(cat, default=hit.get("reply")) if cat else hit.get("reply")
+        if line:
+            return _snarkify(line), bool(hit.get("vary") or cat), hit["name"]
 
     # If quips has small talk or fallback buckets, use them
     for key in ("small_talk","one_liners","sarcasm"):
-        if key in quips:
-            return _snarkify(_pick(quips[key], "Got it. Put me to work."))
+        if quips.has(key):
+            return _snarkify(quips.pick(key, default="Got it. Put me to work.")), True, "fallback:" + key
 
     # Plain fallback
-    return _snarkify("Copy that. What’s next?")
-    
+    return _snarkify("Copy that. What’s next?"), False, "fallback:plain"
+
+_BACKEND = None
+_BACKEND_LOADED = False
+_ACTIVE = None            # kilo_reason.Stream in flight
+_ACTIVE_LOCK = threading.Lock()
+
+def backend():
+    """The configured reasoning backend (env KILO_REASONER), loaded once; None = rules only."""
+    global _BACKEND, _BACKEND_LOADED
+    if not _BACKEND_LOADED:
+        try:
+            _BACKEND = kilo_reason.load()
+        except Exception as e:
+            print(f"[kilo-brain] reasoner unavailable: {e}", flush=True)
+        _BACKEND_LOADED = True
+    return _BACKEND
+
+def cancel() -> bool:
+    """Stop the streamed answer in flight, if any."""
+    with _ACTIVE_LOCK:
+        st = _ACTIVE
+    if st is None:
+        return False
+    st.cancel()
+    return True
+
+def answer(user_text: str, on_sentence=None, timeout=None, reasoner=None) -> Dict[str, Any]:
+    """Reply to an utterance, streaming from the reasoning backend when no intent matches.
+    on_sentence(line) gets each sentence as soon as it is complete; the result holds the
+    full text, "source" (rules|reasoner|fallback) and the stream timings."""
+    global _ACTIVE
+    _watch()
+    be = reasoner or backend()
+    text = (user_text or "").strip()
+    if be is None or not text or _MATCHER.best(text, FUZZY):
+        cancel()   # a new request supersedes whatever was still streaming
+        line = reply(text)
+        if on_sentence:
+            on_sentence(line)
+        return {"text": line, "source": "rules"}
+    tagged = set()
+    st = kilo_reason.Stream(be, text, on_sentence=on_sentence, post=lambda s: _season(s, tagged),
+                            timeout=timeout or kilo_reason.TIMEOUT)
+    with _ACTIVE_LOCK:
+        prev, _ACTIVE = _ACTIVE, st
+    if prev is not None:
+        prev.cancel()
+    try:
+        res = st.run()
+    finally:
+        with _ACTIVE_LOCK:
+            if _ACTIVE is st:
+                _ACTIVE = None
+    res["source"] = "reasoner"
+    if not res["text"] and res["stopped"] in ("timeout", "error"):
+        line, _, _ = _reply(text)   # nothing usable came back; say something in character
+        if on_sentence:
+            on_sentence(line)
+        res.update(text=line, source="fallback")
+    return res
+
 if __name__ == "__main__":
     import sys
     print(reply(" ".join(sys.argv[1:])))
@@ -6,30 +6,71 @@ Kilo HTTP Bridge
 - Endpoints:
     GET /health        -> {"ok":true}
     GET /do?cmd=<cmd>  -> forwards: status|demo|sleep|wake|joke|scan|greeting
+- Keeps one daemon connection open and reuses it across requests. A request
+  is only resent on a fresh connection when the pooled one was found dead
+  before the daemon could have read it (write failed, or EOF with nothing
+  read); a timeout waiting for the reply is never retried, so say/run/demo
+  can't run twice. subscribe would turn the pooled connection into an event
+  stream and is refused (use the socket directly).
 - For local use on 127.0.0.1 only (default).
 """
-import http.server, socketserver, urllib.parse, json, socket, os
+import http.server, socketserver, urllib.parse, json, socket, os, threading
 
 SOCK = "/opt/kilo/personality/kilo.sock"
 HOST = "127.0.0.1"
 PORT = 7861
 
-def send_cmd(cmd: str):
-    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    s.settimeout(2.0)
-    try:
-        s.connect(SOCK)
-        s.sendall((cmd.strip()+"\n").encode())
-        data = s.recv(8192)
-        try:
-            return True, json.loads(data.decode())
-        except Exception:
-            return True, {"ok": True, "msg": data.decode(errors="ignore")}
-    except Exception as e:
-        return False, {"ok": False, "error": str(e)}
-    finally:
-        try: s.close()
+STREAMING = ("subscribe", "unsubscribe")
+_conn = None                 # (socket, reader) kept open between requests
+_conn_lock = threading.Lock()
+
+def _drop_conn():
+    global _conn
+    if _conn is not None:
+        try: _conn[0].close()
         except Exception: pass
+    _conn = None
+
+def _verb(cmd: str) -> str:
+    cmd = cmd.strip()
+    if cmd.startswith("{"):
+        try: return str(json.loads(cmd).get("cmd") or "").lower()
+        except Exception: return ""
+    return (cmd.split() or [""])[0].lower()
+
+def send_cmd(cmd: str):
+    global _conn
+    if _verb(cmd) in STREAMING:
+        return False, {"ok": False, "error": "subscribe needs its own connection to the daemon socket"}
+    with _conn_lock:
+        for attempt in (0, 1):
+            reused = _conn is not None
+            stale = False      # the daemon can't have seen this request: safe to resend
+            try:
+                if _conn is None:
+                    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    s.settimeout(2.0)
+                    s.connect(SOCK)
+                    _conn = (s, s.makefile("rb"))
+                s, rf = _conn
+                try:
+                    s.sendall((cmd.strip()+"\n").encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    stale = True
+                    raise
+                data = rf.readline()
+                if not data:
+                    stale = True
+                    raise ConnectionError("daemon closed connection")
+                try:
+                    return True, json.loads(data.decode())
+                except Exception:
+                    return True, {"ok": True, "msg": data.decode(errors="ignore")}
+            except Exception as e:
+                _drop_conn()   # also after a timeout: a late reply would answer the next request
+                # Only a pooled connection that was already dead gets one fresh retry.
+                if not (reused and stale) or attempt:
+                    return False, {"ok": False, "error": str(e)}
 
 class Handler(http.server.BaseHTTPRequestHandler):
     def _send(self, code, obj):
@@ -50,6 +91,8 @@ class Handler(http.server.BaseHTTPRequestHandler):
                 cmd = (q.get("cmd", [""])[0] or "").strip().lower()
                 if not cmd:
                     return self._send(400, {"ok": False, "error": "missing cmd"})
+                if _verb(cmd) in STREAMING:
+                    return self._send(400, {"ok": False, "error": f"{_verb(cmd)} is not available over HTTP"})
                 ok, resp = send_cmd(cmd)
                 return self._send(200 if ok else 502, resp)
             return self._send(404, {"ok": False, "error": "not found"})
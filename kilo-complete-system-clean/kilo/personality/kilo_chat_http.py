@@ -1,51 +1,44 @@
 #!/usr/bin/env python3
 """
 kilo_chat_http.py — local chat endpoint
-- GET /health         -> {"ok": true}
-- GET /ask?text=...   -> runs through kilo_brain, speaks via kilosay, returns JSON
-- Updates eyes state to 'speak' before talking (no extra daemon speech)
+- GET /health         -> {"ok": true, "brain": {reply cache + intent matcher stats}}
+- GET /ask?text=...   -> runs through kilo_brain, speaks via personalityd's speech queue, returns JSON
+- GET /cancel         -> stops the answer being streamed and hushes queued reply speech
+                         (kilo_ears calls this on every wake word)
+- Asks personalityd to show the 'speak' eyes before talking (no extra daemon speech)
+- kilo_brain is imported once and warmed at startup; persona/quips stay in
+  memory (hot-reloaded by kilo_watch), so /ask no longer starts an interpreter
+- With a reasoning backend (env KILO_REASONER) answers stream: each sentence is
+  queued for speech as soon as it is complete, so Kilo starts talking before
+  generation finishes. /ask reports first_sentence_ms next to brain_ms.
+  Requests are served on threads so /cancel can land mid-answer.
 """
-import http.server, socketserver, urllib.parse, json, subprocess, os, time
+import http.server, socketserver, urllib.parse, json, time
+import kilo_speech, kilo_state, kilo_brain
 
-BASE = "/opt/kilo/personality"
-STATE = os.path.join(BASE, "state.json")
-KILOSAY = "/usr/local/bin/kilosay"
 HOST, PORT = "127.0.0.1", 7863
 
 def set_eyes(eyes="speak", sound=None):
-    """Lightweight, safe state update (no extra speech)."""
-    try:
-        state = {}
-        if os.path.exists(STATE):
-            with open(STATE, "r", encoding="utf-8") as f:
-                state = json.load(f)
-        state["eyes_state"] = eyes
-        if sound is not None:
-            state["sound_cue"] = sound
-        state["updated_ts"] = int(time.time())
-        tmp = STATE + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(state, f, indent=2)
-        os.replace(tmp, STATE)
-    except Exception as e:
-        # Non-fatal
-        pass
+    """Lightweight, safe state update (no extra speech). Non-fatal if the daemon is down."""
+    kilo_state.set_ui(eyes=eyes, sound=sound)
 
-def brain_reply(text: str) -> str:
+def brain_answer(text: str, on_sentence) -> dict:
     try:
-        out = subprocess.check_output(
-            ["/usr/bin/env", "python3", os.path.join(BASE, "kilo_brain.py"), text],
-            stderr=subprocess.DEVNULL
-        ).decode("utf-8", errors="ignore").strip()
-        return out or "Say that again."
-    except Exception:
-        return "Say that again."
+        res = kilo_brain.answer(text, on_sentence)
+        if (res.get("text") or "").strip():
+            return res
+        if res.get("stopped") == "cancelled":
+            return res    # barge-in or a newer question; stay quiet
+    except Exception as e:
+        print(f"[kilo-chat] brain error: {e}", flush=True)
+        res = {"source": "error"}
+    on_sentence("Say that again.")
+    return dict(res, text="Say that again.")
 
 def speak(line: str):
-    try:
-        subprocess.Popen([KILOSAY, line], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    except Exception:
-        pass
+    resp = kilo_speech.say(line, "reply")
+    if not resp.get("ok"):
+        print(f"[kilo-chat] speech not queued: {resp.get('error')}", flush=True)
 
 class H(http.server.BaseHTTPRequestHandler):
     def _send(self, code, obj):
@@ -58,25 +51,43 @@ class H(http.server.BaseHTTPRequestHandler):
         try:
             p = urllib.parse.urlparse(self.path)
             if p.path == "/health":
-                return self._send(200, {"ok": True, "service": "kilo-chat"})
+                return self._send(200, {"ok": True, "service": "kilo-chat",
+                                        "brain": {"cache": kilo_brain.cache_stats(),
+                                                  "intents": kilo_brain.matcher_stats()}})
             if p.path == "/ask":
                 q = urllib.parse.parse_qs(p.query or "")
                 text = (q.get("text", [""])[0]).strip()
                 if not text:
                     return self._send(400, {"ok": False, "error": "missing text"})
-                # persona -> reply
-                reply = brain_reply(text)
-                # show eyes as speaking, then voice it
-                set_eyes("speak", None)
-                speak(reply)
-                return self._send(200, {"ok": True, "reply": reply})
+                # persona -> reply, voicing each sentence as soon as it exists
+                t0 = time.perf_counter()
+                first = []
+                def on_sentence(line):
+                    if not first:
+                        first.append(round((time.perf_counter() - t0) * 1000.0, 3))
+                        set_eyes("speak", None)   # show eyes as speaking, then voice it
+                    speak(line)
+                res = brain_answer(text, on_sentence)
+                brain_ms = round((time.perf_counter() - t0) * 1000.0, 3)
+                return self._send(200, {"ok": True, "reply": res["text"], "brain_ms": brain_ms,
+                                        "first_sentence_ms": first[0] if first else None,
+                                        "source": res.get("source"), "stopped": res.get("stopped")})
+            if p.path == "/cancel":
+                cancelled = kilo_brain.cancel()
+                resp = kilo_speech.hush("reply")
+                return self._send(200, {"ok": True, "cancelled": cancelled, "hushed": bool(resp.get("ok"))})
             return self._send(404, {"ok": False, "error": "not found"})
         except Exception as e:
             return self._send(500, {"ok": False, "error": str(e)})
 
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
 if __name__ == "__main__":
-    with socketserver.TCPServer((HOST, PORT), H) as httpd:
-        httpd.allow_reuse_address = True
+    kilo_brain.warm()
+    kilo_brain.backend()
+    with Server((HOST, PORT), H) as httpd:
         print(f"[kilo-chat] listening on http://{HOST}:{PORT}", flush=True)
         try: httpd.serve_forever()
         except KeyboardInterrupt: pass
@@ -1,9 +1,52 @@
 #!/usr/bin/env python3
-import os, sys, time, json, queue, urllib.parse, urllib.request
+"""
+kilo_ears.py — wake word + utterance capture, sent to the chat service.
+- A grammar-limited Vosk recognizer listens for the wake phrases; a wake cuts
+  off the previous answer (/cancel) and turns the ears hot.
+- An EnergyGate sits in front of the keyword recognizer: frame energy over
+  an adaptive noise floor plus the block's speech-band share and spectral
+  flatness. Blocks only reach Vosk while it is open (plus EARS_GATE_LOOKBACK_SEC
+  of lookback so onsets aren't clipped), so a silent garage costs a few numpy
+  ops per block instead of a Kaldi decode. EARS_GATE=0 feeds everything as
+  before. Every EARS_STATS_SEC the log reports gate open share and CPU spent
+  per hour; `--bench-gate` measures the wake-miss rate on recordings.
+- The last EARS_PREROLL_SEC (1.5 s) of audio sits in a preallocated ring
+  (PcmRing). On wake, everything after the wake phrase's last word (its end
+  time from the keyword recognizer, found among any words that came with it)
+  is replayed into the full recognizer, so
+  "hey kilo status" in one breath still gets its "status".
+- While hot, every block goes straight into the full recognizer (Utterance),
+  so the words are decoded as they are spoken; partial text is polled every
+  EARS_PARTIAL_SEC (EARS_LOG_PARTIALS=1 logs it). After EARS_SILENCE_HANG_SEC
+  of silence only the tail is flushed, and the log line reports wake->text and
+  the final flush time.
+- VadStage keeps one webrtcvad instance (EARS_VAD_MODE) and a preallocated
+  buffer across blocks; each block yields the share of its 30 ms frames that
+  were voice, and a block at or over EARS_VAD_RATIO restarts the silence
+  hangover. `--bench-vad` compares it with the old per-frame loop.
+- Capture runs in its own process (`kilo_ears.py --capture DEV`, started by
+  run_stream): the PortAudio callback writes int16 straight into ShmRing, an
+  mmap'd ring at EARS_RING_SHM holding EARS_RING_SEC of audio. The decoding
+  process reads it block by block, so a slow Kaldi decode only makes it fall
+  behind; the silence hangover runs on audio time, so catching up doesn't
+  cut utterances short. Device xruns and reader overruns (audio overwritten
+  before it was read) are counted in the ring header, logged with the stats
+  and shown by `--ring-status`. EARS_CAPTURE_CPUS pins the capture process.
+- `kilo_ears.py --bench-gate long.wav ...` runs the keyword recognizer over
+  recordings with and without the gate: CPU seconds per audio hour and wakes
+  found, missed and added by gating.
+- `kilo_ears.py --selftest` checks, with a scripted recognizer instead of
+  Vosk, that the replay starts right after the wake phrase when command words
+  came back in the same result.
+- `kilo_ears.py --bench a.wav b.wav` decodes recordings the old way (whole
+  buffer at the end) and the streaming way and prints both latencies.
+"""
+import os, sys, mmap, time, json, wave, struct, argparse, threading, subprocess, urllib.parse, urllib.request
 import numpy as np
 import sounddevice as sd
 import webrtcvad
 from vosk import Model, KaldiRecognizer
+import kilo_state
 
 def getenv(k, default=None):
     v = os.environ.get(k)
@@ -14,9 +57,24 @@ CFG = {
     "wake_phrases": [p.strip() for p in (getenv("EARS_WAKE_PHRASES","hey jarvis, hey kilo, computer")).split(",") if p.strip()],
     "vosk_model": getenv("EARS_VOSK_MODEL","/opt/kilo/models/vosk-small-en-us"),
     "chat_url": getenv("EARS_CHAT_URL","http://127.0.0.1:7863/ask"),
+    "cancel_url": getenv("EARS_CANCEL_URL"),   # default: /cancel next to chat_url
     "max_speech": float(getenv("EARS_MAX_SPEECH_SEC","8")),
     "hang_sil": float(getenv("EARS_SILENCE_HANG_SEC","0.9")),
     "min_conf": float(getenv("EARS_MIN_CONF","0.30")),
+    "preroll_sec": float(getenv("EARS_PREROLL_SEC","1.5")),
+    "partial_sec": float(getenv("EARS_PARTIAL_SEC","0.3")),   # how often to poll partial text; 0 = never
+    "log_partials": getenv("EARS_LOG_PARTIALS","0") == "1",
+    "gate": getenv("EARS_GATE","1") != "0",
+    "gate_open_db": float(getenv("EARS_GATE_OPEN_DB","9")),        # over the noise floor, if speech-like
+    "gate_loud_db": float(getenv("EARS_GATE_LOUD_DB","20")),       # over the noise floor, anything
+    "gate_hold_sec": float(getenv("EARS_GATE_HOLD_SEC","0.8")),    # Vosk needs trailing silence to finalize
+    "gate_lookback_sec": float(getenv("EARS_GATE_LOOKBACK_SEC","0.3")),
+    "stats_sec": float(getenv("EARS_STATS_SEC","600")),
+    "vad_mode": int(getenv("EARS_VAD_MODE","2")),                # webrtcvad aggressiveness 0..3
+    "vad_ratio": float(getenv("EARS_VAD_RATIO","0.25")),         # share of a block's frames that counts as voice
+    "ring_shm": getenv("EARS_RING_SHM","/dev/shm/kilo_ears_ring"),
+    "ring_sec": float(getenv("EARS_RING_SEC","10")),             # how long decoding may stall without losing audio
+    "capture_cpus": getenv("EARS_CAPTURE_CPUS"),                  # e.g. "0": pin the capture process
 }
 
 RATE = 16000
@@ -26,27 +84,32 @@ VAD_FRAME = 480  # 30 ms @16k
 
 def http_ask(text: str):
     q = urllib.parse.urlencode({"text": text})
-    with urllib.request.urlopen(f"{CFG['chat_url']}?{q}", timeout=5) as resp:
+    with urllib.request.urlopen(f"{CFG['chat_url']}?{q}", timeout=15) as resp:
         resp.read()
 
+def http_cancel():
+    url = CFG["cancel_url"] or CFG["chat_url"].rsplit("/", 1)[0] + "/cancel"
+    with urllib.request.urlopen(url, timeout=2) as resp:
+        resp.read()
+
+def in_background(fn, *args):
+    """Answers stream for a while; keep listening (and hear the next wake word) meanwhile."""
+    def run():
+        try: fn(*args)
+        except Exception as e:
+            print(f"[ears] {fn.__name__} error:", e, file=sys.stderr)
+    threading.Thread(target=run, daemon=True).start()
+
 def set_eye(eyes="focus"):
-    try:
-        state_path = "/opt/kilo/personality/state.json"
-        st = {}
-        if os.path.exists(state_path):
-            with open(state_path,"r",encoding="utf-8") as f: st = json.load(f)
-        st["eyes_state"]=eyes; st["updated_ts"]=int(time.time())
-        tmp = state_path+".tmp"
-        with open(tmp,"w",encoding="utf-8") as f: json.dump(st,f,indent=2)
-        os.replace(tmp,state_path)
-    except Exception:
-        pass
+    # personalityd owns the state; non-fatal if it is down
+    kilo_state.set_ui(eyes=eyes, sound=None)
 
 def make_kw_rec(model: Model, phrases):
     import json as _json
     grammar = _json.dumps(phrases)
     rec = KaldiRecognizer(model, RATE)
     rec.SetGrammar(grammar)
+    rec.SetWords(True)   # word end times say where the command starts
     return rec
 
 def make_full_rec(model: Model):
@@ -54,82 +117,694 @@ def make_full_rec(model: Model):
     rec.SetWords(True)
     return rec
 
+class PcmRing:
+    """The last `seconds` of int16 PCM in one preallocated array, addressed by
+    absolute sample number (samples written since start)."""
+
+    def __init__(self, seconds, rate=RATE):
+        self.buf = np.zeros(max(1, int(seconds * rate)), dtype=np.int16)
+        self.total = 0
+
+    def write(self, x):
+        cap, n = len(self.buf), len(x)
+        if n > cap:                       # only the newest cap samples survive anyway
+            self.total += n - cap
+            x, n = x[n - cap:], cap
+        i = self.total % cap
+        first = min(n, cap - i)
+        self.buf[i:i + first] = x[:first]
+        self.buf[:n - first] = x[first:]
+        self.total += n
+
+    def since(self, start):
+        """PCM bytes from absolute sample `start` to now (clipped to what is still held)."""
+        cap = len(self.buf)
+        start = max(start, self.total - cap, 0)
+        n = self.total - start
+        if n <= 0:
+            return b""
+        i = start % cap
+        if i + n <= cap:
+            return self.buf[i:i + n].tobytes()
+        return self.buf[i:].tobytes() + self.buf[:n - (cap - i)].tobytes()
+
+class ShmRing:
+    """int16 PCM ring in an mmap'd file shared by the capture process (writer)
+    and the decoding process (reader).
+    Layout: 64-byte header <magic "KEAR", u32 rate, u32 capacity, u32 writer
+    pid, then u64 written, xruns (writer fields) and read, overruns, lost
+    (reader fields)>, then `capacity` int16 samples. Each field has a single
+    writing process. `written` is only bumped after the samples are in place,
+    so the block after it may be mid-write: the reader treats anything within
+    one block of being lapped as overrun, before and after copying, so a torn
+    block is counted instead of handed on as mixed audio."""
+    MAGIC = b"KEAR"
+    HEAD = struct.Struct("<4sIII")
+    WRITTEN, XRUNS, READ, OVERRUNS, LOST = 16, 24, 32, 40, 48
+    DATA_OFF = 64
+
+    def __init__(self, path, seconds=None, rate=RATE, create=False):
+        self.path = path
+        if create:
+            cap = max(BLOCK, int((CFG["ring_sec"] if seconds is None else seconds) * rate))
+            size = self.DATA_OFF + cap * 2
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.ftruncate(fd, size)
+                self._mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            finally:
+                os.close(fd)
+            self.rate, self.cap = rate, cap
+        else:
+            with open(path, "r+b") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            magic, self.rate, self.cap, _ = self.HEAD.unpack_from(self._mm, 0)
+            if magic != self.MAGIC:
+                self._mm.close()
+                raise ValueError(f"{path}: not an ears ring")
+        self.pcm = np.frombuffer(self._mm, dtype=np.int16, count=self.cap, offset=self.DATA_OFF)
+        self.pos = self._get(self.READ) if not create else 0
+        if create:
+            # Magic goes in last: the reader waits for it before trusting anything else.
+            self.HEAD.pack_into(self._mm, 0, self.MAGIC, self.rate, self.cap, os.getpid())
+
+    def _get(self, off):
+        return struct.unpack_from("<Q", self._mm, off)[0]
+
+    def _put(self, off, v):
+        struct.pack_into("<Q", self._mm, off, v)
+
+    @property
+    def pid(self):
+        return self.HEAD.unpack_from(self._mm, 0)[3]
+
+    # --- writer (capture process) ---
+    def write(self, x):
+        w, n = self._get(self.WRITTEN), len(x)
+        if n > self.cap:
+            w, x, n = w + n - self.cap, x[n - self.cap:], self.cap
+        i = w % self.cap
+        first = min(n, self.cap - i)
+        self.pcm[i:i + first] = x[:first]
+        self.pcm[:n - first] = x[first:]
+        self._put(self.WRITTEN, w + n)
+
+    def xrun(self):
+        self._put(self.XRUNS, self._get(self.XRUNS) + 1)
+
+    # --- reader (decoding process) ---
+    def _overrun(self, written):
+        """Writer lapped us: skip to the newest half of the ring and count what was lost."""
+        new = written - self.cap // 2
+        lost = new - self.pos
+        self._put(self.OVERRUNS, self._get(self.OVERRUNS) + 1)
+        self._put(self.LOST, self._get(self.LOST) + lost)
+        print(f"[ears] capture ring overrun: skipped {lost / self.rate * 1000:.0f} ms of audio", file=sys.stderr)
+        self.pos = new
+
+    def _lapped(self, written):
+        # the writer may already be storing up to one block past `written`
+        return written + BLOCK - self.pos > self.cap
+
+    def take(self, n=BLOCK):
+        """The next n samples (a copy), or None until the writer has produced them."""
+        written = self._get(self.WRITTEN)
+        if self._lapped(written):
+            self._overrun(written)
+        if written - self.pos < n:
+            return None
+        i = self.pos % self.cap
+        first = min(n, self.cap - i)
+        out = np.empty(n, dtype=np.int16)
+        out[:first] = self.pcm[i:i + first]
+        out[first:] = self.pcm[:n - first]
+        if self._lapped(self._get(self.WRITTEN)):   # overwritten while we copied
+            self._overrun(self._get(self.WRITTEN))
+            return None
+        self.pos += n
+        self._put(self.READ, self.pos)
+        return out
+
+    def backlog(self):
+        """Samples written but not read yet."""
+        return self._get(self.WRITTEN) - self.pos
+
+    def counters(self):
+        return {k: self._get(off) for k, off in (("written", self.WRITTEN), ("xruns", self.XRUNS), ("read", self.READ),
+                                                 ("overruns", self.OVERRUNS), ("lost", self.LOST))}
+
+    def close(self):
+        self.pcm = None
+        try: self._mm.close()
+        except Exception: pass
+
+def capture(dev_choice):
+    """Capture process body: PortAudio callback -> ShmRing, until the parent goes away."""
+    parent = os.getppid()
+    if CFG["capture_cpus"]:
+        try: os.sched_setaffinity(0, {int(c) for c in CFG["capture_cpus"].split(",")})
+        except Exception as e: print(f"[ears] capture: can't pin to {CFG['capture_cpus']}: {e}", file=sys.stderr)
+    ring = ShmRing(CFG["ring_shm"], create=True)
+
+    def cb(indata, frames, time_info, status):
+        if status:
+            ring.xrun()      # no printing on the audio thread; the reader logs the count
+        ring.write(indata[:, 0])
+
+    sd_kwargs = dict(samplerate=RATE, channels=CH, dtype="int16", blocksize=BLOCK, callback=cb)
+    if dev_choice is not None:
+        sd_kwargs["device"] = dev_choice
+    with sd.InputStream(**sd_kwargs):
+        while os.getppid() == parent:
+            time.sleep(0.5)
+
+def start_capture(dev_choice, timeout=5.0):
+    """Spawn the capture process for dev_choice and attach to its ring.
+    Raises RuntimeError if it dies or produces no audio within timeout."""
+    try: os.unlink(CFG["ring_shm"])
+    except FileNotFoundError: pass
+    cmd = [sys.executable, os.path.abspath(__file__), "--capture", "" if dev_choice is None else str(dev_choice)]
+    proc = subprocess.Popen(cmd)
+    deadline = time.monotonic() + timeout
+    ring = None
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            break
+        if ring is None:
+            try: ring = ShmRing(CFG["ring_shm"])
+            except (OSError, ValueError): pass
+            if ring is not None and ring.pid != proc.pid:
+                ring.close()
+                ring = None
+        if ring is not None and ring.backlog() > 0:
+            return proc, ring
+        time.sleep(0.05)
+    if ring is not None:
+        ring.close()
+    stop_capture(proc)
+    raise RuntimeError(f"capture process exited ({proc.returncode}) or produced no audio")
+
+def stop_capture(proc):
+    if proc.poll() is None:
+        proc.terminate()
+        try: proc.wait(timeout=2)
+        except subprocess.TimeoutExpired: proc.kill()
+
+def ring_status():
+    try: ring = ShmRing(CFG["ring_shm"])
+    except (OSError, ValueError) as e:
+        print(f"no capture ring: {e}", file=sys.stderr)
+        return 1
+    c = ring.counters()
+    print(json.dumps({"path": CFG["ring_shm"], "pid": ring.pid, "rate": ring.rate,
+                      "capacity_sec": ring.cap / ring.rate, "backlog_sec": (c["written"] - c["read"]) / ring.rate,
+                      "lost_sec": c["lost"] / ring.rate, **c}))
+    ring.close()
+    return 0
+
+def _wake_end(res, phrases=None):
+    """Seconds into the keyword recognizer's stream where the wake phrase ended, or None.
+    Vosk may hand back the wake phrase and what followed it in one result, so this
+    is the end of the earliest (longest) wake phrase in the words, not of the last word."""
+    words = res.get("result") or []
+    said = [str(w.get("word", "")).lower() for w in words if isinstance(w, dict)]
+    if len(said) != len(words):
+        return None
+    wake = sorted({tuple(p.lower().split()) for p in (CFG["wake_phrases"] if phrases is None else phrases)},
+                  key=len, reverse=True)
+    try:
+        for i in range(len(said)):
+            for p in wake:
+                if p and tuple(said[i:i + len(p)]) == p:
+                    return float(words[i + len(p) - 1]["end"])
+        return float(words[-1]["end"]) if words else None   # no phrase in the words: old behaviour
+    except (KeyError, TypeError, ValueError): return None
+
+class VadStage:
+    """One webrtcvad instance over 30 ms frames, kept across blocks.
+    A 100 ms block is 3 1/3 frames; the leftover samples are carried into the
+    next block instead of dropped, all inside one preallocated buffer that the
+    VAD reads through memoryview slices (no per-frame bytes copies)."""
+
+    def __init__(self, mode=None, block=BLOCK, frame=VAD_FRAME, rate=RATE):
+        self.vad = webrtcvad.Vad(CFG["vad_mode"] if mode is None else mode)
+        self.frame, self.rate = frame, rate
+        self.carry = 0            # samples waiting at the front of the buffer
+        self.sec = 0.0            # time spent in feed()
+        self.counters = {"frames": 0, "speech": 0}
+        self._alloc(block + frame)
+
+    def _alloc(self, samples):
+        self.buf = bytearray(samples * 2)
+        self.view = memoryview(self.buf)
+        self.pcm = np.frombuffer(self.buf, dtype=np.int16)
+
+    def feed(self, chunk):
+        """Feed one int16 block; returns the share of its 30 ms frames that were speech (0..1)."""
+        t = time.perf_counter()
+        n, step = len(chunk), self.frame * 2
+        if self.carry + n > len(self.pcm):
+            old = bytes(self.view[:self.carry * 2])
+            self._alloc(self.carry + n + self.frame)
+            self.buf[:len(old)] = old
+        self.pcm[self.carry:self.carry + n] = chunk
+        end = (self.carry + n) * 2
+        frames = speech = 0
+        for i in range(0, end - step + 1, step):
+            frames += 1
+            speech += self.vad.is_speech(self.view[i:i + step], self.rate)
+        used = frames * self.frame
+        self.carry = self.carry + n - used
+        if self.carry:
+            self.pcm[:self.carry] = self.pcm[used:used + self.carry]
+        self.counters["frames"] += frames
+        self.counters["speech"] += speech
+        self.sec += time.perf_counter() - t
+        return speech / frames if frames else 0.0
+
+class EnergyGate:
+    """Cheap "could this be speech?" test per block, in front of the keyword recognizer."""
+    FRAME = 160             # 10 ms energy frames
+    FLOOR_RISE_DB = 1.5     # per second, always: a steady hum is absorbed even if it looked like speech
+    SPEECH_BAND = (80.0, 4000.0)
+    MIN_BAND_SHARE = 0.3    # of total power inside SPEECH_BAND (rumble and hiss sit outside)
+    MAX_FLATNESS = 0.35     # broadband noise is flat (~0.55), voiced speech is peaky
+
+    def __init__(self, rate=RATE, block=BLOCK, open_db=None, loud_db=None, hold_sec=None, lookback_sec=None):
+        self.rate = rate
+        self.open_db = CFG["gate_open_db"] if open_db is None else open_db
+        self.loud_db = CFG["gate_loud_db"] if loud_db is None else loud_db
+        self.hold = int((CFG["gate_hold_sec"] if hold_sec is None else hold_sec) * rate)
+        self.lookback = int((CFG["gate_lookback_sec"] if lookback_sec is None else lookback_sec) * rate)
+        self._win = np.hanning(block).astype(np.float32)
+        freqs = np.fft.rfftfreq(block, 1.0 / rate)
+        self._band = (freqs >= self.SPEECH_BAND[0]) & (freqs <= self.SPEECH_BAND[1])
+        self.floor = None
+        self.samples = 0
+        self.open_until = -1
+        self.sec = 0.0          # time spent in update()
+        self.counters = {"blocks": 0, "open": 0, "triggers": 0, "loud": 0, "shape_rejects": 0}
+
+    def _speechlike(self, x):
+        if len(x) != len(self._win):
+            return True         # odd-sized tail block: let energy decide
+        p = np.abs(np.fft.rfft(x * self._win)) ** 2
+        pb = p[self._band] + 1e-12
+        share = pb.sum() / (p.sum() + 1e-9)
+        flat = np.exp(np.mean(np.log(pb))) / np.mean(pb)
+        return share >= self.MIN_BAND_SHARE and flat <= self.MAX_FLATNESS
+
+    def update(self, chunk):
+        """Feed one int16 block; True if it should go to the recognizer."""
+        t = time.perf_counter()
+        n = len(chunk)
+        x = chunk.astype(np.float32)
+        f = x[:n - n % self.FRAME].reshape(-1, self.FRAME)
+        level = 10.0 * np.log10(float(np.max(np.mean(f * f, axis=1))) + 1e-3) - 90.31 if len(f) else -120.0
+        if self.floor is None:
+            self.floor = level
+        trig = False
+        if level > self.floor + self.loud_db:
+            trig = True
+            self.counters["loud"] += 1
+        elif level > self.floor + self.open_db:
+            trig = self._speechlike(x)
+            if not trig:
+                self.counters["shape_rejects"] += 1
+        if level < self.floor:
+            self.floor += (level - self.floor) * 0.5
+        else:
+            self.floor += min(level - self.floor, self.FLOOR_RISE_DB * n / self.rate)
+        self.samples += n
+        if trig:
+            self.open_until = self.samples + self.hold
+            self.counters["triggers"] += 1
+        is_open = self.samples <= self.open_until
+        self.counters["blocks"] += 1
+        self.counters["open"] += is_open
+        self.sec += time.perf_counter() - t
+        return is_open
+
+class KeywordSpotter:
+    """The wake-phrase recognizer, fed from the ring through an optional gate.
+    Gated-out audio never reaches Vosk, so its word times count only fed
+    samples; `runs` maps them back to absolute ring positions."""
+
+    def __init__(self, model, ring, gate=None, make_rec=None):
+        self.model, self.ring, self.gate = model, ring, gate
+        self.make_rec = make_rec or (lambda: make_kw_rec(self.model, CFG["wake_phrases"]))
+        self.sec = 0.0          # time spent in AcceptWaveform
+        self.reset()
+
+    def reset(self):
+        self.rec = self.make_rec()
+        self.fed = 0
+        self.fed_abs = self.ring.total
+        self.runs = [(0, self.fed_abs)]   # (recognizer sample, ring sample) where each fed run starts
+
+    def _to_abs(self, sample):
+        for fed, start in reversed(self.runs):
+            if sample >= fed:
+                return start + (sample - fed)
+        return self.runs[0][1]
+
+    def push(self, chunk):
+        """chunk is the block just written to the ring. Returns (phrase, ring sample where it ended) on a wake."""
+        if self.gate is not None and not self.gate.update(chunk):
+            return None
+        start = self.ring.total - len(chunk)
+        if self.gate is not None:
+            start -= self.gate.lookback       # reopening: pick up the onset we skipped
+        pcm = self.ring.since(max(self.fed_abs, start))
+        start = self.ring.total - len(pcm) // 2
+        if start != self.fed_abs:
+            self.runs = (self.runs + [(self.fed, start)])[-64:]
+        self.fed += len(pcm) // 2
+        self.fed_abs = self.ring.total
+        t = time.perf_counter()
+        done = self.rec.AcceptWaveform(pcm)
+        if done:
+            res = json.loads(self.rec.Result())
+        self.sec += time.perf_counter() - t
+        if not done:
+            return None
+        phrase = (res.get("text") or "").strip()
+        if not phrase:
+            return None
+        end = _wake_end(res)
+        return phrase, (self._to_abs(int(end * RATE)) if end is not None else self.ring.total)
+
+class Utterance:
+    """One hot utterance, decoded while it is being spoken.
+    feed() hands each block to the full recognizer right away; Vosk finalizes
+    segments at its own endpoints, and `partial` holds the text so far. At the
+    end of speech finish() only has to flush the tail, instead of decoding the
+    whole utterance in one burst."""
+
+    def __init__(self, rec):
+        self.rec = rec
+        self.t_wake = time.perf_counter()
+        self.segments, self.confs = [], []
+        self.partial = ""
+        self.n_bytes = 0
+        self.feed_sec = 0.0       # recognizer time spent while the user was talking
+        self.flush_sec = None     # recognizer time after end of speech
+        self._next_partial = 0.0
+
+    def _take(self, res):
+        text = (res.get("text") or "").strip()
+        if text:
+            self.segments.append(text)
+        self.confs += [float(w.get("conf", 0.0)) for w in res.get("result") or []]
+        if "confidence" in res and not res.get("result"):
+            self.confs.append(float(res["confidence"] or 0.0))
+
+    def feed(self, pcm: bytes):
+        t = time.perf_counter()
+        self.n_bytes += len(pcm)
+        if self.rec.AcceptWaveform(pcm):
+            self._take(json.loads(self.rec.Result()))
+            self.partial = " ".join(self.segments)
+        elif CFG["partial_sec"] > 0 and t >= self._next_partial:
+            self._next_partial = t + CFG["partial_sec"]
+            tail = (json.loads(self.rec.PartialResult()).get("partial") or "").strip()
+            text = " ".join(self.segments + ([tail] if tail else []))
+            if text != self.partial:
+                self.partial = text
+                if CFG["log_partials"]:
+                    print(f"[ears] partial: '{text}'")
+        self.feed_sec += time.perf_counter() - t
+
+    def finish(self):
+        """(text, confidence). Leaves the recognizer ready for the next utterance."""
+        t = time.perf_counter()
+        self._take(json.loads(self.rec.FinalResult()))
+        self.flush_sec = time.perf_counter() - t
+        conf = sum(self.confs) / len(self.confs) if self.confs else 0.0
+        return " ".join(self.segments), conf
+
+    def timings(self):
+        ms = lambda s: round(s * 1000.0, 1)
+        return {"wake_to_text_ms": ms(time.perf_counter() - self.t_wake), "flush_ms": ms(self.flush_sec or 0.0),
+                "feed_ms": ms(self.feed_sec), "audio_ms": ms(self.n_bytes / 2.0 / RATE)}
+
+def log_stats(st, ring, spotter, gate, shm=None):
+    """One line per EARS_STATS_SEC: what listening cost since the last line."""
+    now, cpu = time.monotonic(), time.process_time()
+    audio = (ring.total - st["audio"]) / RATE
+    if audio <= 0:
+        return
+    per_h = lambda sec: sec * 3600.0 / audio
+    kw, gsec = spotter.sec - st["kw"], (gate.sec if gate else 0.0) - st["gate"]
+    line = (f"[ears] last {audio:.0f} s of audio: keyword decode {per_h(kw):.1f} s/h, "
+            f"process CPU {per_h(cpu - st['cpu']):.1f} s/h")
+    if gate:
+        blocks, opened = gate.counters["blocks"] - st["blocks"], gate.counters["open"] - st["open"]
+        line += (f", gate open {opened / max(1, blocks):.1%} ({per_h(gsec):.1f} s/h to run), "
+                 f"noise floor {gate.floor:.0f} dBFS")
+        st.update(blocks=gate.counters["blocks"], open=gate.counters["open"], gate=gate.sec)
+    if shm is not None:
+        c = shm.counters()
+        line += (f", capture xruns {c['xruns'] - st['xruns']}, ring overruns {c['overruns'] - st['overruns']} "
+                 f"(lost {(c['lost'] - st['lost']) / RATE:.1f} s), backlog {shm.backlog() / RATE * 1000:.0f} ms")
+        st.update(xruns=c["xruns"], overruns=c["overruns"], lost=c["lost"])
+    print(line)
+    st.update(t=now, cpu=cpu, audio=ring.total, kw=spotter.sec)
+
 def run_stream(dev_choice):
     """Try to run with a specific device (index/name/None). Returns when stopped."""
     model = Model(CFG["vosk_model"])
-    rec_kw = make_kw_rec(model, CFG["wake_phrases"])
     rec_full = make_full_rec(model)
-    vad = webrtcvad.Vad(2)
+    vad = VadStage()
 
-    audio_q: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=50)
+    ring = PcmRing(CFG["preroll_sec"])
+    gate = EnergyGate() if CFG["gate"] else None
+    spotter = KeywordSpotter(model, ring, gate)
+    stats = {"t": time.monotonic(), "cpu": time.process_time(), "audio": 0, "kw": 0.0, "gate": 0.0, "blocks": 0, "open": 0,
+             "xruns": 0, "overruns": 0, "lost": 0}
     hot = False
-    speech_buf = bytearray()
-    last_voice_ts = 0.0
+    utt = None
+    last_voice_ts = 0.0          # audio time (ring.total / RATE): a decode stall must not look like silence
     start_ts = 0.0
 
-    def cb(indata, frames, time_info, status):
-        if status: print("[ears] audio status:", status, file=sys.stderr)
-        data = (indata[:,0] if indata.ndim>1 else indata).astype(np.float32)
-        data_i16 = np.clip(data * 32767.0, -32768, 32767).astype(np.int16)
-        try: audio_q.put_nowait(data_i16.copy())
-        except queue.Full: pass
-
-    sd_kwargs = dict(samplerate=RATE, channels=CH, dtype="float32", blocksize=BLOCK, callback=cb)
-    if dev_choice is not None:
-        sd_kwargs["device"] = dev_choice
-
-    print(f"[ears] starting; device: {dev_choice if dev_choice is not None else 'default'} wake: {CFG['wake_phrases']}")
+    proc, shm = start_capture(dev_choice)
+    print(f"[ears] starting; device: {dev_choice if dev_choice is not None else 'default'} wake: {CFG['wake_phrases']} "
+          f"(capture pid {proc.pid}, ring {shm.cap / RATE:.0f} s)")
     set_eye("idle")
-    with sd.InputStream(**sd_kwargs):
+    try:
         while True:
-            try:
-                chunk = audio_q.get(timeout=1.0)
-            except queue.Empty:
+            chunk = shm.take(BLOCK)
+            if chunk is None:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"capture process exited ({proc.returncode})")
+                time.sleep(0.01)
                 continue
 
+            ring.write(chunk)
+            now = ring.total / RATE
             byte_chunk = chunk.tobytes()
-            # VAD (updates last_voice_ts)
-            for i in range(0, len(byte_chunk), VAD_FRAME*2):
-                frame = byte_chunk[i:i+VAD_FRAME*2]
-                if len(frame) < VAD_FRAME*2: break
-                if webrtcvad.Vad(2).is_speech(frame, RATE):
-                    last_voice_ts = time.time()
+            if vad.feed(chunk) >= CFG["vad_ratio"]:   # hangover below counts from the last voiced block
+                last_voice_ts = now
+
+            if CFG["stats_sec"] > 0 and time.monotonic() - stats["t"] >= CFG["stats_sec"]:
+                log_stats(stats, ring, spotter, gate, shm)
 
             if not hot:
-                if rec_kw.AcceptWaveform(byte_chunk):
-                    import json as _json
-                    res = _json.loads(rec_kw.Result())
-                    utt = (res.get("text") or "").strip()
-                    if utt:
-                        print(f"[ears] wake: '{utt}'")
-                        set_eye("focus")
-                        hot = True
-                        speech_buf.clear()
-                        start_ts = time.time()
-                        last_voice_ts = time.time()
+                wake = spotter.push(chunk)
+                if wake:
+                    phrase, end = wake
+                    in_background(http_cancel)   # a new question cuts off the last answer
+                    set_eye("focus")
+                    hot = True
+                    utt = Utterance(rec_full)
+                    # Whatever followed the wake phrase in the same breath is already in the ring.
+                    pre = ring.since(end)
+                    if pre:
+                        utt.feed(pre)
+                    print(f"[ears] wake: '{phrase}' (replayed {len(pre) / 2.0 / RATE * 1000:.0f} ms after it)")
+                    start_ts = now
+                    last_voice_ts = now
             else:
-                speech_buf.extend(byte_chunk)
-                now = time.time()
+                utt.feed(byte_chunk)
                 if (now - last_voice_ts) >= CFG["hang_sil"] or (now - start_ts) >= CFG["max_speech"]:
-                    import json as _json
-                    rec_full.AcceptWaveform(bytes(speech_buf))
-                    res = _json.loads(rec_full.Result())
-                    text = (res.get("text") or "").strip()
-                    conf = float(res.get("confidence", 0.0) or 0.0)
+                    text, conf = utt.finish()
+                    tm = utt.timings()
                     if text and conf >= CFG["min_conf"]:
-                        print(f"[ears] heard: '{text}' conf~{conf:.2f}")
+                        print(f"[ears] heard: '{text}' conf~{conf:.2f} wake->text {tm['wake_to_text_ms']} ms "
+                              f"(final flush {tm['flush_ms']} ms, decoded while speaking {tm['feed_ms']} ms)")
                         set_eye("speak")
-                        try: http_ask(text)
-                        except Exception as e:
-                            print("[ears] ask error:", e, file=sys.stderr)
+                        in_background(http_ask, text)
                     else:
-                        print(f"[ears] no usable speech (len={len(speech_buf)} conf~{conf:.2f})")
+                        print(f"[ears] no usable speech (audio={tm['audio_ms']} ms conf~{conf:.2f})")
                         set_eye("idle")
                     hot = False
-                    speech_buf.clear()
+                    utt = None
                     last_voice_ts = 0.0
                     start_ts = 0.0
-                    rec_kw = make_kw_rec(model, CFG["wake_phrases"])
+                    spotter.reset()
+    finally:
+        shm.close()
+        stop_capture(proc)
+
+def _read_wav(path):
+    with wave.open(path, "rb") as w:
+        if (w.getframerate(), w.getnchannels(), w.getsampwidth()) != (RATE, CH, 2):
+            print(f"{path}: need {RATE} Hz mono 16-bit", file=sys.stderr)
+            return None
+        return w.readframes(w.getnframes())
+
+def bench_gate(paths, match_sec=1.0):
+    """Keyword spotting over recordings, ungated vs. gated. Wakes the ungated run finds
+    and the gated one doesn't (within match_sec) are misses; the reverse are extras."""
+    model = Model(CFG["vosk_model"])
+    tot = {"audio": 0.0, "plain": 0.0, "gated": 0.0, "gate": 0.0, "wakes": 0, "missed": 0, "extra": 0}
+    print(f"{'file':<28}{'audio s':>8}{'plain s/h':>11}{'gated s/h':>11}{'open':>7}{'wakes':>7}{'missed':>8}{'extra':>7}")
+    for path in paths:
+        pcm = _read_wav(path)
+        if pcm is None:
+            continue
+        x = np.frombuffer(pcm, dtype=np.int16)
+        ring = PcmRing(max(CFG["preroll_sec"], CFG["gate_lookback_sec"] + BLOCK / RATE))
+        gate = EnergyGate()
+        plain, gated = KeywordSpotter(model, ring), KeywordSpotter(model, ring, gate)
+        found = {"plain": [], "gated": []}
+        for i in range(0, len(x), BLOCK):
+            ring.write(x[i:i + BLOCK])
+            for name, sp in (("plain", plain), ("gated", gated)):
+                hit = sp.push(x[i:i + BLOCK])
+                if hit:
+                    found[name].append(hit[1] / RATE)
+                    sp.reset()
+        audio = len(x) / RATE
+        near = lambda t, ts: any(abs(t - u) <= match_sec for u in ts)
+        missed = sum(not near(t, found["gated"]) for t in found["plain"])
+        extra = sum(not near(t, found["plain"]) for t in found["gated"])
+        per_h = lambda sec: sec * 3600.0 / max(audio, 1e-9)
+        print(f"{os.path.basename(path)[:27]:<28}{audio:>8.0f}{per_h(plain.sec):>11.1f}{per_h(gated.sec + gate.sec):>11.1f}"
+              f"{gate.counters['open'] / max(1, gate.counters['blocks']):>7.1%}{len(found['plain']):>7}{missed:>8}{extra:>7}")
+        for k, v in (("audio", audio), ("plain", plain.sec), ("gated", gated.sec), ("gate", gate.sec),
+                     ("wakes", len(found["plain"])), ("missed", missed), ("extra", extra)):
+            tot[k] += v
+    if tot["audio"] > 0:
+        per_h = lambda sec: sec * 3600.0 / tot["audio"]
+        print(f"total: {tot['audio'] / 3600.0:.2f} h of audio; keyword CPU {per_h(tot['plain']):.1f} s/h ungated vs "
+              f"{per_h(tot['gated'] + tot['gate']):.1f} s/h gated (gate itself {per_h(tot['gate']):.1f}); "
+              f"wake-miss rate {tot['missed'] / max(1, tot['wakes']):.1%} ({tot['missed']}/{tot['wakes']}), "
+              f"{tot['extra']} extra")
+
+def bench_vad(paths):
+    """The VAD over recordings, block by block as the live loop sees them: the old
+    way (a new Vad per 30 ms frame, bytes slices, block remainder dropped) vs.
+    VadStage. Prints the cost per audio hour and how often the two disagree on
+    whether a block was voice (which is what the silence hangover counts from)."""
+    tot = {"audio": 0.0, "old": 0.0, "new": 0.0, "blocks": 0, "differ": 0}
+    print(f"{'file':<28}{'audio s':>8}{'old s/h':>9}{'new s/h':>9}{'old us/blk':>12}{'new us/blk':>12}{'voiced old/new':>16}")
+    for path in paths:
+        pcm = _read_wav(path)
+        if pcm is None:
+            continue
+        x = np.frombuffer(pcm, dtype=np.int16)
+        blocks = [x[i:i + BLOCK] for i in range(0, len(x), BLOCK)]
+        old_voiced, t = [], time.perf_counter()
+        for chunk in blocks:
+            byte_chunk, voiced = chunk.tobytes(), False
+            for i in range(0, len(byte_chunk), VAD_FRAME*2):
+                frame = byte_chunk[i:i+VAD_FRAME*2]
+                if len(frame) < VAD_FRAME*2: break
+                if webrtcvad.Vad(CFG["vad_mode"]).is_speech(frame, RATE):
+                    voiced = True
+            old_voiced.append(voiced)
+        old = time.perf_counter() - t
+        vad = VadStage()
+        new_voiced = [vad.feed(chunk) >= CFG["vad_ratio"] for chunk in blocks]
+        audio = len(x) / RATE
+        per_h = lambda sec: sec * 3600.0 / max(audio, 1e-9)
+        per_blk = lambda sec: sec * 1e6 / max(1, len(blocks))
+        print(f"{os.path.basename(path)[:27]:<28}{audio:>8.0f}{per_h(old):>9.2f}{per_h(vad.sec):>9.2f}"
+              f"{per_blk(old):>12.0f}{per_blk(vad.sec):>12.0f}{f'{sum(old_voiced)}/{sum(new_voiced)}':>16}")
+        for k, v in (("audio", audio), ("old", old), ("new", vad.sec), ("blocks", len(blocks)),
+                     ("differ", sum(a != b for a, b in zip(old_voiced, new_voiced)))):
+            tot[k] += v
+    if tot["audio"] > 0:
+        per_h = lambda sec: sec * 3600.0 / tot["audio"]
+        print(f"total: {tot['audio'] / 3600.0:.2f} h of audio; VAD {per_h(tot['old']):.2f} s/h old vs "
+              f"{per_h(tot['new']):.2f} s/h VadStage; voiced decision differs on {tot['differ']}/{tot['blocks']} blocks")
+
+def bench(paths):
+    """Decode recorded utterances (16 kHz mono 16-bit WAV) both ways and compare the
+    latency from end of speech to text: the old one-shot decode of the whole
+    buffer vs. the streaming Utterance's final flush. Wake-to-text adds the
+    utterance length and the silence hangover (EARS_SILENCE_HANG_SEC) to both."""
+    model = Model(CFG["vosk_model"])
+    print(f"{'file':<28}{'audio ms':>9}{'oneshot ms':>12}{'stream ms':>11}{'feed/blk ms':>13}  wake->text ms old/new")
+    for path in paths:
+        pcm = _read_wav(path)
+        if pcm is None:
+            continue
+        blocks = [pcm[i:i + BLOCK * 2] for i in range(0, len(pcm), BLOCK * 2)]
+        rec = make_full_rec(model)
+        buf = bytearray()
+        for b in blocks:                       # what the old loop did while hot
+            buf.extend(b)
+        t = time.perf_counter()
+        rec.AcceptWaveform(bytes(buf))
+        old_text = (json.loads(rec.Result()).get("text") or "").strip()
+        oneshot = time.perf_counter() - t
+        utt = Utterance(make_full_rec(model))
+        worst = 0.0
+        for b in blocks:
+            t = time.perf_counter()
+            utt.feed(b)
+            worst = max(worst, time.perf_counter() - t)
+        text, _ = utt.finish()
+        tail = len(pcm) / 2.0 / RATE + CFG["hang_sil"]
+        name = os.path.basename(path)
+        print(f"{name[:27]:<28}{len(pcm) / 2.0 / RATE * 1000:>9.0f}{oneshot * 1000:>12.1f}{utt.flush_sec * 1000:>11.1f}"
+              f"{utt.feed_sec / max(1, len(blocks)) * 1000:>13.1f}  {(tail + oneshot) * 1000:.0f}/{(tail + utt.flush_sec) * 1000:.0f}"
+              f"  (max block {worst * 1000:.1f} ms)")
+        if text != old_text:
+            print(f"  text differs: oneshot '{old_text}' / streaming '{text}'")
+
+class _ScriptedRec:
+    """Stands in for the keyword recognizer in selftest(): once `final_at` seconds of
+    audio have been fed, it reports `words` [(word, end sec)] as one result."""
+
+    def __init__(self, words, final_at):
+        self.words, self.final_at, self.fed = words, final_at, 0
+
+    def AcceptWaveform(self, pcm):
+        self.fed += len(pcm) // 2
+        return self.words is not None and self.fed >= self.final_at * RATE
+
+    def Result(self):
+        words, self.words = self.words, None
+        return json.dumps({"text": " ".join(w for w, _ in words),
+                           "result": [{"word": w, "end": e, "conf": 1.0} for w, e in words]})
+
+def selftest():
+    """Wake phrase + command in one breath: the replay must start right after the wake
+    phrase, not after the last word Vosk put in the same result. Needs no model."""
+    failures = 0
+    cases = [
+        ("hey kilo + command", [("hey", 0.42), ("kilo", 0.81), ("what", 1.10), ("time", 1.38), ("is", 1.50), ("it", 1.66)], 0.81),
+        ("one-word wake + command", [("computer", 0.70), ("status", 1.20)], 0.70),
+        ("command words first", [("what", 0.30), ("hey", 0.62), ("kilo", 0.95), ("status", 1.40)], 0.95),
+        ("wake phrase only", [("hey", 0.40), ("kilo", 0.80)], 0.80),
+    ]
+    x = (np.arange(RATE * 3) % 32749).astype(np.int16)   # sample value = its position, so offsets are checkable
+    for name, words, want in cases:
+        ring = PcmRing(3.0)
+        sp = KeywordSpotter(None, ring, make_rec=lambda: _ScriptedRec(words, 2.0))
+        wake = None
+        for i in range(0, len(x), BLOCK):
+            ring.write(x[i:i + BLOCK])
+            wake = wake or sp.push(x[i:i + BLOCK])
+        pre = np.frombuffer(ring.since(wake[1]), dtype=np.int16) if wake else np.zeros(0, np.int16)
+        start = int(round(want * RATE))
+        ok = wake is not None and wake[1] == start and len(pre) > 0 and int(pre[0]) == start % 32749
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: replay from {wake[1] / RATE if wake else None} s, want {want} s")
+    return failures
 
 def main():
     # Try configured device; if it fails, try None (default); then 'pulse'
@@ -153,7 +828,31 @@ def main():
     sys.exit(1)
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Kilo ears: wake word + speech to the chat service")
+    ap.add_argument("--bench", nargs="+", metavar="WAV", help="compare one-shot vs streaming decode on recordings")
+    ap.add_argument("--bench-gate", nargs="+", metavar="WAV", help="keyword CPU and wake misses with vs without the gate")
+    ap.add_argument("--bench-vad", nargs="+", metavar="WAV", help="per-frame Vad vs the reused VadStage on recordings")
+    ap.add_argument("--capture", metavar="DEVICE", help=argparse.SUPPRESS)   # internal: the capture process
+    ap.add_argument("--ring-status", action="store_true", help="print the capture ring's counters as JSON")
+    ap.add_argument("--selftest", action="store_true", help="check the wake-word replay point with a scripted recognizer")
+    args = ap.parse_args()
+    if args.capture is not None:
+        dev = args.capture
+        capture(None if dev == "" else int(dev) if dev.isdigit() else dev)
+        sys.exit(0)
+    if args.ring_status:
+        sys.exit(ring_status())
+    if args.selftest:
+        sys.exit(1 if selftest() else 0)
+    if args.bench_vad:
+        bench_vad(args.bench_vad)
+        sys.exit(0)
     if not os.path.isdir(CFG["vosk_model"]):
         print("[ears] ERROR: Vosk model not found at", CFG["vosk_model"], file=sys.stderr)
         sys.exit(2)
-    main()
+    if args.bench_gate:
+        bench_gate(args.bench_gate)
+    elif args.bench:
+        bench(args.bench)
+    else:
+        main()
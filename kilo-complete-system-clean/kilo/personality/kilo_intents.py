@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+kilo_intents.py — every phrase Kilo reacts to, compiled into one matcher.
+- Sources, highest priority first:
+    0  UI triggers   /etc/kilo/personality_triggers.json  [{pattern, reply}]
+    1  commands      persona_full.yaml offline_mode.command_set[*].phrase
+    2  rules         built-in table passed in by the caller (kilo_brain)
+    3  trigger words persona_full.yaml offline_mode.trigger_words
+  Within a source, earlier entries win.
+- All phrases are normalized (lowercase, straight quotes, single spaces) and
+  folded into a character trie, which is emitted as ONE regex with shared
+  prefixes factored out, e.g. (?:t(?:ell me a joke|ops\\s+down)|...). Each
+  position of the utterance is tried against the trie once, so matching
+  stays linear in the utterance no matter how many phrases there are.
+- Phrases only match on word boundaries: "hi" does not fire inside "this".
+- Overlapping phrases resolve leftmost-longest; among all hits the best
+  (priority, entry order) wins.
+- Build once per source change (kilo_brain hooks this to kilo_watch); match()
+  touches no files.
+- Fuzzy fallback for ASR slips (match_fuzzy, or best() = exact then fuzzy):
+  every phrase also gets a rough sound key (sound_key: vowel runs folded to
+  "a", doubled letters and spaces dropped), so "vesper" ~ "vespa" and
+  "key low" == "kilo". The keys go into a character trigram inverted index.
+  Each run of 1..N words in the utterance pulls candidates from the postings
+  of its own trigrams only (q-gram filter: k edits destroy at most 3k
+  trigrams), then a banded edit distance verifies them. Work grows with the
+  utterance and the hit lists, not with the number of phrases.
+  Allowed edits by key length: <4 none (too short to guess), 4 exact key,
+  5-7 one, 8-11 two, 12+ three; the first letter must agree, and a run with
+  more words than the phrase ("key low" for "kilo") must match its key exactly.
+"""
+import re, time, collections
+
+UI, COMMAND, RULE, TRIGGER = 0, 1, 2, 3
+SOURCE_NAMES = {UI: "ui", COMMAND: "command", RULE: "rule", TRIGGER: "trigger"}
+
+_QUOTES = str.maketrans({"’": "'", "‘": "'", "“": '"', "”": '"'})
+
+def normalize(text: str) -> str:
+    return " ".join((text or "").translate(_QUOTES).lower().split())
+
+_SOUND_SUBS = [(re.compile(a), b) for a, b in [
+    (r"[^a-z]", ""), (r"ph", "f"), (r"ck|q", "k"), (r"c(?=[eiy])", "s"), (r"c", "k"), (r"z", "s"),
+    (r"(?<=[aeiouy])[hw]", ""),          # "oh", "ow", "ey": the vowel is what's heard
+    (r"(?<!^)y|[aeiou]", "a"), (r"a+", "a"), (r"([a-z])\1+", r"\1")]]
+
+def sound_key(text: str) -> str:
+    """Rough spelling-free key: 'vesper' -> 'vaspar', 'key low' -> 'kala' == 'kilo'."""
+    k = normalize(text)
+    for rx, sub in _SOUND_SUBS:
+        k = rx.sub(sub, k)
+    return k
+
+def _grams(key: str):
+    k = "#" + key + "#"
+    return {k[i:i + 3] for i in range(len(k) - 2)}
+
+def max_edits(key: str) -> int:
+    n = len(key)
+    if n < 4: return -1
+    return 0 if n < 5 else 1 if n < 8 else 2 if n < 12 else 3
+
+def edit_distance(a: str, b: str, k: int) -> int:
+    """Levenshtein distance if it is <= k, else k + 1. Only the diagonal band is computed."""
+    if abs(len(a) - len(b)) > k:
+        return k + 1
+    big = k + 1
+    prev = [j if j <= k else big for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [i if i <= k else big] + [big] * len(b)
+        lo, hi = max(1, i - k), min(len(b), i + k)
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost, big)
+        if min(cur) > k:
+            return big
+        prev = cur
+    return prev[-1]
+
+def _trie_regex(node) -> str:
+    """{char: child, "": True at phrase ends} -> regex alternation with shared prefixes."""
+    end = "" in node
+    alts = []
+    for ch in sorted(k for k in node if k):
+        atom = r"\s+" if ch == " " else re.escape(ch)
+        alts.append(atom + _trie_regex(node[ch]))
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    if end:
+        # Greedy optional suffix: the longer phrase is tried first, the shorter one still matches.
+        return "(?:" + body + ")?" if len(alts) > 1 or len(alts[0]) > 1 else body + "?"
+    return body
+
+class IntentMatcher:
+    def __init__(self, entries=()):
+        """entries: iterable of (phrase, intent dict, priority)."""
+        t0 = time.perf_counter()
+        self._by_phrase = {}     # normalized phrase -> (rank, intent)
+        order = 0
+        for phrase, intent, prio in entries:
+            p = normalize(phrase)
+            if not p:
+                continue
+            rank = (prio, order)
+            order += 1
+            if p not in self._by_phrase or rank < self._by_phrase[p][0]:
+                self._by_phrase[p] = (rank, dict(intent, source=SOURCE_NAMES.get(prio, prio), phrase=p))
+        trie = {}
+        for p in self._by_phrase:
+            node = trie
+            for ch in p:
+                node = node.setdefault(ch, {})
+            node[""] = True
+        self._re = re.compile(r"(?<!\w)(?:" + _trie_regex(trie) + r")(?!\w)") if trie else None
+        # fuzzy index: sound key -> best (rank, intent, phrase); trigram -> key ids
+        best = {}
+        for p, (rank, intent) in self._by_phrase.items():
+            key = sound_key(p)
+            if max_edits(key) >= 0 and (key not in best or rank < best[key][0]):
+                best[key] = (rank, intent, p.count(" ") + 1)
+        self._keys = list(best)
+        self._key_hits = [best[k] for k in self._keys]
+        self._key_need = []
+        self._postings = collections.defaultdict(list)
+        for kid, key in enumerate(self._keys):
+            grams = _grams(key)
+            self._key_need.append(max(1, len(grams) - 3 * max_edits(key)))
+            for g in grams:
+                self._postings[g].append(kid)
+        self._max_words = min(6, max((p.count(" ") + 1 for p in self._by_phrase), default=0))
+        self.build_ms = round((time.perf_counter() - t0) * 1000.0, 3)
+
+    def __len__(self):
+        return len(self._by_phrase)
+
+    def matches(self, text: str):
+        """All phrase hits as (rank, intent), in utterance order."""
+        if self._re is None:
+            return []
+        low = normalize(text)
+        out = []
+        for m in self._re.finditer(low):
+            hit = self._by_phrase.get(" ".join(m.group(0).split()))
+            if hit:
+                out.append(hit)
+        return out
+
+    def match(self, text: str):
+        """Best intent for the utterance, or None."""
+        hits = self.matches(text)
+        return min(hits, key=lambda h: h[0])[1] if hits else None
+
+    def match_fuzzy(self, text: str):
+        """Closest phrase within its edit budget, as a copy of the intent with
+        fuzzy={"heard", "distance"}; None if nothing is close enough."""
+        words = [w for w in re.sub(r"[^\w\s']", " ", normalize(text)).split()]
+        found = None   # (distance, rank, intent, heard)
+        for n in range(1, min(len(words), self._max_words + 1) + 1):
+            for i in range(len(words) - n + 1):
+                heard = " ".join(words[i:i + n])
+                key = sound_key(heard)
+                if len(key) < 4:
+                    continue
+                counts = collections.Counter()
+                for g in _grams(key):
+                    counts.update(self._postings.get(g, ()))
+                for kid, c in counts.items():
+                    if c < self._key_need[kid]:
+                        continue
+                    cand = self._keys[kid]
+                    if cand[0] != key[0]:
+                        continue
+                    rank, intent, n_words = self._key_hits[kid]
+                    k = max_edits(cand) if n <= n_words else 0
+                    d = edit_distance(key, cand, k)
+                    if d > k:
+                        continue
+                    if found is None or (d, rank) < found[:2]:
+                        found = (d, rank, intent, heard)
+        if found is None:
+            return None
+        return dict(found[2], fuzzy={"heard": found[3], "distance": found[0]})
+
+    def best(self, text: str, fuzzy: bool = True):
+        """Exact match first; the fuzzy index only when nothing matched verbatim."""
+        return self.match(text) or (self.match_fuzzy(text) if fuzzy else None)
+
+    def stats(self):
+        return {"phrases": len(self._by_phrase), "build_ms": self.build_ms,
+                "regex_chars": len(self._re.pattern) if self._re else 0,
+                "fuzzy_keys": len(self._keys), "fuzzy_grams": len(self._postings)}
+
+def _phrases(v):
+    return [str(x) for x in v] if isinstance(v, (list, tuple)) else ([str(v)] if v else [])
+
+def entries_from(persona_full=None, triggers=None, rules=()):
+    """Collect (phrase, intent, priority) from every source. Bad entries are skipped."""
+    out = []
+    for t in triggers or []:
+        if isinstance(t, dict) and t.get("pattern") and t.get("reply"):
+            out.append((t["pattern"], {"name": "ui_trigger", "reply": str(t["reply"])}, UI))
+    off = (persona_full or {}).get("offline_mode") or {}
+    for c in off.get("command_set") or []:
+        if isinstance(c, dict) and c.get("name"):
+            intent = {"name": str(c["name"]), "reply": c.get("reply"), "actions": list(c.get("actions") or [])}
+            for p in _phrases(c.get("phrase")):
+                out.append((p, intent, COMMAND))
+    for phrases, intent in rules:
+        for p in _phrases(phrases):
+            out.append((p, intent, RULE))
+    for word, spec in (off.get("trigger_words") or {}).items():
+        react = (spec or {}).get("reaction") if isinstance(spec, dict) else None
+        if isinstance(react, dict) and react.get("line"):
+            intent = {"name": f"trigger:{word}", "reply": str(react["line"]),
+                      "eyes": react.get("eyes"), "sound": react.get("sound")}
+            out.append((str(word).replace("_", " "), intent, TRIGGER))
+    return out
+
+def build(persona_full=None, triggers=None, rules=()):
+    return IntentMatcher(entries_from(persona_full, triggers, rules))
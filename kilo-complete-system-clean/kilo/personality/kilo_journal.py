@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+kilo_journal.py — append-only journal of every command personalityd answers.
+- One compact JSON line per request:
+    {"t": receipt time (perf_counter, monotonic), "c": client id, "p": peer pid, "req": raw line,
+     "ok": bool, "ms": receipt-to-reply ms, "err": error (only on failure)}
+  Each file (and each daemon start) begins with a session line
+  {"session": n, "pid": ..., "wall": unix time, "t": monotonic} so replays
+  know where the monotonic clock restarted.
+- Ring of files with size-based rotation: journal.jsonl, journal.jsonl.1, ...
+  up to `keep` files of `max_bytes` each (env KILO_JOURNAL_MAX_BYTES, KILO_JOURNAL_KEEP).
+- record() only appends to an in-memory list; a background thread writes
+  batches with one os.write, so the socket loop never waits on the SD card.
+  If the writer falls behind by more than MAX_PENDING records, new ones are
+  dropped and counted rather than growing memory.
+- read(path) yields records oldest first across the rotated files.
+"""
+import os, sys, json, time, threading
+
+MAX_BYTES = int(os.environ.get("KILO_JOURNAL_MAX_BYTES", str(1024 * 1024)))
+KEEP = int(os.environ.get("KILO_JOURNAL_KEEP", "4"))
+MAX_PENDING = 4096
+FLUSH_SEC = 0.5
+
+class Journal:
+    def __init__(self, path, max_bytes=MAX_BYTES, keep=KEEP, log=None):
+        self.path = path
+        self.max_bytes = max(4096, max_bytes)
+        self.keep = max(1, keep)
+        self.log = log or (lambda msg: print(f"[kilo-journal] {msg}", file=sys.stderr, flush=True))
+        self._cv = threading.Condition()
+        self._pending = []
+        self._closed = False
+        self._session = 0
+        self.counters = {"records": 0, "bytes": 0, "rotations": 0, "dropped": 0, "errors": 0}
+        self._fd = None
+        self._size = 0
+        self._open()
+        self._header()
+        self._thread = threading.Thread(target=self._run, name="kilo-journal", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._in_file = 1 if self._size else 0   # records (or an older session) already in this file
+
+    def _header(self):
+        self._session += 1
+        line = json.dumps({"session": self._session, "pid": os.getpid(), "wall": round(time.time(), 3),
+                           "t": round(time.perf_counter(), 6)}, separators=(",", ":")) + "\n"
+        self._write(line.encode())
+
+    def _write(self, data):
+        os.write(self._fd, data)
+        self._size += len(data)
+        self.counters["bytes"] += len(data)
+
+    def _rotate(self):
+        os.close(self._fd)
+        for i in range(self.keep - 1, 0, -1):
+            src = self.path if i == 1 else f"{self.path}.{i - 1}"
+            try: os.replace(src, f"{self.path}.{i}")
+            except FileNotFoundError: pass
+        if self.keep == 1:
+            os.unlink(self.path)
+        self._open()
+        self.counters["rotations"] += 1
+        self._header()
+
+    def _append(self, batch):
+        """Write batch in as few os.write calls as the rotation boundaries allow."""
+        chunk, size, n = [], 0, 0
+        for r in batch:
+            line = (json.dumps(r, separators=(",", ":"), ensure_ascii=False) + "\n").encode()
+            if self._in_file + n and self._size + size + len(line) > self.max_bytes:
+                if chunk:
+                    self._write(b"".join(chunk))
+                    self._in_file += n
+                    self.counters["records"] += n
+                self._rotate()
+                chunk, size, n = [], 0, 0
+            chunk.append(line)
+            size += len(line)
+            n += 1
+        if chunk:
+            self._write(b"".join(chunk))
+            self._in_file += n
+            self.counters["records"] += n
+
+    def record(self, **rec):
+        """Queue one record; never blocks on I/O."""
+        with self._cv:
+            if self._closed:
+                return
+            if len(self._pending) >= MAX_PENDING:
+                self.counters["dropped"] += 1
+                return
+            self._pending.append(rec)
+            if len(self._pending) in (1, MAX_PENDING // 2):   # first record, or flush early in a flood
+                self._cv.notify()
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._pending and not self._closed:
+                    self._cv.wait()
+                if not self._closed:
+                    self._cv.wait(FLUSH_SEC)   # let a burst become one write
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            if batch:
+                try:
+                    self._append(batch)
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    self.log(f"warn: journal write failed: {e}")
+            if closed:
+                return
+
+    def stats(self):
+        with self._cv:
+            return dict(self.counters, pending=len(self._pending), path=self.path,
+                        max_bytes=self.max_bytes, keep=self.keep)
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            self._cv.notify()
+        self._thread.join(timeout=2.0)
+        try: os.close(self._fd)
+        except Exception: pass
+
+def files(path):
+    """Journal files oldest first."""
+    rotated = []
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        rotated.append(f"{path}.{i}")
+        i += 1
+    return list(reversed(rotated)) + ([path] if os.path.exists(path) else [])
+
+def read(path):
+    """Records oldest first. Each gets "rel": seconds since the first record, with the
+    idle gap between daemon sessions squeezed out, "boot": which daemon run (from 0) wrote
+    it, since client ids restart with the daemon, and "i": its position in the journal.
+    Session lines are skipped."""
+    offset = last = 0.0
+    pid = base = None
+    boot, i = -1, 0
+    for fn in files(path):
+        with open(fn, "r", encoding="utf-8", errors="replace") as f:
+            for ln in f:
+                try:
+                    rec = json.loads(ln)
+                except ValueError:
+                    continue   # torn last line from a crash
+                if "session" in rec:
+                    if rec.get("pid") != pid or rec.get("session") == 1:   # new daemon, new monotonic clock
+                        pid, base, offset = rec.get("pid"), None, last
+                        boot += 1
+                    continue
+                if "t" not in rec or "req" not in rec:
+                    continue
+                if base is None:
+                    base = rec["t"]
+                rec["rel"] = last = offset + max(0.0, rec["t"] - base)
+                rec["boot"], rec["i"] = max(boot, 0), i
+                i += 1
+                yield rec
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+kilo_metrics.py — cheap in-process counters and latency histograms.
+- Histogram: fixed log-spaced buckets (10 µs .. ~100 s, ~19% wide), so an
+  observation is one bisect plus an increment and memory never grows.
+  Percentiles are reported as the upper edge of the bucket they fall in.
+- Metrics: named histograms and counters behind one lock; snapshot() returns
+  plain JSON-able dicts in milliseconds.
+"""
+import time, bisect, threading
+
+_BOUNDS = []
+_b = 10e-6
+while _b < 100.0:
+    _BOUNDS.append(_b)
+    _b *= 2 ** 0.25
+
+class Histogram:
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p: float):
+        if not self.count:
+            return None
+        rank, seen = p / 100.0 * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(_BOUNDS[i], self.max) if i < len(_BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        ms = lambda s: None if s is None else round(s * 1000.0, 3)
+        return {"count": self.count,
+                "mean_ms": ms(self.total / self.count) if self.count else None,
+                "p50_ms": ms(self.percentile(50)), "p95_ms": ms(self.percentile(95)),
+                "p99_ms": ms(self.percentile(99)), "max_ms": ms(self.max) if self.count else None}
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.hists = {}
+            self.counters = {}
+            self.commands = {}   # cmd -> [count, errors, Histogram]
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            h = self.hists.get(name)
+            if h is None:
+                h = self.hists[name] = Histogram()
+            h.observe(seconds)
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def command(self, cmd: str, seconds: float, ok: bool):
+        with self._lock:
+            row = self.commands.get(cmd)
+            if row is None:
+                row = self.commands[cmd] = [0, 0, Histogram()]
+            row[0] += 1
+            row[1] += 0 if ok else 1
+            row[2].observe(seconds)
+
+    def timer(self, name: str):
+        return _Timer(self, name)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_sec": round(time.time() - self.started, 1),
+                "commands": {c: dict(r[2].summary(), errors=r[1]) for c, r in sorted(self.commands.items())},
+                "latency": {n: h.summary() for n, h in sorted(self.hists.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+class _Timer:
+    __slots__ = ("m", "name", "t0")
+
+    def __init__(self, m, name):
+        self.m, self.name = m, name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.m.observe(self.name, time.perf_counter() - self.t0)
+        return False
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+kilo_persona.py — compiled persona bundle (install as kilo-persona).
+- `kilo-persona compile` parses persona.json, people.json, quips.yaml and
+  persona_full.yaml once, validates them (kilo_watch's structural checks plus
+  the `validation` section of persona_full.yaml, see CHECKS) and writes
+  persona.bundle next to them: MAGIC + marshal({format, version, built,
+  sources}). Each source is kept as its own marshal blob together with the
+  (mtime_ns, size, inode) it was compiled from. A source holding values
+  marshal can't store (YAML dates/timestamps) is left out with a warning
+  naming the key, and keeps being parsed from the file.
+- Scope: only services that load through kilo_watch (personalityd,
+  kilo_brain and what imports it) read the bundle. The face bridges still
+  read people.json themselves, and the bundle holds the parsed files as they
+  are; each service builds its own tables from them.
+- kilo_watch's loaders call lookup(path) first. When persona.bundle sits next
+  to the file and was compiled from exactly this version of it, the value
+  is unmarshalled from the blob (no YAML/JSON parsing). Otherwise (no bundle,
+  another format or Python, or the file was edited since) lookup() says
+  MISSING and the file is parsed as before, so a hand edit takes effect at
+  once and compiling is never required. Env KILO_PERSONA_BUNDLE=0 turns the
+  bundle off.
+- version is the sha256 of the source bytes (12 hex digits). status(base)
+  reports it with the files it is still current for; personalityd logs it at
+  start and returns it in `status` as "persona".
+- `kilo-persona check` validates without writing; `kilo-persona show` prints
+  the bundle header. Errors fail compile; warnings are printed only.
+"""
+import os, re, sys, json, time, marshal, hashlib, argparse
+
+BASE = os.environ.get("KILO_PERSONALITY_DIR", "/opt/kilo/personality")
+BUNDLE_NAME = "persona.bundle"
+FORMAT = 1
+MAGIC = b"KILOPB%d py%d.%d\n" % (FORMAT, sys.version_info[0], sys.version_info[1])   # marshal is per-Python
+ENABLED = os.environ.get("KILO_PERSONA_BUNDLE", "1") != "0"
+SOURCES = {"persona": "persona.json", "people": "people.json",
+           "quips": "quips.yaml", "persona_full": "persona_full.yaml"}
+MISSING = object()
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+# ---- Reading (every service, via kilo_watch) ----
+_BUNDLES = {}   # bundle path -> (stamp, parsed bundle or None)
+
+def read(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"{path}: not a format {FORMAT} bundle for this Python")
+    return marshal.loads(raw[len(MAGIC):])
+
+def _bundle(path):
+    st = _stamp(path)
+    if st is None:
+        return None
+    hit = _BUNDLES.get(path)
+    if hit and hit[0] == st:
+        return hit[1]
+    try:
+        b = read(path)
+    except Exception as e:
+        print(f"[kilo-persona] warn: ignoring {path}: {e}", file=sys.stderr, flush=True)
+        b = None
+    _BUNDLES[path] = (st, b)
+    return b
+
+def lookup(path):
+    """Parsed content of path from the bundle beside it, or MISSING if the bundle can't vouch for it."""
+    if not ENABLED:
+        return MISSING
+    d, name = os.path.split(os.path.abspath(path))
+    b = _bundle(os.path.join(d, BUNDLE_NAME))
+    src = b and b["sources"].get(name)
+    if not src or tuple(src["stamp"]) != _stamp(path):
+        return MISSING
+    return marshal.loads(src["blob"])   # fresh objects every time, like a parse
+
+def status(base=BASE):
+    """{version, built, current, stale} of the bundle in base, or None when there is none to use."""
+    if not ENABLED:
+        return None
+    b = _bundle(os.path.join(base, BUNDLE_NAME))
+    if not b:
+        return None
+    current = sorted(fn for fn, s in b["sources"].items() if tuple(s["stamp"]) == _stamp(os.path.join(base, fn)))
+    return {"version": b["version"], "built": b["built"], "current": current,
+            "stale": sorted(fn for fn in SOURCES.values() if fn not in current)}
+
+# ---- Validation ----
+def _sentences(line):
+    # "…" mid-line is a pause, not a full stop
+    return max(1, len(re.findall(r"[.!?]+[\"'”’)\]]*(?=\s|$)", line.strip())))
+
+def _steps(full):
+    off = full.get("offline_mode") or {}
+    demo = off.get("demo_mode") or {}
+    yield "demo_mode", demo.get("sequence") or [], demo.get("duration_seconds")
+    for name, spec in (off.get("sequences") or {}).items():
+        spec = spec or {}
+        yield f"sequences.{name}", spec.get("sequence") or [], spec.get("duration_seconds")
+
+def _as_list(v):
+    return [x for x in (v if isinstance(v, list) else [v]) if isinstance(x, str) and x]
+
+def _lines(data):
+    """(where, text) for every canned line Kilo can say."""
+    full, quips = data["persona_full"], data["quips"]
+    off = full.get("offline_mode") or {}
+    for c in off.get("command_set") or []:
+        if isinstance(c, dict) and c.get("reply"):
+            yield f"command {c.get('name')}", str(c["reply"])
+    for word, spec in (off.get("trigger_words") or {}).items():
+        line = ((spec or {}).get("reaction") or {}).get("line")
+        if line:
+            yield f"trigger {word}", str(line)
+    for where, steps, _ in _steps(full):
+        for st in steps:
+            if isinstance(st, dict) and st.get("line"):
+                yield f"{where}.{st.get('step')}", str(st["line"])
+    for i, ex in enumerate(((full.get("love_interest") or {}).get("examples")) or []):
+        yield f"love_interest.examples[{i}]", str(ex)
+    unsure = ((full.get("conversation") or {}).get("response_rules") or {}).get("uncertainty_line")
+    if unsure:
+        yield "conversation.uncertainty_line", str(unsure)
+    for cat, items in (quips or {}).items():
+        for i, it in enumerate(items if isinstance(items, list) else []):
+            text = it.get("text") if isinstance(it, dict) else it
+            if isinstance(text, str):
+                yield f"quips.{cat}[{i}]", text
+
+def _eyes_used(full):
+    """(where, eye state) for every eyes reference."""
+    off = full.get("offline_mode") or {}
+    for word, spec in (off.get("trigger_words") or {}).items():
+        for e in _as_list(((spec or {}).get("reaction") or {}).get("eyes")):
+            yield f"trigger {word}", e
+    for name, t in (full.get("tones") or {}).items():
+        for e in _as_list((t or {}).get("eyes")):
+            yield f"tones.{name}", e
+    for name, t in ((full.get("states_and_eyes") or {}).get("transitions") or {}).items():
+        for k in ("from", "to"):
+            for e in _as_list((t or {}).get(k)):
+                if e != "any":
+                    yield f"transitions.{name}.{k}", e
+    for where, steps, _ in _steps(full):
+        for st in steps:
+            for e in _as_list((st or {}).get("eyes")):
+                yield f"{where}.{(st or {}).get('step')}", e
+    for e in _as_list((((full.get("love_interest") or {}).get("behavior") or {}).get("on_mention") or {}).get("eyes")):
+        yield "love_interest.on_mention", e
+
+def check_sentences(data, base):
+    limit = int(((data["persona_full"].get("conversation") or {}).get("response_rules") or {}).get("max_sentences")
+                or (data["persona"].get("tone") or {}).get("max_sentences") or 2)
+    return [("error", f"{where}: {_sentences(line)} sentences (max {limit}): {line!r}")
+            for where, line in _lines(data) if _sentences(line) > limit]
+
+def check_tone(data, base):
+    states = (data["persona_full"].get("voice") or {}).get("emotional_states_map") or {}
+    return [("error", f"{where}: eyes '{e}' has no tone in voice.emotional_states_map")
+            for where, e in _eyes_used(data["persona_full"]) if e not in states]
+
+def check_vision_labels(data, base):
+    full = data["persona_full"]
+    labels = ((full.get("vision") or {}).get("objects_initial")) or []
+    triggers = ((full.get("offline_mode") or {}).get("trigger_words")) or {}
+    moves = ((full.get("states_and_eyes") or {}).get("transitions")) or {}
+    out = []
+    for event in ("vespa", "dodge"):
+        if not any(str(l) == event or str(l).startswith(event + "_") for l in labels):
+            out.append(("error", f"vision.objects_initial has no '{event}' label"))
+        react = ((triggers.get(event) or {}).get("reaction")) or {}
+        if not react:
+            out.append(("error", f"'{event}' label has no trigger_words reaction"))
+        if event not in moves:
+            out.append(("error", f"'{event}' label has no states_and_eyes transition"))
+        elif react.get("eyes") and react["eyes"] != (moves[event] or {}).get("to"):
+            out.append(("error", f"'{event}': reaction eyes '{react['eyes']}' but transition goes to "
+                                 f"'{(moves[event] or {}).get('to')}'"))
+    return out
+
+SPEECH_CPS = 14.0   # rough kilosay speaking rate, characters per second
+
+def check_speech_overlap(data, base):
+    """A step's sound must not start while the previous step's line is still being spoken."""
+    out = []
+    sounds = set(((data["persona_full"].get("audio") or {}).get("files")) or {})
+    for where, steps, total in _steps(data["persona_full"]):
+        steps = [s for s in steps if isinstance(s, dict)]
+        even = float(total) / len(steps) if total and steps else None
+        for prev, st in zip(steps, steps[1:]):
+            if not prev.get("line") or prev.get("speak") is False or not st.get("sound"):
+                continue
+            sec = prev.get("seconds", even)
+            need = len(str(prev["line"])) / SPEECH_CPS
+            if sec is not None and float(sec) < need:
+                out.append(("warn", f"{where}.{st.get('step')}: sound starts {sec}s in, "
+                                    f"'{prev.get('step')}' line needs ~{need:.1f}s"))
+    for where, steps, _ in _steps(data["persona_full"]):
+        for st in steps:
+            for snd in _as_list((st or {}).get("sound")):
+                if snd not in sounds:
+                    out.append(("warn", f"{where}.{(st or {}).get('step')}: sound '{snd}' not in audio.files"))
+    return out
+
+def check_eye_assets(data, base):
+    files = ((data["persona_full"].get("states_and_eyes") or {}).get("files")) or {}
+    out, seen = [], set()
+    for where, e in _eyes_used(data["persona_full"]):
+        if e not in files:
+            out.append(("error", f"{where}: eyes '{e}' has no asset in states_and_eyes.files"))
+        elif e not in seen and os.path.isdir(os.path.join(base, "eyes")) \
+                and not os.path.exists(os.path.join(base, "eyes", str(files[e]))):
+            out.append(("warn", f"eyes '{e}': {files[e]} missing from {os.path.join(base, 'eyes')}"))
+        seen.add(e)
+    return out
+
+def check_toasts(data, base):
+    cmds = ((data["persona_full"].get("offline_mode") or {}).get("command_set")) or []
+    return [("error", f"command {c.get('name') if isinstance(c, dict) else c!r}: no reply to confirm with")
+            for c in cmds if not (isinstance(c, dict) and str(c.get("reply") or "").strip())]
+
+# validation section wording -> check
+CHECKS = {
+    "response <= 2 sentences": check_sentences,
+    "tone matches state/tags": check_tone,
+    "vespa/dodge labels map to correct events": check_vision_labels,
+    "no overlap with speech": check_speech_overlap,
+    "eyes state transitions visible": check_eye_assets,
+    "toast confirmations present": check_toasts,
+}
+
+def validate(data, base):
+    """[(level, group, message)] for the persona_full `validation` section."""
+    out = []
+    for group, items in ((data["persona_full"].get("validation")) or {}).items():
+        for item in _as_list(items):
+            fn = CHECKS.get(" ".join(item.lower().split()))
+            if fn is None:
+                out.append(("warn", group, f"no automatic check for {item!r}"))
+                continue
+            out.extend((lvl, group, f"{item}: {msg}") for lvl, msg in fn(data, base))
+    return out
+
+# ---- Compiling ----
+def _parse(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+    if path.endswith(".json"):
+        return raw, json.loads(raw)
+    import yaml  # PyYAML assumed present earlier
+    return raw, yaml.safe_load(raw)
+
+def _unmarshallable(value, where=""):
+    """Key path of the first value marshal can't store (YAML turns 2024-01-01 into a date), or None."""
+    if isinstance(value, dict):
+        for k, v in value.items():
+            bad = _unmarshallable(v, f"{where}.{k}" if where else str(k))
+            if bad:
+                return bad
+        return None
+    if isinstance(value, (list, tuple)):
+        for i, v in enumerate(value):
+            bad = _unmarshallable(v, f"{where}[{i}]")
+            if bad:
+                return bad
+        return None
+    try: marshal.dumps(value)
+    except ValueError: return f"{where or '<top>'} ({type(value).__name__})"
+    return None
+
+def compile_bundle(base=BASE, out=None, write=True):
+    """Parse + validate the sources in base; write the bundle unless there are errors.
+    Returns (bundle dict or None, problems)."""
+    import kilo_watch
+    checks = {"persona": kilo_watch.check_persona, "people": kilo_watch.check_people,
+              "quips": kilo_watch.check_quips, "persona_full": kilo_watch.check_persona_full}
+    data, sources, digest, problems = {}, {}, hashlib.sha256(), []
+    for name, fn in SOURCES.items():
+        path = os.path.join(base, fn)
+        st = _stamp(path)
+        try:
+            raw, value = _parse(path)
+            checks[name](value)   # the same checks a service applies when it loads the file
+        except Exception as e:
+            problems.append(("error", name, f"{path}: {e}"))
+            continue
+        if _stamp(path) != st:
+            problems.append(("error", name, f"{path} changed while compiling; run again"))
+            continue
+        data[name] = value
+        digest.update(fn.encode() + b"\0" + raw + b"\0")
+        try:
+            blob = marshal.dumps(value)
+        except ValueError:
+            problems.append(("warn", name, f"{path}: not bundled, {_unmarshallable(value)} can't be stored; "
+                                           f"quote it to bundle this file (it is parsed as before)"))
+            continue
+        sources[fn] = {"stamp": st, "sha256": hashlib.sha256(raw).hexdigest(), "blob": blob}
+    if len(data) == len(SOURCES):
+        problems.extend(validate(data, base))
+    if any(p[0] == "error" for p in problems):
+        return None, problems
+    bundle = {"format": FORMAT, "version": digest.hexdigest()[:12], "built": round(time.time(), 3),
+              "sources": sources}
+    if write:
+        out = out or os.path.join(base, BUNDLE_NAME)
+        tmp = f"{out}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + marshal.dumps(bundle))
+        os.replace(tmp, out)
+    return bundle, problems
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="kilo-persona", description="Validate and compile Kilo's persona files")
+    sub = ap.add_subparsers(dest="what", required=True)
+    for name, help_ in (("compile", "validate and write persona.bundle"), ("check", "validate only"),
+                        ("show", "print the bundle header")):
+        p = sub.add_parser(name, help=help_)
+        p.add_argument("--base", default=BASE, help="dir with the persona files (default %(default)s)")
+        if name != "check":
+            p.add_argument("--bundle", help=f"bundle path (default: <base>/{BUNDLE_NAME})")
+    args = ap.parse_args(argv)
+    if args.what == "show":
+        path = args.bundle or os.path.join(args.base, BUNDLE_NAME)
+        b = read(path)
+        fresh = {fn: tuple(s["stamp"]) == _stamp(os.path.join(os.path.dirname(os.path.abspath(path)), fn))
+                 for fn, s in b["sources"].items()}
+        print(json.dumps({"format": b["format"], "version": b["version"], "built": b["built"],
+                          "current": fresh, "bytes": os.path.getsize(path)}, indent=2))
+        return 0
+    t0 = time.perf_counter()
+    bundle, problems = compile_bundle(args.base, getattr(args, "bundle", None), write=args.what == "compile")
+    for lvl, group, msg in problems:
+        print(f"[kilo-persona] {lvl}: {group}: {msg}", file=sys.stderr)
+    if bundle is None:
+        print(f"[kilo-persona] {args.what} failed", file=sys.stderr)
+        return 1
+    ms = (time.perf_counter() - t0) * 1000.0
+    print(f"[kilo-persona] {'compiled' if args.what == 'compile' else 'checked'} version {bundle['version']} "
+          f"({len(problems)} warnings, {ms:.0f} ms)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
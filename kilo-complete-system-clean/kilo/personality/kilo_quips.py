@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+kilo_quips.py — quips.yaml, parsed once and indexed for fast picks.
+- Each category is an array of entries sorted by min_snark, so the entries a
+  snark level unlocks are a prefix found with one bisect.
+- Picks come from a shuffle bag per (category, unlocked prefix): every line
+  plays once before any repeats, and a refill never starts with the line
+  that just played.
+- Templates ({name}, {vehicle_brand}, ...) are split into literal/field parts
+  at load time; missing fields render from DEFAULTS.
+"""
+import os, bisect, random, string, threading
+
+QUIPS_YAML = "/opt/kilo/personality/quips.yaml"
+DEFAULT_SNARK = int(os.environ.get("KILO_SNARK", "5"))
+DEFAULTS = {"name": "there", "vehicle_brand": "ride", "vehicle": "ride"}
+
+class Template:
+    __slots__ = ("text", "parts")
+
+    def __init__(self, text: str):
+        self.text = text
+        try:
+            self.parts = [(lit, field) for lit, field, _, _ in string.Formatter().parse(text)]
+        except ValueError:
+            self.parts = [(text, None)]  # unbalanced braces: treat as plain text
+
+    def render(self, ctx=None) -> str:
+        if len(self.parts) == 1 and self.parts[0][1] is None:
+            return self.parts[0][0]
+        ctx = ctx or {}
+        out = []
+        for lit, field in self.parts:
+            out.append(lit)
+            if field is not None:
+                val = ctx.get(field)
+                out.append(str(val if val not in (None, "") else DEFAULTS.get(field, "")))
+        return "".join(out)
+
+class _Category:
+    __slots__ = ("mins", "templates", "bags", "last")
+
+    def __init__(self, entries):
+        entries.sort(key=lambda e: e[0])
+        self.mins = [m for m, _ in entries]
+        self.templates = [Template(t) for _, t in entries]
+        self.bags = {}    # unlocked prefix length -> remaining shuffled indices
+        self.last = None
+
+class QuipEngine:
+    def __init__(self, data=None, rng=None):
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._cats = {}
+        for cat, items in (data or {}).items():
+            if not isinstance(items, list):
+                continue
+            entries = []
+            for it in items:
+                if isinstance(it, str):
+                    entries.append((0, it))
+                elif isinstance(it, dict) and it.get("text"):
+                    try: entries.append((int(it.get("min_snark", 0) or 0), str(it["text"])))
+                    except (TypeError, ValueError): continue
+            if entries:
+                self._cats[str(cat)] = _Category(entries)
+
+    @classmethod
+    def load(cls, path=QUIPS_YAML, rng=None):
+        """Parse quips.yaml; an unreadable file gives an empty engine (callers keep their defaults)."""
+        try:
+            import yaml  # PyYAML assumed present earlier
+            with open(path, "r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+            return cls(data if isinstance(data, dict) else {}, rng)
+        except Exception:
+            return cls({}, rng)
+
+    def categories(self):
+        return sorted(self._cats)
+
+    def has(self, category: str, snark: int = DEFAULT_SNARK) -> bool:
+        cat = self._cats.get(category)
+        return bool(cat) and bisect.bisect_right(cat.mins, snark) > 0
+
+    def pick(self, category: str, snark: int = DEFAULT_SNARK, default=None, **ctx):
+        """A rendered line from category unlocked at this snark level, else default."""
+        cat = self._cats.get(category)
+        if cat is None:
+            return default
+        k = bisect.bisect_right(cat.mins, snark)
+        if k == 0:
+            return default
+        with self._lock:
+            bag = cat.bags.get(k)
+            if not bag:
+                bag = cat.bags[k] = list(range(k))
+                self.rng.shuffle(bag)
+                if k > 1 and bag[-1] == cat.last:
+                    bag[0], bag[-1] = bag[-1], bag[0]
+            i = bag.pop()
+            cat.last = i
+        return cat.templates[i].render(ctx)
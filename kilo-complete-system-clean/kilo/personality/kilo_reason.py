@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+kilo_reason.py — streaming reasoning backends for kilo_brain.
+- Backend protocol: any object with stream(prompt, cancel) yielding text
+  chunks (tokens). It should check cancel (a threading.Event) between chunks
+  and stop as soon as it is set.
+- load(spec) picks one from env KILO_REASONER:
+    ""/off            no backend (rules only)
+    stub[:token_sec]  StubBackend, canned answers at a fixed token rate
+    pkg.module:Class  anything importable, constructed without arguments
+- Stream runs a backend on a worker thread and cuts its output into
+  sentences as they complete. Each sentence goes through `post` (Kilo's
+  seasoning) and then on_sentence, so the first one can be spoken while the
+  rest is still being generated. Stops on cancel(), on the first-token or
+  total timeout, or once max_sentences / max_chars is reached (the persona
+  asks for <= 2 sentences), and tells the backend to stop too.
+"""
+import os, re, time, queue, random, threading, importlib
+
+FIRST_TIMEOUT = float(os.environ.get("KILO_REASON_FIRST_TIMEOUT", "3.0"))
+TIMEOUT = float(os.environ.get("KILO_REASON_TIMEOUT", "8.0"))
+MAX_SENTENCES = 2
+MAX_CHARS = 220
+
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+
+class StubBackend:
+    """Local stand-in for a model: canned answers, one word per token_sec."""
+    ANSWERS = [
+        "Good question. Short answer is yes, but don’t quote me on it. Ask me again after an oil change.",
+        "I ran the numbers in my head. They came out shiny and chrome, so I’m calling that a win.",
+        "Honestly? No idea. But I’ll say it with confidence, which is basically the same thing.",
+    ]
+
+    def __init__(self, token_sec=0.05, first_token_sec=None, text=None, rng=None):
+        self.token_sec = float(token_sec)
+        self.first_token_sec = self.token_sec if first_token_sec is None else float(first_token_sec)
+        self.text = text
+        self.rng = rng or random.Random()
+
+    def stream(self, prompt, cancel):
+        words = (self.text or self.rng.choice(self.ANSWERS)).split(" ")
+        for i, w in enumerate(words):
+            if cancel.wait(self.first_token_sec if i == 0 else self.token_sec):
+                return
+            yield w + (" " if i < len(words) - 1 else "")
+
+def load(spec=None):
+    spec = (os.environ.get("KILO_REASONER", "") if spec is None else spec).strip()
+    if not spec or spec.lower() in ("0", "off", "none"):
+        return None
+    if spec.split(":", 1)[0] == "stub":
+        _, _, sec = spec.partition(":")
+        return StubBackend(float(sec) if sec else 0.05)
+    mod, _, cls = spec.partition(":")
+    return getattr(importlib.import_module(mod), cls or "Backend")()
+
+class Stream:
+    def __init__(self, backend, prompt, on_sentence=None, post=None, first_timeout=FIRST_TIMEOUT,
+                 timeout=TIMEOUT, max_sentences=MAX_SENTENCES, max_chars=MAX_CHARS):
+        self.backend, self.prompt = backend, prompt
+        self.on_sentence = on_sentence
+        self.post = post or (lambda s: s)
+        self.first_timeout, self.timeout = first_timeout, timeout
+        self.max_sentences, self.max_chars = max_sentences, max_chars
+        self._cancel = threading.Event()
+        self.stopped = None
+
+    def cancel(self, why="cancelled"):
+        if self.stopped is None:
+            self.stopped = why
+        self._cancel.set()
+
+    def _produce(self, q):
+        try:
+            for tok in self.backend.stream(self.prompt, self._cancel):
+                q.put(tok)
+                if self._cancel.is_set():
+                    break
+        except Exception as e:
+            q.put(e)
+            return
+        q.put(None)
+
+    def run(self):
+        """Blocks until the answer is complete or stopped. Returns text plus timings."""
+        t0 = time.perf_counter()
+        q = queue.Queue()
+        threading.Thread(target=self._produce, args=(q,), name="kilo-reason", daemon=True).start()
+        buf, out, chars, tokens = "", [], 0, 0
+        first_token = first_sentence = None
+        error = None
+
+        def emit(sentence):
+            nonlocal chars, first_sentence
+            sentence = sentence.strip()
+            if not sentence:
+                return True
+            if chars + len(sentence) > self.max_chars:
+                room = self.max_chars - chars
+                if out or room < 20:
+                    return False
+                sentence = sentence[:room].rsplit(" ", 1)[0] + "…"
+            sentence = self.post(sentence)
+            out.append(sentence)
+            chars += len(sentence) + 1
+            if first_sentence is None:
+                first_sentence = time.perf_counter() - t0
+            if self.on_sentence and not self._cancel.is_set():
+                self.on_sentence(sentence)
+            return len(out) < self.max_sentences
+
+        while not self._cancel.is_set():
+            limit = self.first_timeout if first_token is None else self.timeout
+            remaining = t0 + limit - time.perf_counter()
+            try:
+                tok = q.get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                self.cancel("timeout")
+                break
+            if tok is None:
+                break
+            if isinstance(tok, Exception):
+                error = str(tok)
+                self.cancel("error")
+                break
+            tokens += 1
+            if first_token is None:
+                first_token = time.perf_counter() - t0
+            buf += tok
+            more = True
+            while more:
+                m = _SENTENCE_END.search(buf)
+                if not m:
+                    break
+                sentence, buf = buf[:m.end()], buf[m.end():]
+                more = emit(sentence)
+            if not more:
+                self.cancel("limit")
+        if self.stopped is None and buf.strip():
+            emit(buf)            # generation finished without closing punctuation
+        if self.stopped == "timeout" and not out and buf.strip():
+            emit(buf + "…")      # better half a thought than silence
+        ms = lambda s: None if s is None else round(s * 1000.0, 1)
+        return {"text": " ".join(out), "sentences": len(out), "tokens": tokens,
+                "first_token_ms": ms(first_token), "first_sentence_ms": ms(first_sentence),
+                "total_ms": ms(time.perf_counter() - t0), "stopped": self.stopped, "error": error}
@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 """
-kilo_soundd.py — watches /opt/kilo/personality/state.json and plays sound cues.
+kilo_soundd.py — plays sound cues pushed by personalityd.
+- Subscribes to the "sound" topic on /opt/kilo/personality/kilo.sock, so cues
+  play as soon as they are set; falls back to polling the shared-memory state
+  segment (or state.json) once a second while the daemon is unreachable.
 - No external Python deps.
 - Uses aplay if available, otherwise ffplay (ffmpeg).
 - Avoids overlapping playback: stops the last sound before starting a new one.
 """
-import json, os, time, subprocess, shutil, signal, sys
+import json, os, time, subprocess, shutil, signal, socket, sys
+import kilo_state
 
-STATE = "/opt/kilo/personality/state.json"
+STATE = kilo_state.STATE_JSON
+SOCK = kilo_state.SOCK
 SOUNDS = "/opt/kilo/personality/sounds/engine"
 
 # Map logical cues -> filenames (adjust as needed)
@@ -47,39 +52,73 @@ def stop(proc):
         pass
 
 def load_state():
-    try:
-        with open(STATE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    return kilo_state.read_state(STATE)
 
-def main():
+def _subscribe():
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(2.0)
+    s.connect(SOCK)
+    s.sendall(b"subscribe sound\n")
+    rf = s.makefile("rb")
+    ack = json.loads(rf.readline() or b"{}")
+    if not ack.get("ok"):
+        s.close()
+        raise ConnectionError(ack.get("error", "subscribe refused"))
+    s.settimeout(None)
+    return s, rf, ack.get("state") or {}
+
+def cues():
+    """Yield each cue to act on. Pushed cues always fire; polled cues only on change."""
     last = None
+    while True:
+        try:
+            s, rf, snap = _subscribe()
+        except (OSError, ValueError):
+            cue = load_state().get("sound_cue")
+            if cue != last:
+                yield cue
+                last = cue
+            time.sleep(1.0)
+            continue
+        print("[kilo-sound] subscribed to personalityd", flush=True)
+        try:
+            if snap.get("sound_cue") != last:
+                last = snap.get("sound_cue")
+                yield last
+            for line in rf:
+                try: delta = json.loads(line).get("delta") or {}
+                except ValueError: continue
+                if "sound_cue" in delta:
+                    last = delta["sound_cue"]
+                    yield last
+        except OSError:
+            pass
+        finally:
+            try: s.close()
+            except Exception: pass
+        print("[kilo-sound] lost personalityd; polling state", flush=True)
+
+def main():
     proc = None
     print("[kilo-sound] starting; player:", PLAYER or "none", flush=True)
     try:
-        while True:
-            s = load_state()
-            cue = s.get("sound_cue")
-            if cue != last and cue:
-                fname = CUES.get(cue)
-                if fname:
-                    path = os.path.join(SOUNDS, fname)
-                    if os.path.exists(path):
-                        print(f"[kilo-sound] play {cue} -> {fname}", flush=True)
-                        stop(proc)
-                        proc = play(path)
-                    else:
-                        print(f"[kilo-sound] missing file for {cue}: {path}", flush=True)
-                else:
-                    # Unknown cue; ignore quietly
-                    pass
-                last = cue
+        for cue in cues():
             # If cue cleared (None), stop any current playback
             if cue in (None, "", "none"):
                 stop(proc); proc = None
-                last = cue
-            time.sleep(1.0)
+                continue
+            fname = CUES.get(cue)
+            if fname:
+                path = os.path.join(SOUNDS, fname)
+                if os.path.exists(path):
+                    print(f"[kilo-sound] play {cue} -> {fname}", flush=True)
+                    stop(proc)
+                    proc = play(path)
+                else:
+                    print(f"[kilo-sound] missing file for {cue}: {path}", flush=True)
+            else:
+                # Unknown cue; ignore quietly
+                pass
     except KeyboardInterrupt:
         pass
     finally:
@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
-import http.server, socketserver, urllib.parse, json, subprocess, shlex
+"""
+kilo_speak_http.py — GET /speak?text=...[&priority=safety|reply|quip]
+Queues the line on personalityd's speech arbiter and returns right away.
+safety preempts everything, so HTTP callers get it only from the addresses in
+env KILO_SPEAK_SAFETY_FROM (comma-separated, default none); others get 403.
+"""
+import http.server, socketserver, urllib.parse, json, os
+import kilo_speech
 
 HOST="127.0.0.1"; PORT=7862
-def speak(text):
-    return subprocess.call(["/usr/local/bin/kilosay", text])
+SAFETY_FROM={a.strip() for a in os.environ.get("KILO_SPEAK_SAFETY_FROM","").split(",") if a.strip()}
+def speak(text, priority="reply"):
+    return kilo_speech.say(text, priority)
 
 class H(http.server.BaseHTTPRequestHandler):
     def _send(self, code, obj):
@@ -19,8 +27,13 @@ class H(http.server.BaseHTTPRequestHandler):
                 q=urllib.parse.parse_qs(p.query or "")
                 text=(q.get("text",[""])[0]).strip()
                 if not text: return self._send(400, {"ok":False,"error":"missing text"})
-                rc=speak(text)
-                return self._send(200, {"ok": rc==0})
+                prio=(q.get("priority",["reply"])[0]).strip().lower() or "reply"
+                if prio not in kilo_speech.PRIORITIES:
+                    return self._send(400, {"ok":False,"error":f"unknown priority {prio}"})
+                if prio=="safety" and self.client_address[0] not in SAFETY_FROM:
+                    return self._send(403, {"ok":False,"error":"safety priority not allowed from this address"})
+                resp=speak(text, prio)
+                return self._send(200 if resp.get("ok") else 502, resp)
             return self._send(404, {"ok":False,"error":"not found"})
         except Exception as e:
             return self._send(500, {"ok":False,"error":str(e)})
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+kilo_speech.py — one speech queue for every Kilo front end.
+- SpeechArbiter: single worker thread that runs kilosay one line at a time.
+  Priority classes: safety > reply > quip. A higher-priority line preempts
+  (kills) a lower-priority line that is playing; equal priorities queue FIFO.
+  The same line submitted again while it is queued or playing, or within the
+  dedupe window after it started playing, is collapsed. A line that was
+  cancelled, preempted or dropped before finishing can be submitted again.
+- personalityd owns the only arbiter; other services submit through say(),
+  which sends {"cmd":"say",...} over /opt/kilo/personality/kilo.sock.
+- Time-to-first-audio is measured from submit to the kilosay process start.
+"""
+import os, re, time, signal, subprocess, threading, itertools, heapq, collections
+import kilo_state
+
+SOCK = kilo_state.SOCK
+KILOSAY = "/usr/local/bin/kilosay"
+PRIORITIES = {"safety": 0, "reply": 1, "quip": 2}
+DEDUPE_SEC = float(os.environ.get("KILO_SPEECH_DEDUPE_SEC", "4.0"))
+MAX_DEPTH = 16   # queued lines; past this the lowest-priority, newest line is dropped
+
+def _norm(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def _pct(vals, p):
+    if not vals: return None
+    s = sorted(vals)
+    return s[min(len(s) - 1, int(p / 100.0 * len(s)))]
+
+class SpeechArbiter:
+    def __init__(self, kilosay=KILOSAY, dedupe_sec=DEDUPE_SEC, max_depth=MAX_DEPTH, log=None, observe=None):
+        self.kilosay = kilosay
+        self.observe = observe       # optional observe(name, seconds) timing hook
+        self.dedupe_sec = dedupe_sec
+        self.max_depth = max_depth
+        self.log = log or (lambda msg: print(f"[kilo-speech] {msg}", flush=True))
+        self._cv = threading.Condition()
+        self._heap = []              # (prio, seq, item)
+        self._seq = itertools.count()
+        self._current = None         # item being spoken
+        self._proc = None
+        self._recent = {}            # normalized text -> monotonic time it started playing
+        self._ttfa = collections.deque(maxlen=256)
+        self._closed = False
+        self.counters = {"submitted": 0, "spoken": 0, "preempted": 0, "deduped": 0,
+                         "dropped": 0, "cancelled": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._run, name="kilo-speech", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str, priority: str = "reply"):
+        text = (text or "").strip()
+        if not text:
+            return {"ok": False, "error": "empty text"}
+        prio = PRIORITIES.get(priority)
+        if prio is None:
+            return {"ok": False, "error": f"unknown priority: {priority}"}
+        key, now = _norm(text), time.monotonic()
+        with self._cv:
+            self.counters["submitted"] += 1
+            last = self._recent.get(key)
+            pending = (self._current is not None and self._current["key"] == key) or \
+                any(e[2]["key"] == key for e in self._heap)
+            if pending or (last is not None and now - last < self.dedupe_sec):
+                self.counters["deduped"] += 1
+                return {"ok": True, "deduped": True, "depth": len(self._heap)}
+            item = {"text": text, "key": key, "priority": priority, "prio": prio, "ts": now}
+            heapq.heappush(self._heap, (prio, next(self._seq), item))
+            if len(self._heap) > self.max_depth:
+                worst = max(self._heap)
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                self.counters["dropped"] += 1
+                if worst[2] is item:
+                    return {"ok": False, "queued": False, "error": "queue full", "depth": len(self._heap)}
+            preempted = self._current is not None and prio < self._current["prio"]
+            if preempted:
+                self._stop_current("preempted")
+            self._cv.notify()
+            return {"ok": True, "queued": True, "preempted": preempted, "depth": len(self._heap)}
+
+    def cancel(self, priority: str = "quip"):
+        """Drop queued and playing lines of this priority class or lower."""
+        floor = PRIORITIES[priority]
+        with self._cv:
+            keep = [e for e in self._heap if e[0] < floor]
+            self.counters["cancelled"] += len(self._heap) - len(keep)
+            self._heap = keep
+            heapq.heapify(self._heap)
+            if self._current is not None and self._current["prio"] >= floor:
+                self._stop_current("cancelled")
+
+    def _stop_current(self, why):
+        # Caller holds the lock. kilosay may be a pipeline, so signal its whole group.
+        self._current["stopped"] = why
+        try: os.killpg(self._proc.pid, signal.SIGTERM)
+        except Exception: pass
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._heap and not self._closed:
+                    self._cv.wait()
+                if self._closed:
+                    return
+                _, _, item = heapq.heappop(self._heap)
+                if not (os.path.isfile(self.kilosay) and os.access(self.kilosay, os.X_OK)):
+                    self.counters["failed"] += 1
+                    self.log("warn: kilosay not found/executable; skipping speech")
+                    continue
+                t_spawn = time.monotonic()
+                try:
+                    proc = subprocess.Popen([self.kilosay, item["text"]], stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL, start_new_session=True)
+                except Exception as e:
+                    self.counters["failed"] += 1
+                    self.log(f"warn: kilosay failed: {e}")
+                    continue
+                now = time.monotonic()
+                self._ttfa.append((now - item["ts"]) * 1000.0)
+                if self.observe:
+                    self.observe("speech.spawn", now - t_spawn)
+                    self.observe("speech.ttfa", now - item["ts"])
+                self._current, self._proc = item, proc
+                item["started"] = now
+                self._recent[item["key"]] = now
+                if len(self._recent) > 256:
+                    self._recent = {k: t for k, t in self._recent.items() if now - t < self.dedupe_sec}
+            proc.wait()
+            with self._cv:
+                why = item.get("stopped")
+                self.counters[why if why else "spoken"] += 1
+                if why and self._recent.get(item["key"]) == item["started"]:
+                    del self._recent[item["key"]]   # cut off: saying it again is not a repeat
+                self._current = self._proc = None
+
+    def depth(self):
+        with self._cv:
+            return len(self._heap)
+
+    def stats(self):
+        with self._cv:
+            by_class = collections.Counter(item["priority"] for _, _, item in self._heap)
+            ttfa = list(self._ttfa)
+            return dict(self.counters,
+                        depth=len(self._heap),
+                        depth_by_priority={p: by_class.get(p, 0) for p in PRIORITIES},
+                        speaking=self._current["priority"] if self._current else None,
+                        ttfa_ms={"last": round(ttfa[-1], 1) if ttfa else None,
+                                 "p50": round(_pct(ttfa, 50), 1) if ttfa else None,
+                                 "p95": round(_pct(ttfa, 95), 1) if ttfa else None})
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            self._heap.clear()
+            if self._current is not None:
+                self._stop_current("cancelled")
+            self._cv.notify_all()
+
+def say(text: str, priority: str = "reply", sock_path: str = SOCK, timeout: float = 2.0):
+    """Submit a line to personalityd's speech queue. Returns the daemon's reply dict."""
+    return kilo_state.send_cmd({"cmd": "say", "text": text, "priority": priority}, sock_path, timeout)
+
+def hush(priority: str = "reply", sock_path: str = SOCK, timeout: float = 2.0):
+    """Ask personalityd to drop queued/playing lines of this priority or lower."""
+    return kilo_state.send_cmd({"cmd": "hush", "priority": priority}, sock_path, timeout)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+kilo_state.py — shared-memory view of personalityd's STATE.
+- personalityd (the only writer) publishes every change into a small mmap'd
+  segment, /dev/shm/kilo_state by default (env KILO_STATE_SHM).
+- Layout: 32-byte header <magic "KST1", u64 seq, u32 length, u32 crc32,
+  u32 writer pid> then up to 4 KiB of compact JSON. seq is a seqlock: odd
+  while a write is in progress, bumped to the next even value when done.
+- A state that doesn't fit (a long `say` in last_cmd) is published with
+  long strings cut to MAX_STR chars. If it still doesn't fit, publish()
+  returns False and the segment is marked invalid, so readers fall back to
+  state.json instead of serving the last state that fit.
+- A segment whose writer is gone (personalityd exited or crashed) is stale:
+  close() hides it on a clean exit, and readers check the writer pid at most
+  every PID_CHECK_SEC, then return None so read_state() uses state.json.
+- StateReader checks seq on every call and only copies/decodes the payload
+  when it moved, so polling it costs about a microsecond when idle.
+- state.json (env KILO_STATE_PATH, as for personalityd) stays around as a
+  periodic snapshot for humans and tooling; read_state() falls back to it
+  when the segment is missing or stale.
+- send_cmd()/set_ui() are one-shot socket clients for services that want to
+  change state: they ask personalityd instead of rewriting files.
+"""
+import os, json, mmap, struct, socket, zlib, threading, time
+
+SHM_PATH = os.environ.get("KILO_STATE_SHM", "/dev/shm/kilo_state")
+STATE_JSON = os.environ.get("KILO_STATE_PATH", "/opt/kilo/personality/state.json")
+SOCK = os.environ.get("KILO_SOCK", "/opt/kilo/personality/kilo.sock")
+
+MAGIC = b"KST1"
+HEADER = struct.Struct("<4sQIII")
+PAYLOAD_OFF = 32
+CAPACITY = 4096
+SIZE = PAYLOAD_OFF + CAPACITY
+MAX_STR = 256
+PID_CHECK_SEC = 1.0
+
+def _trim(state: dict) -> dict:
+    """state with long string values shortened, for payloads over CAPACITY."""
+    return {k: (v[:MAX_STR] + "…" if isinstance(v, str) and len(v) > MAX_STR else v) for k, v in state.items()}
+
+class StateSegment:
+    """Writer side. Not safe for several writer processes; personalityd serializes its threads."""
+
+    def __init__(self, path=SHM_PATH):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != SIZE:
+                os.ftruncate(fd, SIZE)
+            self._mm = mmap.mmap(fd, SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        magic, seq, _, _, _ = HEADER.unpack_from(self._mm, 0)
+        # Keep counting from an earlier run so readers never mistake new data for old.
+        self._seq = (seq + 1) & ~1 if magic == MAGIC else 0
+        struct.pack_into("<I", self._mm, 20, os.getpid())
+        self._lock = threading.Lock()
+
+    def publish(self, state: dict) -> bool:
+        data = json.dumps(state, separators=(",", ":")).encode()
+        if len(data) > CAPACITY:
+            data = json.dumps(_trim(state), separators=(",", ":")).encode()
+        if len(data) > CAPACITY:
+            self.invalidate()
+            return False
+        with self._lock:
+            self._seq += 1                                   # odd: write in progress
+            struct.pack_into("<4sQ", self._mm, 0, MAGIC, self._seq)
+            self._mm[PAYLOAD_OFF:PAYLOAD_OFF + len(data)] = data
+            struct.pack_into("<II", self._mm, 12, len(data), zlib.crc32(data))
+            self._seq += 1                                   # even: stable
+            struct.pack_into("<Q", self._mm, 4, self._seq)
+        return True
+
+    def invalidate(self):
+        """Hide the segment from readers (they use state.json) until the next publish()."""
+        with self._lock:
+            self._seq += 2
+            struct.pack_into("<4sQ", self._mm, 0, b"\0" * 4, self._seq)
+
+    def close(self):
+        try:
+            self.invalidate()
+            self._mm.close()
+        except Exception: pass
+
+_now = time.monotonic
+
+def _alive(pid):
+    if not pid:
+        return True          # segment from a writer that didn't record its pid
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class StateReader:
+    def __init__(self, path=SHM_PATH):
+        self.path = path
+        self._mm = None
+        self._seq = None
+        self._state = None
+        self._checked = 0.0
+
+    def _open(self):
+        try:
+            with open(self.path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        except (OSError, ValueError):
+            self._mm = None
+        return self._mm is not None
+
+    def version(self):
+        """Current seq, or None when there is no segment yet."""
+        if self._mm is None and not self._open():
+            return None
+        magic, seq, _, _, _ = HEADER.unpack_from(self._mm, 0)
+        return seq if magic == MAGIC else None
+
+    def writer_alive(self) -> bool:
+        """False once the pid that wrote the segment has gone."""
+        if not _alive(HEADER.unpack_from(self._mm, 0)[4]):
+            return False
+        self._checked = _now()
+        return True
+
+    def changed(self) -> bool:
+        return self.version() != self._seq
+
+    def read(self, retries: int = 8):
+        """Latest state dict (cached until seq moves), or None without a live segment."""
+        for _ in range(retries):
+            seq = self.version()
+            if seq is None:
+                return None
+            if _now() - self._checked >= PID_CHECK_SEC and not self.writer_alive():
+                return None
+            if seq == self._seq:
+                return self._state
+            if seq & 1:
+                continue
+            _, _, length, crc, _ = HEADER.unpack_from(self._mm, 0)
+            data = self._mm[PAYLOAD_OFF:PAYLOAD_OFF + min(length, CAPACITY)]
+            if HEADER.unpack_from(self._mm, 0)[1] != seq or zlib.crc32(data) != crc:
+                continue                                     # torn read; writer was busy
+            try:
+                self._state = json.loads(data)
+            except ValueError:
+                continue
+            self._seq = seq
+            return self._state
+        return self._state
+
+    def close(self):
+        if self._mm is not None:
+            try: self._mm.close()
+            except Exception: pass
+            self._mm = None
+
+_reader = None
+
+def read_state(fallback_path=STATE_JSON) -> dict:
+    """STATE from shared memory, or from the state.json snapshot if the segment is missing or stale."""
+    global _reader
+    if _reader is None:
+        _reader = StateReader()
+    st = _reader.read()
+    if st is not None:
+        return st
+    try:
+        with open(fallback_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def send_cmd(obj: dict, sock_path: str = SOCK, timeout: float = 2.0) -> dict:
+    """One request/reply round trip to personalityd."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(sock_path)
+        s.sendall((json.dumps(obj) + "\n").encode())
+        line = s.makefile("rb").readline()
+        return json.loads(line.decode()) if line else {"ok": False, "error": "no reply"}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    finally:
+        try: s.close()
+        except Exception: pass
+
+def set_ui(eyes=None, sound=None, sock_path: str = SOCK) -> dict:
+    """Ask personalityd to change eyes/sound (no speech)."""
+    obj = {"cmd": "ui"}
+    if eyes: obj["eyes"] = eyes
+    if sound: obj["sound"] = sound
+    return send_cmd(obj, sock_path)
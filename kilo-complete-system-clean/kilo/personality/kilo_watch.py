@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+kilo_watch.py — hot reload for persona.json, people.json, quips.yaml,
+persona_full.yaml and the UI's personality_triggers.json.
+- One background thread per ConfigWatcher. It sleeps on inotify (via libc,
+  no extra deps) for the directories holding the watched files and wakes
+  only for events naming one of them. Every `interval` seconds it also
+  compares (mtime, size, inode) stamps, which covers filesystems and
+  directories inotify can't watch.
+- A changed file is loaded and validated by its loader; only a good result
+  is swapped in (one reference assignment), otherwise the last good value
+  stays and the rejection is logged.
+- Consumers call get(name) and never touch the filesystem on the hot path.
+- Parsed values come from persona.bundle when `kilo-persona compile` built it
+  from the same version of the file; otherwise the file itself is parsed.
+"""
+import os, sys, json, time, struct, select, ctypes, ctypes.util, threading
+import kilo_quips, kilo_persona
+
+BASE = "/opt/kilo/personality"
+TRIGGERS_JSON = "/etc/kilo/personality_triggers.json"
+POLL_SEC = 2.0
+DEBOUNCE_SEC = 0.1
+
+IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_ATTRIB
+_EVENT = struct.Struct("iIII")
+
+# ---- Loaders: parse + validate, raise on anything we shouldn't serve ----
+# Parsing goes through the compiled persona bundle when it is current (kilo_persona).
+def load_json(path):
+    v = kilo_persona.lookup(path)
+    if v is not kilo_persona.MISSING:
+        return v
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_yaml(path):
+    v = kilo_persona.lookup(path)
+    if v is not kilo_persona.MISSING:
+        return v
+    import yaml  # PyYAML assumed present earlier
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def check_persona(d):
+    if not isinstance(d, dict) or not isinstance(d.get("name"), str):
+        raise ValueError("persona.json needs an object with a name")
+    return d
+
+def check_people(d):
+    people = d.get("people") if isinstance(d, dict) else None
+    if not isinstance(people, list) or not all(isinstance(p, dict) and p.get("id") for p in people):
+        raise ValueError("people.json needs a people list of objects with ids")
+    return d
+
+def check_quips(d):
+    if not isinstance(d, dict):
+        raise ValueError("quips.yaml needs a mapping of categories")
+    return kilo_quips.QuipEngine(d)
+
+def check_persona_full(d):
+    if not isinstance(d, dict):
+        raise ValueError("persona_full.yaml needs a mapping")
+    return d
+
+def check_triggers(d):
+    if not isinstance(d, list) or not all(isinstance(t, dict) and isinstance(t.get("pattern"), str)
+                                          and isinstance(t.get("reply"), str) for t in d):
+        raise ValueError("triggers need a list of {pattern, reply}")
+    return d
+
+def load_persona(path): return check_persona(load_json(path))
+def load_people(path): return check_people(load_json(path))
+def load_quips(path): return check_quips(load_yaml(path))
+def load_persona_full(path): return check_persona_full(load_yaml(path))
+def load_triggers(path): return check_triggers(load_json(path))
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+class ConfigWatcher:
+    def __init__(self, interval=POLL_SEC, debounce=DEBOUNCE_SEC, log=None):
+        self.interval = interval
+        self.debounce = debounce
+        self.log = log or (lambda msg: print(f"[kilo-watch] {msg}", file=sys.stderr, flush=True))
+        self._sources = {}
+        self._lock = threading.Lock()   # one reload at a time
+        self._stop = threading.Event()
+        self._thread = None
+        self.inotify = False
+
+    def add(self, name, path, load, default=None, on_change=None):
+        """Register a file and load it now. on_change(name, value) runs after every swap, this one included."""
+        src = {"name": name, "path": path, "load": load, "value": default, "stamp": None,
+               "on_change": on_change, "reloads": 0, "rejects": 0}
+        self._sources[name] = src
+        with self._lock:
+            if not self._reload(src):
+                if src["stamp"] is None:
+                    self.log(f"warn: cannot read {path}; using defaults until it appears")
+                if on_change:
+                    on_change(name, default)
+        return src["value"]
+
+    def get(self, name):
+        return self._sources[name]["value"]
+
+    def check(self):
+        """Reload whatever changed on disk; returns the names that were swapped in."""
+        with self._lock:
+            return [s["name"] for s in list(self._sources.values()) if self._reload(s)]
+
+    def _reload(self, src):
+        stamp = _stamp(src["path"])
+        if stamp == src["stamp"]:
+            return False
+        src["stamp"] = stamp
+        if stamp is None:
+            self.log(f"warn: {src['path']} missing; keeping last good {src['name']}")
+            return False
+        try:
+            value = src["load"](src["path"])
+        except Exception as e:
+            src["rejects"] += 1
+            self.log(f"warn: rejected {src['path']}: {e}")
+            return False
+        src["value"] = value
+        src["reloads"] += 1
+        self.log(f"ok: {src['path']}" + (" (reloaded)" if src["reloads"] > 1 else ""))
+        if src["on_change"]:
+            try: src["on_change"](src["name"], value)
+            except Exception as e: self.log(f"warn: {src['name']} change hook failed: {e}")
+        return True
+
+    def stats(self):
+        return {"inotify": self.inotify,
+                "sources": {n: {"reloads": s["reloads"], "rejects": s["rejects"], "loaded": s["stamp"] is not None}
+                            for n, s in self._sources.items()}}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="kilo-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _inotify_open(self):
+        """inotify fd plus {wd: basenames}; None when inotify is unavailable."""
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except Exception:
+            return None, {}
+        if fd < 0:
+            return None, {}
+        dirs = {}
+        for s in self._sources.values():
+            d, base = os.path.split(os.path.abspath(s["path"]))
+            dirs.setdefault(d, set()).add(base)
+        wds = {}
+        for d, names in dirs.items():
+            wd = libc.inotify_add_watch(fd, d.encode(), _MASK)
+            if wd >= 0:
+                wds[wd] = names
+        if not wds:
+            os.close(fd)
+            return None, {}
+        return fd, wds
+
+    def _relevant(self, buf, wds):
+        off = 0
+        while off + _EVENT.size <= len(buf):
+            wd, _, _, n = _EVENT.unpack_from(buf, off)
+            name = buf[off + _EVENT.size: off + _EVENT.size + n].split(b"\0", 1)[0].decode(errors="ignore")
+            off += _EVENT.size + n
+            if name in wds.get(wd, ()):
+                return True
+        return False
+
+    def _run(self):
+        fd, wds = self._inotify_open()
+        self.inotify = fd is not None
+        last = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if fd is None:
+                    self._stop.wait(self.interval)
+                    self.check()
+                    continue
+                hit = False
+                ready, _, _ = select.select([fd], [], [], self.interval)
+                if ready:
+                    try: buf = os.read(fd, 64 * 1024)
+                    except BlockingIOError: buf = b""
+                    hit = self._relevant(buf, wds)
+                    if hit:
+                        # Let an editor finish its write/rename dance, then drain what it queued.
+                        time.sleep(self.debounce)
+                        try: os.read(fd, 64 * 1024)
+                        except BlockingIOError: pass
+                # Unrelated churn (state.json lives next door) must not starve the stat fallback.
+                if hit or time.monotonic() - last >= self.interval:
+                    self.check()
+                    last = time.monotonic()
+        finally:
+            if fd is not None:
+                os.close(fd)
@@ -2,19 +2,69 @@
 """
 Kilo Personality Daemon (socket + state file + AutoSpeech)
 - UNIX socket: /opt/kilo/personality/kilo.sock
-- State file:  /opt/kilo/personality/state.json
-- Commands: status, demo, sleep, wake, joke, scan, greeting
+  Connections stay open; requests are newline-framed so a client can pipeline
+  many commands on one connection. Replies come back in request order, one
+  JSON object per line. A request without a trailing newline is still answered
+  once the client goes quiet, so old one-shot clients keep working.
+  Send `subscribe [eyes|sound|mode|cmd ...]` (or {"cmd":"subscribe","topics":[...]})
+  to turn a connection into a push stream of state deltas, one JSON line each.
+- Shared memory: every STATE change is published to /dev/shm/kilo_state
+  (kilo_state.StateReader) so readers never parse files on the hot path.
+- State file:  /opt/kilo/personality/state.json (periodic snapshot)
+  Written only when STATE actually changed, coalesced over KILO_STATE_WINDOW
+  seconds (default 2); fsync'd only when the mode changed.
+- Commands: status, demo, sleep, wake, joke, scan, greeting, run <sequence>, stop, say, hush, ui,
+  greet_regular/greet_newcomer (from the face bridges), plus the safety events below
+- Greetings: one token bucket per person (KILO_GREET_PERIOD_SEC, default 60)
+  collapses repeats. Newcomers with no face id or name can't be told apart, so
+  they share one bucket per greeting (KILO_GREET_ANON_SEC, 10) instead; faces arriving within KILO_GREET_MERGE_SEC (0.6) share one
+  group greeting, so a crowd can't flood the speech queue.
+- Sequences: timed eyes/sound/speech steps run on the event loop and can be
+  cancelled at any point (sleep, wake and stop abort a running one). The demo
+  and any extra `offline_mode.sequences` are read from persona_full.yaml.
+- Content files (persona.json, people.json, quips.yaml, persona_full.yaml)
+  are hot-reloaded by kilo_watch when they change and pass validation, and
+  are read from persona.bundle when it is current (kilo_persona). The bundle
+  version is logged at start and returned by `status` as "persona".
 - AutoSpeech: speaks lines via /usr/local/bin/kilosay when enabled.
   Toggle with env KILO_AUTOSPEAK=1|0 (default 1).
+- Journal: every socket request is appended, with its receipt time, client
+  id, peer pid and result, to journal.jsonl next to state.json (a rotating
+  ring, see kilo_journal; env KILO_JOURNAL=<path>|off). `kilo-bench replay`
+  re-drives it against a test daemon.
+- Paths can be moved with env KILO_SOCK, KILO_STATE_PATH, KILO_STATE_SHM,
+  KILO_KILOSAY and KILO_PERSONALITY_DIR (kilo_bench uses these).
+- Metrics: `metrics` returns per-command counts, errors and latency percentiles,
+  socket receipt-to-reply and accept-to-first-reply timings, state write and
+  kilosay spawn timings (`metrics reset` clears them).
+- Speech queue: every line (ours, and `say` from the chat/speak services) goes
+  through one kilo_speech.SpeechArbiter, so lines never overlap.
+- Safety fast lane: near_roll, rollover, estop_engaged, estop_released,
+  critical_battery and low_battery are handled on the socket loop as soon as
+  the line arrives (no worker-thread hop, no queueing behind demo/joke). They
+  abort any sequence, cut reply/quip speech, set eyes + cue in one publish and
+  hold the eyes for KILO_SAFETY_HOLD_SEC (e-stop: until estop_released).
+  Receipt-to-visible time is in `metrics` as safety.visible.
 """
-import os, sys, time, signal, argparse, json, socket, select, errno, subprocess, threading
+import os, sys, time, signal, argparse, json, socket, struct, threading, asyncio, itertools
+import kilo_speech, kilo_metrics, kilo_state, kilo_quips, kilo_watch, kilo_journal, kilo_persona
 
 RUN = True
-SOCK_PATH = "/opt/kilo/personality/kilo.sock"
-STATE_PATH = "/opt/kilo/personality/state.json"
+SOCK_PATH = os.environ.get("KILO_SOCK", "/opt/kilo/personality/kilo.sock")
+STATE_PATH = os.environ.get("KILO_STATE_PATH", "/opt/kilo/personality/state.json")
+JOURNAL_PATH = os.environ.get("KILO_JOURNAL", os.path.join(os.path.dirname(STATE_PATH), "journal.jsonl"))
 HEARTBEAT_SEC = 10
+MAX_LINE = 64 * 1024       # longest request line we accept
+LEGACY_IDLE_SEC = 0.05     # unterminated request is dispatched after this much quiet
+MAX_INFLIGHT = 32          # pipelined requests per connection before we stop reading
+SUB_MAX_BUFFER = 256 * 1024  # unsent bytes a subscriber may lag before we drop it
+STATE_WINDOW = float(os.environ.get("KILO_STATE_WINDOW", "2.0"))  # seconds to coalesce state.json writes
 AUTOSPEAK = (os.environ.get("KILO_AUTOSPEAK","1").lower() in ("1","true","yes","on"))
-KILOSAY = "/usr/local/bin/kilosay"
+KILOSAY = os.environ.get("KILO_KILOSAY", "/usr/local/bin/kilosay")
+
+METRICS = kilo_metrics.Metrics()
+QUIPS = kilo_quips.QuipEngine()  # swapped in from quips.yaml by WATCH; empty means built-in lines
+WATCH = None                     # kilo_watch.ConfigWatcher, created in main()
 
 STATE = {
     "mode": "idle",
@@ -26,120 +76,594 @@ STATE = {
     "updated_ts": None
 }
 
-def _speak_async(text: str):
-    """Fire-and-forget speaking in a thread so we never block the main loop."""
-    if not AUTOSPEAK or not text:
-        return
-    if not os.path.isfile(KILOSAY) or not os.access(KILOSAY, os.X_OK):
-        print("[kilo] warn: kilosay not found/executable; skipping speech", flush=True)
+SPEECH = None  # kilo_speech.SpeechArbiter, created in main()
+
+def _speak_async(text: str, priority: str = "reply"):
+    """Queue a line on the speech arbiter; never blocks the caller."""
+    if not AUTOSPEAK or not text or SPEECH is None:
         return
-    def runner(line: str):
-        try:
-            # Use a short timeout guard by running non-blocking; let audio system handle playback.
-            subprocess.Popen([KILOSAY, line], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except Exception as e:
-            print(f"[kilo] warn: kilosay failed: {e}", flush=True)
-    t = threading.Thread(target=runner, args=(text,), daemon=True)
-    t.start()
+    SPEECH.submit(text, priority)
 
-def write_state():
-    try:
+# ---- State persistence ----
+# Handlers run on worker threads: _STATE_LOCK guards STATE and the dirty flags,
+# _WRITE_LOCK serializes writers of the shared tmp file.
+_STATE_LOCK = threading.Lock()
+_WRITE_LOCK = threading.Lock()
+PERSIST = {"writes": 0, "bytes": 0, "fsyncs": 0, "skipped": 0, "coalesced": 0, "errors": 0, "last_write_ts": None}
+_dirty = False       # STATE changed since the last write
+_dirty_sync = False  # ...and one of those changes was a mode change
+_flush_handle = None
+_last_body = None    # last persisted content, minus updated_ts
+
+def mark_dirty(sync=False):
+    """Note a STATE change; the write happens once the coalescing window closes."""
+    global _dirty, _dirty_sync
+    with _STATE_LOCK:
+        if _dirty:
+            PERSIST["coalesced"] += 1
+        _dirty = True
+        _dirty_sync = _dirty_sync or sync
+    if LOOP is not None:
+        try: LOOP.call_soon_threadsafe(_schedule_flush)
+        except RuntimeError: pass
+
+def _schedule_flush():
+    global _flush_handle
+    if _flush_handle is None:
+        _flush_handle = LOOP.call_later(STATE_WINDOW, _flush_due)
+
+def _flush_due():
+    global _flush_handle
+    _flush_handle = None
+    LOOP.run_in_executor(None, write_state)
+
+def write_state(force=False, sync=False):
+    """Persist STATE if it changed since the last write. Returns True if the file was written."""
+    global _dirty, _dirty_sync, _last_body
+    with _STATE_LOCK:
+        if not (_dirty or force):
+            return False
+        sync = sync or _dirty_sync
+        _dirty = _dirty_sync = False
+        snap = dict(STATE)
+        snap.pop("updated_ts", None)
+        body = json.dumps(snap, sort_keys=True)
+        if body == _last_body and not force:
+            PERSIST["skipped"] += 1
+            return False
         STATE["updated_ts"] = int(time.time())
-        tmp = STATE_PATH + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(STATE, f, indent=2)
-        os.replace(tmp, STATE_PATH)
+        data = (json.dumps(STATE, separators=(",", ":")) + "\n").encode()
+    try:
+        with _WRITE_LOCK, METRICS.timer("state.write"):
+            tmp = STATE_PATH + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, STATE_PATH)
+            if sync:
+                dfd = os.open(os.path.dirname(STATE_PATH) or ".", os.O_RDONLY)
+                try: os.fsync(dfd)
+                finally: os.close(dfd)
+        with _STATE_LOCK:
+            _last_body = body
+            PERSIST["writes"] += 1
+            PERSIST["bytes"] += len(data)
+            PERSIST["fsyncs"] += int(sync)
+            PERSIST["last_write_ts"] = STATE["updated_ts"]
+        return True
     except Exception as e:
+        with _STATE_LOCK:
+            PERSIST["errors"] += 1
+            _dirty = True  # retry on the next flush or heartbeat
+            _dirty_sync = _dirty_sync or sync
         print(f"[kilo] warn: cannot write state.json: {e}", flush=True)
+        return False
+
+def persist_stats():
+    with _STATE_LOCK:
+        return dict(PERSIST, dirty=_dirty, window_sec=STATE_WINDOW)
 
-def _sig_handler(signum, frame):
+STOP = None  # asyncio.Event, created inside the running loop
+
+def _sig_handler(signum, frame=None):
     global RUN
     print(f"[kilo] Caught signal {signum}; shutting down...", flush=True)
     RUN = False
-
-def safe_read(path, kind="text"):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            if kind == "json":
-                json.load(f)
-            else:
-                f.read(512)
-        print(f"[kilo] ok: {path}", flush=True)
-        return True
-    except Exception as e:
-        print(f"[kilo] warn: cannot read {path}: {e}", flush=True)
-        return False
+    if STOP is not None:
+        STOP.set()
 
 def _ok(msg): return {"ok": True, "msg": msg}
 def _err(msg): return {"ok": False, "error": msg}
 
+# ---- State events ----
+# Which subscription topic each STATE key belongs to.
+TOPICS = {"eyes_state": "eyes", "sound_cue": "sound", "mode": "mode", "last_cmd": "cmd", "last_status": "cmd"}
+SUBSCRIBERS = {}   # StreamWriter -> set of topics (None = everything)
+LOOP = None        # event loop that owns SUBSCRIBERS; handlers publish from worker threads
+_EVENT_SEQ = itertools.count(1)
+
+def update_state(_ui=False, **changes):
+    """Apply changes to STATE and push the delta to subscribers.
+    Unchanged keys are skipped, except sound cues: those fire every time they are set.
+    _ui changes (eyes/sound from handlers and sequences) are dropped during a safety hold."""
+    delta = {}
+    with _STATE_LOCK:
+        if _ui and _safety_hold():
+            METRICS.incr("safety.ui_suppressed")
+            return delta
+        for k, v in changes.items():
+            if STATE.get(k) != v or k == "sound_cue":
+                STATE[k] = v
+                delta[k] = v
+        if delta:
+            _publish_shm()
+    if delta:
+        publish(delta)
+        mark_dirty(sync="mode" in delta)
+    return delta
+
+SHM = None  # kilo_state.StateSegment, created in main()
+
+def _publish_shm():
+    # Caller holds _STATE_LOCK, so segment versions follow STATE order.
+    if SHM is None:
+        return
+    try: ok = SHM.publish(STATE)
+    except Exception as e:
+        ok = False
+        print(f"[kilo] warn: shm publish failed: {e}", flush=True)
+        try: SHM.invalidate()
+        except Exception: pass
+    if not ok:
+        # The segment is hidden now; get state.json current so readers don't go stale.
+        METRICS.incr("state.shm_publish_failed")
+        print("[kilo] warn: state did not fit the shm segment; readers use state.json", flush=True)
+        if LOOP is not None:
+            try: LOOP.call_soon_threadsafe(LOOP.run_in_executor, None, write_state, True)
+            except RuntimeError: pass
+
+def publish(delta):
+    if LOOP is None or not SUBSCRIBERS:
+        return
+    ev = {"event": "state", "seq": next(_EVENT_SEQ), "ts": round(time.time(), 3), "delta": delta}
+    try: LOOP.call_soon_threadsafe(_fanout, ev)
+    except RuntimeError: pass  # loop already closed during shutdown
+
+def _fanout(ev):
+    for writer, topics in list(SUBSCRIBERS.items()):
+        delta = ev["delta"]
+        if topics is not None:
+            delta = {k: v for k, v in delta.items() if TOPICS.get(k) in topics}
+            if not delta:
+                continue
+        if writer.is_closing() or writer.transport.get_write_buffer_size() > SUB_MAX_BUFFER:
+            print("[kilo] dropping slow subscriber", flush=True)
+            SUBSCRIBERS.pop(writer, None)
+            try: writer.close()
+            except Exception: pass
+            continue
+        writer.write((json.dumps(dict(ev, delta=delta)) + "\n").encode())
+
+def subscribe(writer, cmd, obj):
+    """Runs on the loop thread when the reply is written, so no event can overtake the ack."""
+    if cmd == "unsubscribe":
+        SUBSCRIBERS.pop(writer, None)
+        return _ok("unsubscribed")
+    topics = obj.get("topics", obj.get("args")) or None
+    if isinstance(topics, str):
+        topics = [topics]
+    if topics is not None:
+        topics = {str(t).strip().lower() for t in topics}
+        unknown = topics - set(TOPICS.values())
+        if unknown:
+            return _err(f"unknown topics: {', '.join(sorted(unknown))}")
+    SUBSCRIBERS[writer] = topics
+    return {"ok": True, "subscribed": sorted(topics) if topics else sorted(set(TOPICS.values())),
+            "state": dict(STATE)}
+
 def set_ui(eyes=None, sound=None):
-    if eyes:  STATE["eyes_state"] = eyes
-    if sound: STATE["sound_cue"]  = sound
-    write_state()
+    changes = {}
+    if eyes:  changes["eyes_state"] = eyes
+    if sound: changes["sound_cue"]  = sound
+    if changes:
+        update_state(_ui=True, **changes)
+
+# ---- Timeline sequencer ----
+DEFAULT_STEP_SEC = 0.2
+
+# Built-in demo; replaced by offline_mode.demo_mode from persona_full.yaml when it loads.
+BUILTIN_SEQUENCES = {
+    "demo": {"mode": "demo", "steps": [
+        {"step": "boot",   "eyes": ["happy"], "sound": ["rev_startup"], "speak": True,  "seconds": DEFAULT_STEP_SEC,
+         "line": "Kilo online. Batteries charged, patience limited."},
+        {"step": "scan",   "eyes": ["focus"], "sound": [],              "speak": False, "seconds": DEFAULT_STEP_SEC,
+         "line": "Scanning my surroundings… no Dodges detected. Life’s good."},
+        {"step": "quip",   "eyes": ["speak"], "sound": [],              "speak": True,  "seconds": DEFAULT_STEP_SEC,
+         "line": "All squared away. Don’t mess it up."},
+        {"step": "dreams", "eyes": ["sleep"], "sound": ["idle_low"],    "speak": False, "seconds": DEFAULT_STEP_SEC,
+         "line": "If you see a Vespa, wake me gently."},
+        {"step": "wake",   "eyes": ["happy"], "sound": ["rev_startup"], "speak": True,  "seconds": DEFAULT_STEP_SEC,
+         "line": "Demo over. I’m still cooler than Barney."},
+    ]},
+}
+SEQUENCES = dict(BUILTIN_SEQUENCES)  # swapped whole on reload; running sequences keep their copy
+_SEQ_TASK = None  # asyncio.Task of the running sequence (loop thread only)
+_SEQ_NAME = None
+
+def _as_list(v):
+    if v is None: return []
+    return [str(x) for x in v] if isinstance(v, (list, tuple)) else [str(v)]
+
+def compile_sequence(spec, mode=None):
+    """persona_full.yaml sequence spec -> runnable steps. eyes/sound may be lists; their
+    entries are spread evenly over the step. Steps without `seconds` share duration_seconds."""
+    raw = [st for st in (spec.get("sequence") or []) if isinstance(st, dict)]
+    total = spec.get("duration_seconds")
+    per = float(total) / len(raw) if total and raw else DEFAULT_STEP_SEC
+    steps = [{
+        "step":    str(st.get("step", i)),
+        "eyes":    _as_list(st.get("eyes")),
+        "sound":   _as_list(st.get("sound")),
+        "line":    st.get("line"),
+        "speak":   bool(st.get("speak", True)),
+        "seconds": max(0.0, float(st.get("seconds", per))),
+    } for i, st in enumerate(raw)]
+    return {"mode": spec.get("mode", mode), "steps": steps}
+
+def sequences_from(doc):
+    """offline_mode.demo_mode and offline_mode.sequences -> {name: compiled}. Raises on malformed specs."""
+    off = doc.get("offline_mode") or {}
+    found = {}
+    if isinstance(off.get("demo_mode"), dict):
+        found["demo"] = compile_sequence(off["demo_mode"], mode="demo")
+    for name, spec in (off.get("sequences") or {}).items():
+        if isinstance(spec, dict):
+            found[str(name).lower()] = compile_sequence(spec)
+    return {k: v for k, v in found.items() if v["steps"]}
+
+def _load_persona_full(path):
+    doc = kilo_watch.load_persona_full(path)
+    return {"doc": doc, "sequences": sequences_from(doc)}
+
+def _on_persona_full(name, value):
+    global SEQUENCES
+    SEQUENCES = {**BUILTIN_SEQUENCES, **((value or {}).get("sequences") or {})}
+    print(f"[kilo] sequences: {', '.join(sorted(SEQUENCES))}", flush=True)
+
+async def _run_sequence(name, seq):
+    global _SEQ_TASK, _SEQ_NAME
+    if seq["mode"]:
+        update_state(mode=seq["mode"])
+    try:
+        for st in seq["steps"]:
+            line = st["line"]
+            print(f"[kilo] SEQ {name} [{st['step']}]: {line or ''}", flush=True)
+            frames = max(len(st["eyes"]), len(st["sound"]), 1)
+            for i in range(frames):
+                set_ui(eyes=st["eyes"][i] if i < len(st["eyes"]) else None,
+                       sound=st["sound"][i] if i < len(st["sound"]) else None)
+                if i == 0 and line and st["speak"]:
+                    _speak_async(line, "quip")
+                await asyncio.sleep(st["seconds"] / frames)
+        if seq["mode"]:
+            update_state(mode="idle")
+        print(f"[kilo] SEQ {name} complete", flush=True)
+    finally:
+        if _SEQ_TASK is asyncio.current_task():
+            _SEQ_TASK = _SEQ_NAME = None
+
+def _start_on_loop(name):
+    global _SEQ_TASK, _SEQ_NAME
+    seq = SEQUENCES.get(name)
+    if seq is None:
+        return None
+    if _safety_hold():
+        raise RuntimeError(f"safety hold ({_SAFETY_EVENT}); not starting {name}")
+    _cancel_on_loop(f"superseded by {name}")
+    _SEQ_NAME = name
+    _SEQ_TASK = LOOP.create_task(_run_sequence(name, seq))
+    return name
+
+def _cancel_on_loop(reason):
+    """Abort the running sequence. Whoever cancels owns the state afterwards."""
+    global _SEQ_TASK, _SEQ_NAME
+    task, name = _SEQ_TASK, _SEQ_NAME
+    _SEQ_TASK = _SEQ_NAME = None
+    if task is None or task.done():
+        return None
+    print(f"[kilo] SEQ {name} aborted ({reason})", flush=True)
+    task.cancel()
+    if SPEECH is not None:
+        SPEECH.cancel("quip")
+    return name
+
+def _on_loop(fn, *args):
+    """Run fn on the event loop and return its result; handlers call this from worker threads."""
+    if LOOP is None:
+        raise RuntimeError("event loop not running")
+    try:
+        if asyncio.get_running_loop() is LOOP:
+            return fn(*args)
+    except RuntimeError:
+        pass
+    async def call():
+        return fn(*args)
+    return asyncio.run_coroutine_threadsafe(call(), LOOP).result(timeout=2.0)
+
+def start_sequence(name): return _on_loop(_start_on_loop, name)
+def cancel_sequence(reason): return _on_loop(_cancel_on_loop, reason)
+
+# ---- Safety fast lane ----
+# event -> (eyes, sound cue, fallback line); lines come from the quips category of the same name.
+SAFETY_EVENTS = {
+    "near_roll":        ("worried", "rev_warning", "Easy. I like my wheels pointing down."),
+    "rollover":         ("worried", "rev_warning", "Rollover. Stopping everything."),
+    "estop_engaged":    ("worried", "rev_warning", "E-stop engaged."),
+    "critical_battery": ("worried", "rev_warning", "Battery critical."),
+    "low_battery":      ("worried", "rev_warning", "Battery low."),
+    "estop_released":   ("focus",   None,          "E-stop released."),
+}
+SAFETY_HOLD_SEC = float(os.environ.get("KILO_SAFETY_HOLD_SEC", "3.0"))
+SAFETY_BUDGET_MS = 5.0     # receipt-to-visible; slower events are counted and logged
+_SAFETY_UNTIL = 0.0        # monotonic; non-safety eyes/sound changes are ignored until then
+_SAFETY_EVENT = None       # event that set the hold
+
+def _safety_hold():
+    return time.monotonic() < _SAFETY_UNTIL
+
+def safety_event(raw, cmd, req=None, t_recv=None):
+    """Loop thread only. Everything visible happens before this returns; speech is queued last."""
+    global _SAFETY_UNTIL, _SAFETY_EVENT
+    t0 = t_recv if t_recv is not None else time.perf_counter()
+    eyes, sound, fallback = SAFETY_EVENTS[cmd]
+    _cancel_on_loop(cmd)
+    if SPEECH is not None:
+        SPEECH.cancel("reply")
+    if cmd == "estop_released":
+        _SAFETY_UNTIL = 0.0
+    elif cmd == "estop_engaged":
+        _SAFETY_UNTIL = float("inf")
+    else:
+        _SAFETY_UNTIL = max(_SAFETY_UNTIL, time.monotonic() + SAFETY_HOLD_SEC)
+    _SAFETY_EVENT = cmd
+    changes = {"eyes_state": eyes, "last_cmd": raw, "last_status": f"{cmd} ok"}
+    if sound:
+        changes["sound_cue"] = sound
+    if STATE["mode"] not in ("idle", "sleep"):
+        changes["mode"] = "idle"   # whatever sequence owned the mode is gone
+    update_state(**changes)
+    visible = time.perf_counter() - t0
+    METRICS.observe("safety.visible", visible)
+    if visible * 1000.0 > SAFETY_BUDGET_MS:
+        METRICS.incr("safety.over_budget")
+        print(f"[kilo] warn: {cmd} took {visible * 1000.0:.1f} ms to become visible", flush=True)
+    line = QUIPS.pick(cmd, _snark(req), fallback)
+    print(f"[kilo] SAFETY {cmd}: {line}", flush=True)
+    _speak_async(line, "safety")
+    return dict(_ok(line), visible_ms=round(visible * 1000.0, 3))
+
 
 # ---- Command handlers ----
-def do_status():
+def do_status(req=None):
     msg = f"mode={STATE['mode']}, last_cmd={STATE['last_cmd']}, status={STATE['last_status']}"
     print(f"[kilo] STATUS: {msg}", flush=True)
     set_ui(eyes="speak", sound=None)
     # No autospeak for status (too chatty)
-    return _ok(msg)
+    return dict(_ok(msg), persist=persist_stats(), sequence=_SEQ_NAME,
+                speech=SPEECH.stats() if SPEECH else None,
+                config=WATCH.stats() if WATCH else None,
+                journal=JOURNAL.stats() if JOURNAL else None,
+                persona=kilo_persona.status(STATE.get("base") or kilo_persona.BASE))
 
-def do_greeting():
-    line = "Kilo Truck—fully loaded with charm and sarcasm."
+def _snark(req):
+    try: return int((req or {}).get("snark_level", kilo_quips.DEFAULT_SNARK))
+    except (TypeError, ValueError): return kilo_quips.DEFAULT_SNARK
+
+def do_greeting(req=None):
+    line = QUIPS.pick("greeting", _snark(req), "Kilo Truck—fully loaded with charm and sarcasm.")
     print(f"[kilo] SAY: {line}", flush=True)
     set_ui(eyes="happy", sound="rev_happy")
     _speak_async(line)
     return _ok(line)
 
-def do_joke():
-    line = "Why don’t Dodges tell jokes? They can’t handle the punchline."
+def do_joke(req=None):
+    line = QUIPS.pick("jokes", _snark(req), "Why don’t Dodges tell jokes? They can’t handle the punchline.")
     print(f"[kilo] JOKE: {line}", flush=True)
     set_ui(eyes="speak", sound=None)
     _speak_async(line)
     return _ok(line)
 
-def do_scan():
-    line = "Scanning. Holler if you see a Vespa before I do."
+def do_scan(req=None):
+    line = QUIPS.pick("scan", _snark(req), "Scanning. Holler if you see a Vespa before I do.")
     print(f"[kilo] SCAN: {line}", flush=True)
     set_ui(eyes="focus", sound=None)
     # No autospeak; keep background actions quiet
     return _ok(line)
 
-def do_sleep():
-    STATE["mode"] = "sleep"
-    line = "Fine, but I’m dreaming of Vespas again."
+def do_sleep(req=None):
+    cancel_sequence("sleep")
+    update_state(mode="sleep")
+    line = QUIPS.pick("sleep", _snark(req), "Fine, but I’m dreaming of Vespas again.")
     print(f"[kilo] SLEEP: {line}", flush=True)
     set_ui(eyes="sleep", sound="idle_low")
     _speak_async(line)
     return _ok(line)
 
-def do_wake():
-    STATE["mode"] = "idle"
-    line = "Up and running. Didn’t even cross my fingers this time."
+def do_wake(req=None):
+    cancel_sequence("wake")
+    update_state(mode="idle")
+    line = QUIPS.pick("boot", _snark(req), "Up and running. Didn’t even cross my fingers this time.")
     print(f"[kilo] WAKE: {line}", flush=True)
     set_ui(eyes="happy", sound="rev_startup")
     _speak_async(line)
     return _ok(line)
 
-def do_demo():
-    STATE["mode"] = "demo"
-    seq = [
-        ("boot",    "Kilo online. Batteries charged, patience limited.", "happy", "rev_startup"),
-        ("scan",    "Scanning my surroundings… no Dodges detected. Life’s good.", "focus", None),
-        ("quip",    "All squared away. Don’t mess it up.", "speak", None),
-        ("dreams",  "If you see a Vespa, wake me gently.", "sleep", "idle_low"),
-        ("wake",    "Demo over. I’m still cooler than Barney.", "happy", "rev_startup"),
-    ]
-    for step, line, eyes, sound in seq:
-        print(f"[kilo] DEMO [{step}]: {line}", flush=True)
-        set_ui(eyes=eyes, sound=sound)
-        if step in ("boot","wake","quip"):  # tasteful speaking, not every step
-            _speak_async(line)
-        time.sleep(0.2)
-    STATE["mode"] = "idle"
-    return _ok("demo complete")
+def do_demo(req=None):
+    start_sequence("demo")
+    return _ok("demo started")
+
+def do_run(req=None):
+    args = (req or {}).get("args") or []
+    name = str((req or {}).get("name") or (args[0] if args else "")).strip().lower()
+    if not start_sequence(name):
+        return _err(f"unknown sequence: {name or '?'} (have: {', '.join(sorted(SEQUENCES))})")
+    return _ok(f"{name} started")
+
+def do_say(req=None):
+    """Speak for another service: {"cmd":"say","text":...,"priority":"safety|reply|quip"}."""
+    req = req or {}
+    text = req.get("text") or " ".join(req.get("args") or [])
+    if SPEECH is None:
+        return _err("speech unavailable")
+    return SPEECH.submit(str(text), str(req.get("priority") or "reply"))
+
+def do_hush(req=None):
+    """Drop queued/playing speech at this priority or lower: {"cmd":"hush","priority":"reply"}.
+    The chat service sends it when a new wake word cuts off the previous answer."""
+    req = req or {}
+    prio = str(req.get("priority") or ((req.get("args") or ["reply"])[0]))
+    if SPEECH is None:
+        return _err("speech unavailable")
+    if prio not in kilo_speech.PRIORITIES or prio == "safety":
+        return _err(f"can't hush priority: {prio}")
+    SPEECH.cancel(prio)
+    return _ok(f"hushed {prio}")
+
+def do_metrics(req=None):
+    if "reset" in ((req or {}).get("args") or []) or (req or {}).get("reset"):
+        METRICS.reset()
+    return {"ok": True, "metrics": METRICS.snapshot()}
+
+def do_ui(req=None):
+    """Eyes/sound change for other services, no speech: {"cmd":"ui","eyes":"speak","sound":null}."""
+    req = req or {}
+    set_ui(eyes=req.get("eyes"), sound=req.get("sound"))
+    return _ok(f"eyes={STATE['eyes_state']} sound={STATE['sound_cue']}")
+
+def do_stop(req=None):
+    name = cancel_sequence("stop")
+    if name and STATE["mode"] != "sleep":
+        update_state(mode="idle")
+    return _ok(f"stopped {name}" if name else "nothing running")
+
+# ---- Greetings ----
+# Face bridges send greet_regular / greet_newcomer per face. Each person gets a token
+# bucket so a face lingering in frame isn't greeted over and over, and greetings that
+# land within GREET_MERGE_SEC of each other become one group line. Anonymous newcomers
+# (no face id, no name) all look alike, so they only draw from a shared bucket when
+# they would open a new merge window; strangers arriving together join it freely.
+GREETINGS = ("greet_regular", "greet_newcomer")
+GREET_PERIOD_SEC = float(os.environ.get("KILO_GREET_PERIOD_SEC", "60"))   # one token per person per period
+GREET_BURST = 1
+GREET_MERGE_SEC = float(os.environ.get("KILO_GREET_MERGE_SEC", "0.6"))
+GREET_ANON_SEC = float(os.environ.get("KILO_GREET_ANON_SEC", "10"))      # one anonymous greeting per period
+_ANON_IDS = itertools.count(1)
+_GREET_BUCKETS = {}    # person key -> [tokens, monotonic of last refill]  (loop thread only)
+_GREET_BATCH = None    # {"people": {key: person}, "fut": Future} while a merge window is open
+
+def _take_token(key, now, period=None):
+    period = GREET_PERIOD_SEC if period is None else period
+    b = _GREET_BUCKETS.get(key)
+    if b is None:
+        if len(_GREET_BUCKETS) > 1024:   # forget people who have long since refilled
+            for k in [k for k, (t, ts) in _GREET_BUCKETS.items() if now - ts > GREET_PERIOD_SEC * GREET_BURST]:
+                del _GREET_BUCKETS[k]
+        b = _GREET_BUCKETS[key] = [float(GREET_BURST), now]
+    b[0] = min(float(GREET_BURST), b[0] + (now - b[1]) / period) if period > 0 else float(GREET_BURST)
+    b[1] = now
+    if b[0] < 1.0:
+        return False
+    b[0] -= 1.0
+    return True
+
+def _greet_person(cmd, req):
+    """Request fields, filled in from people.json (by face_id/id, then name)."""
+    name = str(req.get("name") or "").strip()
+    fid = str(req.get("face_id") or req.get("id") or "").strip()
+    known = None
+    for p in ((WATCH.get("people") if WATCH else None) or {}).get("people") or []:
+        if (fid and p.get("id") == fid) or (name and str(p.get("name", "")).lower() == name.lower()):
+            known = p
+            break
+    known = known or {}
+    regular = cmd == "greet_regular" and bool(name or known.get("name"))
+    return {
+        "key": f"id:{fid}" if fid else (f"name:{name.lower()}" if name else None),   # None: anonymous
+        "regular": regular,
+        "name": name or known.get("name") or "",
+        "vehicle": req.get("vehicle") or req.get("vehicle_brand") or known.get("vehicle_brand"),
+        "snark": _snark({"snark_level": req.get("snark_level", known.get("snark_level", kilo_quips.DEFAULT_SNARK))}),
+        "opt_in": known.get("greet_opt_in", True) is not False,
+    }
+
+def _join_names(names, newcomers):
+    if newcomers:
+        names = names + ["friends" if names else "everybody"]
+    if len(names) <= 1:
+        return "".join(names)
+    return ", ".join(names[:-1]) + " and " + names[-1]
+
+def _greeting_line(people):
+    if len(people) == 1:
+        p = people[0]
+        if p["regular"]:
+            return QUIPS.pick("greet_regular", p["snark"], "Hey {name}.".format(name=p["name"]),
+                              name=p["name"], vehicle_brand=p["vehicle"], vehicle=p["vehicle"])
+        return QUIPS.pick("greet_newcomer", p["snark"], "Hi there. What do you drive?")
+    names = [p["name"] for p in people if p["regular"]]
+    newcomers = len(people) - len(names)
+    snark = min(p["snark"] for p in people)   # a crowd gets the tamest line anyone in it would
+    return QUIPS.pick("greet_group", snark, "Hey " + _join_names(names, newcomers) + ". Quite the crowd.",
+                      names=_join_names(names, newcomers))
+
+def _flush_greetings():
+    global _GREET_BATCH
+    batch, _GREET_BATCH = _GREET_BATCH, None
+    people = list(batch["people"].values())
+    try:
+        line = _greeting_line(people)
+        regular = any(p["regular"] for p in people)
+        kind = "greet_group" if len(people) > 1 else ("greet_regular" if regular else "greet_newcomer")
+        print(f"[kilo] GREET ({len(people)}): {line}", flush=True)
+        set_ui(eyes="happy" if regular else "speak", sound="rev_happy" if regular else None)
+        update_state(last_status=f"{kind} ok")
+        _speak_async(line)
+        METRICS.incr("greet.spoken")
+        METRICS.incr("greet.people", len(people))
+        resp = dict(_ok(line), group=len(people), people=[p["name"] or "newcomer" for p in people])
+    except Exception as e:
+        resp = _err(str(e))
+    if not batch["fut"].done():
+        batch["fut"].set_result(resp)
+
+async def greet(raw, cmd, req):
+    """Loop thread only. Resolves when the merge window this greeting joined is spoken."""
+    global _GREET_BATCH
+    req = req or {}
+    update_state(last_cmd=raw)
+    person = _greet_person(cmd, req)
+    if _safety_hold():
+        return dict(_ok("not now"), suppressed="safety_hold")
+    if not person["opt_in"]:
+        return dict(_ok("not greeting (opted out)"), suppressed="opt_out")
+    if person["key"] is None:
+        person["key"] = f"anon:{next(_ANON_IDS)}"
+        limited = _GREET_BATCH is None and not _take_token("anon", time.monotonic(), GREET_ANON_SEC)
+    else:
+        limited = not _take_token(person["key"], time.monotonic())
+    if limited:
+        METRICS.incr("greet.rate_limited")
+        who = person["name"] or ("a newcomer just now" if person["key"].startswith("anon:") else "newcomer")
+        return dict(_ok(f"already greeted {who}"), suppressed="rate_limited")
+    if _GREET_BATCH is None:
+        _GREET_BATCH = {"people": {}, "fut": LOOP.create_future()}
+        LOOP.call_later(GREET_MERGE_SEC, _flush_greetings)
+    else:
+        METRICS.incr("greet.merged")
+    _GREET_BATCH["people"].setdefault(person["key"], person)
+    return await asyncio.shield(_GREET_BATCH["fut"])
 
 COMMANDS = {
     "status":   do_status,
@@ -149,28 +673,67 @@ COMMANDS = {
     "sleep":    do_sleep,
     "wake":     do_wake,
     "demo":     do_demo,
+    "run":      do_run,
+    "stop":     do_stop,
+    "say":      do_say,
+    "hush":     do_hush,
+    "metrics":  do_metrics,
+    "ui":       do_ui,
 }
 
-def handle_cmd(raw: str):
-    raw = (raw or "").strip()
-    STATE["last_cmd"] = raw
-    if not raw: return _err("empty command")
-    # accept either plain word or tiny JSON {"cmd":"status"}
+def parse_cmd(raw: str):
+    """Accept either a plain word (plus optional args) or tiny JSON {"cmd":"status"}.
+    The face bridges' shapes work too: {"command":...} and {"cmd":..., "params":{...}}."""
     try:
         obj = json.loads(raw)
-        cmd = str(obj.get("cmd","")).strip().lower()
+        if isinstance(obj, dict):
+            params = obj.get("params")
+            if isinstance(params, dict):
+                obj = {**params, **{k: v for k, v in obj.items() if k != "params"}}
+            return str(obj.get("cmd") or obj.get("command") or "").strip().lower(), obj
     except Exception:
-        cmd = raw.split()[0].lower()
+        pass
+    words = raw.split()
+    return (words[0].lower() if words else ""), {"args": words[1:]}
+
+def handle_safety(raw: str, cmd, req, t_recv):
+    """Socket fast lane: runs inline on the loop, ahead of anything queued on worker threads."""
+    try:
+        resp = safety_event(raw, cmd, req, t_recv)
+    except Exception as e:
+        update_state(last_status=f"{cmd} error: {e}")
+        resp = _err(str(e))
+    METRICS.command(cmd, time.perf_counter() - t_recv, bool(resp.get("ok")))
+    return resp
+
+def handle_cmd(raw: str):
+    t0 = time.perf_counter()
+    raw = (raw or "").strip()
+    cmd, req = parse_cmd(raw)
+    resp = _run_cmd(raw, cmd, req)
+    # Unknown names share one row so junk input can't grow the table.
+    known = cmd in COMMANDS or cmd in SAFETY_EVENTS or cmd in GREETINGS
+    METRICS.command(cmd if known else "<unknown>", time.perf_counter() - t0, bool(resp.get("ok")))
+    return resp
+
+def _run_cmd(raw, cmd, req):
+    if cmd in SAFETY_EVENTS:
+        try: return _on_loop(safety_event, raw, cmd, req)   # not via the socket fast lane
+        except Exception as e: return _err(str(e))
+    if cmd in GREETINGS:
+        if LOOP is None: return _err("event loop not running")
+        try: return asyncio.run_coroutine_threadsafe(greet(raw, cmd, req), LOOP).result(timeout=2.0 + GREET_MERGE_SEC)
+        except Exception as e: return _err(str(e))
+    update_state(last_cmd=raw)
+    if not raw: return _err("empty command")
     fn = COMMANDS.get(cmd)
     if not fn: return _err(f"unknown command: {cmd}")
     try:
-        resp = fn()
-        STATE["last_status"] = f"{cmd} ok"
-        write_state()
+        resp = fn(req)
+        update_state(last_status=f"{cmd} ok")
         return resp
     except Exception as e:
-        STATE["last_status"] = f"{cmd} error: {e}"
-        write_state()
+        update_state(last_status=f"{cmd} error: {e}")
         return _err(str(e))
 
 def open_socket():
@@ -180,85 +743,232 @@ def open_socket():
     s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     s.bind(SOCK_PATH)
     os.chmod(SOCK_PATH, 0o666)
-    s.listen(4)
+    s.listen(16)
     s.setblocking(False)
     print(f"[kilo] socket listening at {SOCK_PATH}", flush=True)
     return s
 
-def main():
-    parser = argparse.ArgumentParser(description="Kilo Personality (socket + state + autospeech)")
-    parser.add_argument("--daemon", action="store_true", help="run in daemon mode")
-    args = parser.parse_args()
+# ---- Socket sessions ----
+CLIENTS = set()
+_CLIENT_IDS = itertools.count(1)
+JOURNAL = None     # kilo_journal.Journal, created in main() unless KILO_JOURNAL=off
 
-    signal.signal(signal.SIGTERM, _sig_handler)
-    signal.signal(signal.SIGINT, _sig_handler)
+def _resolved(resp):
+    fut = asyncio.get_running_loop().create_future()
+    fut.set_result(resp)
+    return fut
 
-    base = os.environ.get("KILO_PERSONALITY_DIR", "/opt/kilo/personality")
-    STATE["base"] = base
-    print(f"[kilo] Starting. base={base} daemon={args.daemon} autospeak={AUTOSPEAK}", flush=True)
+async def _timed(cmd, t0, coro):
+    try:
+        resp = await coro
+    except Exception as e:
+        resp = _err(str(e))
+    METRICS.command(cmd, time.perf_counter() - t0, bool(resp.get("ok")))
+    return resp
 
-    # Probe content (non-fatal)
-    safe_read(os.path.join(base, "persona.json"), "json")
-    safe_read(os.path.join(base, "people.json"), "json")
-    safe_read(os.path.join(base, "quips.yaml"), "text")
-    safe_read(os.path.join(base, "persona_full.yaml"), "text")
+async def _dispatch(raw: str):
+    """Run a (blocking) handler on a worker thread so slow commands don't stall other clients."""
+    return await asyncio.to_thread(handle_cmd, raw)
 
-    # Initialize state file
-    write_state()
+async def _reply_writer(writer, pending, accepted, client):
+    """Write replies in request order; keep draining after the peer goes away.
+    Items are (future or loop-side callable, receipt time, raw request or None)."""
+    alive, first = True, True
+    while True:
+        entry = await pending.get()
+        if entry is None:
+            return
+        item, t_recv, raw = entry
+        try:
+            resp = item() if callable(item) else await item
+        except Exception as e:
+            resp = _err(str(e))
+        if JOURNAL is not None and raw is not None:
+            ok = bool(resp.get("ok"))
+            rec = {"t": round(t_recv, 6), "c": client[0], "p": client[1], "req": raw, "ok": ok,
+                   "ms": round((time.perf_counter() - t_recv) * 1000.0, 3)}
+            if not ok:
+                rec["err"] = str(resp.get("error"))[:200]
+            JOURNAL.record(**rec)
+        if not alive:
+            continue
+        try:
+            writer.write((json.dumps(resp) + "\n").encode())
+            await writer.drain()
+        except Exception as e:
+            print(f"[kilo] send error: {e}", flush=True)
+            METRICS.incr("socket.send_errors")
+            alive = False
+            continue
+        now = time.perf_counter()
+        METRICS.observe("socket.request", now - t_recv)
+        if first:
+            METRICS.observe("socket.accept_to_first_reply", now - accepted)
+            first = False
 
-    server = open_socket()
-    clients = []
-    last_beat = 0
+def _peer_pid(writer):
+    try:
+        sock = writer.get_extra_info("socket")
+        return struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))[0]
+    except Exception:
+        return None
+
+async def serve_client(reader, writer):
+    accepted = time.perf_counter()
+    task = asyncio.current_task()
+    CLIENTS.add(task)
+    METRICS.incr("socket.accepted")
+    client = (next(_CLIENT_IDS), _peer_pid(writer))
+    pending = asyncio.Queue(MAX_INFLIGHT)
+    out = asyncio.create_task(_reply_writer(writer, pending, accepted, client))
+    buf = bytearray()
+
+    async def submit(line: bytes):
+        t_recv = time.perf_counter()
+        req = line.decode(errors="ignore").strip()
+        cmd, obj = parse_cmd(req)
+        METRICS.incr("socket.requests")
+        if cmd in SAFETY_EVENTS:
+            METRICS.incr("socket.safety")
+            await pending.put((_resolved(handle_safety(req, cmd, obj, t_recv)), t_recv, req))
+        elif cmd in GREETINGS:
+            # Waits on the merge window on the loop instead of parking a worker thread.
+            await pending.put((asyncio.ensure_future(_timed(cmd, t_recv, greet(req, cmd, obj))), t_recv, req))
+        elif cmd in ("subscribe", "unsubscribe"):
+            await pending.put((lambda: subscribe(writer, cmd, obj), t_recv, req))
+        else:
+            await pending.put((asyncio.ensure_future(_dispatch(req)), t_recv, req))
 
     try:
         while RUN:
-            now = time.time()
-            if now - last_beat >= HEARTBEAT_SEC:
-                print(f"[kilo] heartbeat mode={STATE['mode']} eyes={STATE['eyes_state']} sound={STATE['sound_cue']}", flush=True)
-                last_beat = now
-                write_state()
-
-            rlist = [server] + clients
-            readable, _, _ = select.select(rlist, [], [], 1.0)
-
-            for s in readable:
-                if s is server:
-                    try:
-                        conn, _ = server.accept()
-                        conn.setblocking(False)
-                        clients.append(conn)
-                    except OSError as e:
-                        if getattr(e, "errno", None) != errno.EAGAIN:
-                            print(f"[kilo] accept error: {e}", flush=True)
-                    continue
-
-                try:
-                    data = s.recv(4096)
-                except OSError as e:
-                    print(f"[kilo] recv error: {e}", flush=True)
-                    data = b""
-
-                if not data:
-                    try: s.close()
-                    except Exception: pass
-                    try: clients.remove(s)
-                    except ValueError: pass
-                    continue
-
-                req = data.decode(errors="ignore").strip()
-                resp = handle_cmd(req)
-                payload = (json.dumps(resp) + "\n").encode()
-                try: s.sendall(payload)
-                except Exception as e: print(f"[kilo] send error: {e}", flush=True)
-                for act in (lambda: s.shutdown(socket.SHUT_RDWR), s.close, lambda: clients.remove(s) if s in clients else None):
-                    try: act()
-                    except Exception: pass
+            try:
+                # With a partial line buffered, a short silence means an old one-shot client.
+                chunk = await asyncio.wait_for(reader.read(4096), LEGACY_IDLE_SEC if buf else None)
+            except asyncio.TimeoutError:
+                METRICS.incr("socket.legacy_requests")
+                await submit(bytes(buf)); buf.clear()
+                continue
+            if not chunk:
+                break
+            buf.extend(chunk)
+            while True:
+                nl = buf.find(b"\n")
+                if nl < 0: break
+                line = bytes(buf[:nl]); del buf[:nl + 1]
+                if line.strip():
+                    await submit(line)
+            if len(buf) > MAX_LINE:
+                buf.clear()
+                await pending.put((_resolved(_err("request too long")), time.perf_counter(), None))
+        if buf.strip():
+            await submit(bytes(buf))
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    except Exception as e:
+        print(f"[kilo] recv error: {e}", flush=True)
     finally:
-        try: server.close()
+        await pending.put(None)
+        try: await out
         except Exception: pass
+        SUBSCRIBERS.pop(writer, None)
+        try: writer.close()
+        except Exception: pass
+        CLIENTS.discard(task)
+
+async def heartbeat():
+    while RUN:
+        print(f"[kilo] heartbeat mode={STATE['mode']} eyes={STATE['eyes_state']} sound={STATE['sound_cue']}", flush=True)
+        await asyncio.to_thread(write_state)  # no-op unless a change is still pending
+        try: await asyncio.wait_for(STOP.wait(), HEARTBEAT_SEC)
+        except asyncio.TimeoutError: pass
+
+async def serve():
+    global STOP, LOOP
+    STOP = asyncio.Event()
+    loop = LOOP = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, _sig_handler, sig)
+
+    server = await asyncio.start_unix_server(serve_client, sock=open_socket(), limit=MAX_LINE)
+    beat = asyncio.create_task(heartbeat())
+    try:
+        await STOP.wait()
+    finally:
+        server.close()
+        for t in list(CLIENTS):
+            t.cancel()
+        seq = _SEQ_TASK
+        _cancel_on_loop("shutdown")
+        await asyncio.gather(beat, *CLIENTS, *([seq] if seq else []), return_exceptions=True)
+        if _flush_handle is not None:
+            _flush_handle.cancel()
+        write_state(sync=True)
+        if SPEECH is not None:
+            SPEECH.close()
+        if SHM is not None:
+            SHM.close()
+        if WATCH is not None:
+            WATCH.stop()
+        if JOURNAL is not None:
+            JOURNAL.close()
         try: os.unlink(SOCK_PATH)
         except Exception: pass
         print("[kilo] stopped. goodbye.", flush=True)
 
+def _on_quips(name, engine):
+    global QUIPS
+    QUIPS = engine or kilo_quips.QuipEngine()
+    print(f"[kilo] quips: {', '.join(QUIPS.categories()) or 'built-in lines only'}", flush=True)
+
+def main():
+    global STATE_WINDOW, SPEECH, SHM, WATCH, JOURNAL
+    parser = argparse.ArgumentParser(description="Kilo Personality (socket + state + autospeech)")
+    parser.add_argument("--daemon", action="store_true", help="run in daemon mode")
+    parser.add_argument("--state-window", type=float, default=STATE_WINDOW,
+                        help="seconds to coalesce state.json writes (env KILO_STATE_WINDOW)")
+    args = parser.parse_args()
+    STATE_WINDOW = max(0.0, args.state_window)
+
+    base = os.environ.get("KILO_PERSONALITY_DIR", "/opt/kilo/personality")
+    STATE["base"] = base
+    print(f"[kilo] Starting. base={base} daemon={args.daemon} autospeak={AUTOSPEAK}", flush=True)
+
+    # Load content (non-fatal) and keep it fresh
+    WATCH = kilo_watch.ConfigWatcher(log=lambda msg: print(f"[kilo] {msg}", flush=True))
+    WATCH.add("persona", os.path.join(base, "persona.json"), kilo_watch.load_persona, {})
+    WATCH.add("people", os.path.join(base, "people.json"), kilo_watch.load_people, {"people": []})
+    WATCH.add("quips", os.path.join(base, "quips.yaml"), kilo_watch.load_quips, None, _on_quips)
+    WATCH.add("persona_full", os.path.join(base, "persona_full.yaml"), _load_persona_full, None, _on_persona_full)
+    WATCH.start()
+    pb = kilo_persona.status(base)
+    if pb:
+        print(f"[kilo] persona bundle {pb['version']} (current for {len(pb['current'])}/{len(kilo_persona.SOURCES)} files"
+              + (f"; parsing {', '.join(pb['stale'])}" if pb["stale"] else "") + ")", flush=True)
+    else:
+        print("[kilo] no persona bundle; parsing the source files", flush=True)
+
+    SPEECH = kilo_speech.SpeechArbiter(KILOSAY, log=lambda msg: print(f"[kilo] {msg}", flush=True),
+                                       observe=METRICS.observe)
+
+    try:
+        SHM = kilo_state.StateSegment()
+        with _STATE_LOCK:
+            _publish_shm()
+        print(f"[kilo] state segment at {SHM.path}", flush=True)
+    except Exception as e:
+        print(f"[kilo] warn: no shared-memory state ({e}); readers fall back to state.json", flush=True)
+
+    if JOURNAL_PATH and JOURNAL_PATH.lower() not in ("0", "off", "none"):
+        try:
+            JOURNAL = kilo_journal.Journal(JOURNAL_PATH, log=lambda msg: print(f"[kilo] {msg}", flush=True))
+            print(f"[kilo] journal at {JOURNAL_PATH}", flush=True)
+        except Exception as e:
+            print(f"[kilo] warn: no command journal ({e})", flush=True)
+
+    # Initialize state file
+    write_state(force=True, sync=True)
+
+    asyncio.run(serve())
+
 if __name__ == "__main__":
     sys.exit(main())